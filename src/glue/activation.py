@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import contextlib
+import select
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import psutil  # type: ignore[import-untyped]
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from .pty import Process
+
+__all__ = [
+    "SocketActivator",
+    "bind_listener",
+    "count_connections",
+    "count_unix_connections",
+    "remove_socket_file",
+]
+
+POLL_INTERVAL = 1.0
+# delay before spawning a service that exited on its own again, doubled for
+# every exit in a row that came before the service had been up for the maximum
+CRASH_BACKOFF = 1.0
+MAX_CRASH_BACKOFF = 30.0
+
+
+def bind_listener(address: str) -> socket.socket:
+    """Bind a listening socket for either `tcp://host:port` or a unix socket path."""
+    if address.startswith("tcp://"):
+        host, _, port = address.removeprefix("tcp://").rpartition(":")
+        return socket.create_server((host or "127.0.0.1", int(port)))
+
+    path = Path(address.removeprefix("unix://"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with contextlib.suppress(FileNotFoundError):
+        path.unlink()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(str(path))
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def remove_socket_file(address: str) -> None:
+    """Remove the file of a unix socket bound by `bind_listener`."""
+    with contextlib.suppress(FileNotFoundError):
+        Path(address.removeprefix("unix://")).unlink()
+
+
+def count_unix_connections(path: str, *, recursive: bool = False) -> int | None:
+    """Count the accepted connections of the unix socket at `path`.
+
+    With `recursive`, connections of every socket below the directory `path` are
+    counted instead. Returns None when the platform has no procfs to inspect.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+
+    # Accepted unix sockets share the name of the listener they came from, so any
+    # connected socket (state 03) bound to our path belongs to the service.
+    prefix = f"{path.rstrip('/')}/"
+    count = 0
+    with Path("/proc/net/unix").open() as f:
+        next(f)
+        for line in f:
+            parts = line.split(maxsplit=7)
+            if len(parts) != 8 or parts[5] != "03":
+                continue
+            name = parts[7].rstrip()
+            if name == path or (recursive and name.startswith(prefix)):
+                count += 1
+    return count
+
+
+def _count_tcp_connections(pid: int, port: int) -> int:
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc, *proc.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return 0
+
+    count = 0
+    for p in procs:
+        with contextlib.suppress(psutil.Error):
+            count += sum(
+                1
+                for conn in p.net_connections(kind="tcp")
+                if conn.status == psutil.CONN_ESTABLISHED and conn.laddr.port == port
+            )
+    return count
+
+
+def count_connections(sock: socket.socket, pid: int) -> int | None:
+    """Count the open connections accepted from `sock` by the process `pid`.
+
+    Returns None when the platform does not allow inspecting the connections.
+    """
+    if sock.family == socket.AF_UNIX:
+        return count_unix_connections(sock.getsockname())
+    return _count_tcp_connections(pid, sock.getsockname()[1])
+
+
+class SocketActivator:
+    """Hold a service's listening socket and spawn it on the first connection.
+
+    The socket is handed to the service using the systemd `LISTEN_FDS` protocol.
+    If `idle_timeout` is set, the service is stopped again once it has had no open
+    connections for that many seconds, and the activator goes back to waiting.
+
+    A service that exits on its own leaves the connection that activated it
+    pending, so it is spawned again only after a delay, passed to `on_exit`.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        *,
+        idle_timeout: float | None,
+        on_activate: Callable[[int], Process],
+        on_idle: Callable[[], None],
+        on_exit: Callable[[float], None],
+    ) -> None:
+        self.address = address
+        self.idle_timeout = idle_timeout
+        self.on_activate = on_activate
+        self.on_idle = on_idle
+        self.on_exit = on_exit
+        self.sock = bind_listener(address)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"glue-activator:{address}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.sock.close()
+        if self.sock.family == socket.AF_UNIX:
+            with contextlib.suppress(FileNotFoundError):
+                Path(self.address.removeprefix("unix://")).unlink()
+
+    def _wait_for_connection(self) -> bool:
+        while not self._stopped.is_set():
+            readable, _, _ = select.select([self.sock], [], [], POLL_INTERVAL)
+            if readable:
+                return True
+        return False
+
+    def _wait_for_idle(self, process: Process, pid: int) -> bool:
+        idle_since = time.monotonic()
+        while not self._stopped.wait(POLL_INTERVAL) and process.is_running():
+            if self.idle_timeout is None:
+                continue
+            now = time.monotonic()
+            if count_connections(self.sock, pid) != 0:
+                idle_since = now
+            elif now - idle_since >= self.idle_timeout:
+                return True
+        return False
+
+    def _run(self) -> None:
+        delay = 0.0
+        while self._wait_for_connection():
+            started = time.monotonic()
+            process = self.on_activate(self.sock.fileno())
+            if self._wait_for_idle(process, process.pid):
+                self.on_idle()
+                delay = 0.0
+                continue
+            if self._stopped.is_set():
+                return
+
+            if time.monotonic() - started >= MAX_CRASH_BACKOFF:
+                delay = 0.0
+            delay = min(delay * 2 or CRASH_BACKOFF, MAX_CRASH_BACKOFF)
+            self.on_exit(delay)
+            self._stopped.wait(delay)
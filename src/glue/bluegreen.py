@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import contextlib
+import shutil
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from .activation import count_unix_connections
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from .pty import Process
+    from .utils import Dirs
+
+__all__ = [
+    "other_slot",
+    "reset_slot",
+    "switch_slot",
+    "wait_until_drained",
+    "wait_until_ready",
+]
+
+SLOTS = ("blue", "green")
+POLL_INTERVAL = 0.1
+
+
+def other_slot(slot: str | None) -> str:
+    return SLOTS[1] if slot == SLOTS[0] else SLOTS[0]
+
+
+def reset_slot(dirs: Dirs) -> None:
+    """Clear out the runtime dir of an inactive slot so stale sockets are gone."""
+    with contextlib.suppress(FileNotFoundError):
+        shutil.rmtree(dirs.runtime_dir)
+    dirs.runtime_dir.mkdir(parents=True)
+
+
+def switch_slot(dirs: Dirs, slot: str) -> None:
+    """Atomically point the service's runtime dir at the runtime dir of `slot`.
+
+    Anything resolving `{svc.xdg_run}` (such as the proxy) goes through the link, so
+    new connections reach the new slot while open ones stay with the old process.
+    """
+    link = dirs.with_slot(None).runtime_dir
+    target = dirs.with_slot(slot).runtime_dir
+
+    tmp = link.with_name(f".{link.name}.tmp")
+    with contextlib.suppress(FileNotFoundError):
+        tmp.unlink()
+    tmp.symlink_to(target.name, target_is_directory=True)
+
+    if link.is_dir() and not link.is_symlink():
+        # left over from a run without blue/green restarts
+        shutil.rmtree(link)
+    tmp.replace(link)
+
+
+def _probe(address: str) -> bool:
+    try:
+        if address.startswith("tcp://"):
+            host, _, port = address.removeprefix("tcp://").rpartition(":")
+            socket.create_connection((host or "127.0.0.1", int(port))).close()
+        else:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(address.removeprefix("unix://"))
+    except OSError:
+        return False
+    return True
+
+
+def _find_sockets(runtime_dir: Path) -> list[str]:
+    with contextlib.suppress(FileNotFoundError):
+        return [str(p) for p in runtime_dir.iterdir() if p.is_socket()]
+    return []
+
+
+def wait_until_ready(
+    process: Process,
+    runtime_dir: Path,
+    ready: str | None,
+    timeout: float,
+    *,
+    cancel: threading.Event | None = None,
+) -> bool:
+    """Wait until `ready` (or every socket in `runtime_dir`) accepts connections.
+
+    Gives up early once `cancel` is set.
+    """
+    cancel = cancel or threading.Event()
+    deadline = time.monotonic() + timeout
+    while process.is_running() and time.monotonic() < deadline:
+        addresses = [ready] if ready is not None else _find_sockets(runtime_dir)
+        if addresses and all(_probe(addr) for addr in addresses):
+            return True
+        if cancel.wait(POLL_INTERVAL):
+            break
+    return False
+
+
+def wait_until_drained(
+    runtime_dir: Path, timeout: float, *, cancel: threading.Event | None = None
+) -> None:
+    """Wait until the sockets in `runtime_dir` have no open connections left.
+
+    Gives up early once `cancel` is set.
+    """
+    cancel = cancel or threading.Event()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # a platform without procfs (None) has nothing to wait on
+        if not count_unix_connections(str(runtime_dir), recursive=True):
+            return
+        if cancel.wait(POLL_INTERVAL):
+            return
@@ -3,33 +3,98 @@ import sys
 from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 
 import dotenv
-from starlette.staticfiles import StaticFiles
-from starlette.types import ASGIApp
 from typing_extensions import override
 
 from .compat import tomllib
 from .typecast import typecast
-from .utils import DirResolver
-from .web import ProxyApp
-from .web.clients import ClientsFactory, UnixClientFactory, URLClientFactory
+from .utils import get_reload_dirs
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from starlette.types import ASGIApp
+
+    from .utils import DirResolver
+    from .web.clients import ClientsFactory
+
+
+@dataclass(kw_only=True)
+class FaultConfig:
+    # toggled by this name from the TUI
+    name: str
+    enabled: bool = True
+    # only requests whose path starts with this
+    path: str = "/"
+    # delay before forwarding: `latency` seconds plus a random delay averaging
+    # `jitter` seconds, from a uniform, normal or exponential distribution
+    latency: float = 0
+    jitter: float = 0
+    distribution: str = "uniform"
+    # bytes per second sent to the client
+    bandwidth: Optional[int] = None
+    # percentage of requests answered with `status` instead of being forwarded
+    error_rate: float = 0
+    status: int = 503
+    # percentage of connections closed before the response is complete
+    drop_rate: float = 0
+
+
+@dataclass(kw_only=True)
+class WebSocketConfig:
+    # messages buffered in each direction before the sending side has to wait
+    max_queue: int = 32
+    # compress messages to the service too, when the browser compresses its side;
+    # otherwise they cross the local socket uncompressed and are only compressed once
+    compression: bool = False
+
+
+@dataclass(kw_only=True)
+class WarmupConfig:
+    # the most requested GET paths fetched again once a service restarted
+    paths: int = 20
+    # requests in flight at once while warming up
+    concurrency: int = 4
+    # distinct paths counted by the proxy, the least requested are forgotten
+    max_paths: int = 256
+    # seconds to wait for the service to come up and answer
+    timeout: float = 60
 
 
 class BaseServerConfig(abc.ABC):
+    # routes import the web stack themselves, so only the proxy process loads it
     @abc.abstractmethod
-    def create_route(self, dirs: DirResolver) -> ASGIApp:
+    def create_route(self, dirs: "DirResolver") -> "ASGIApp":
         raise NotImplementedError
 
 
+@dataclass(kw_only=True)
 class BaseProxyPassServer(BaseServerConfig):
+    # httpx, or h11 for a leaner client that keeps connections alive
+    engine: str = "httpx"
+    # write the traffic to the state dir, to be replayed with glue-replay
+    record: bool = False
+    # keep the Authorization and Cookie headers in recordings, instead of redacting
+    record_credentials: bool = False
+    faults: list[FaultConfig] = field(default_factory=list)
+    websocket: WebSocketConfig = field(default_factory=WebSocketConfig)
+    # replay the hottest paths after the service behind this server restarts
+    warmup: Optional[WarmupConfig] = None
+
     @override
-    def create_route(self, dirs: DirResolver) -> ASGIApp:
-        return ProxyApp(self.create_client_factory(dirs))
+    def create_route(self, dirs: "DirResolver") -> "ASGIApp":
+        from .web import ProxyApp
+
+        return ProxyApp(
+            self.create_client_factory(dirs),
+            engine=self.engine,
+            websocket=self.websocket,
+        )
 
     @abc.abstractmethod
-    def create_client_factory(self, dirs: DirResolver) -> ClientsFactory:
+    def create_client_factory(self, dirs: "DirResolver") -> "ClientsFactory":
         raise NotImplementedError
 
 
@@ -38,7 +103,9 @@ class UnixDomainSocketServer(BaseProxyPassServer):
     uds: str
 
     @override
-    def create_client_factory(self, dirs: DirResolver) -> ClientsFactory:
+    def create_client_factory(self, dirs: "DirResolver") -> "ClientsFactory":
+        from .web.clients import UnixClientFactory
+
         return UnixClientFactory(self.uds, dirs)
 
 
@@ -46,8 +113,15 @@ class UnixDomainSocketServer(BaseProxyPassServer):
 class LocalAddressServer(BaseProxyPassServer):
     target: str
 
+    def __post_init__(self) -> None:
+        if self.engine == "h11" and not self.target.startswith("http://"):
+            msg = f"The h11 engine only supports http:// targets, not {self.target!r}"
+            raise ValueError(msg)
+
     @override
-    def create_client_factory(self, dirs: DirResolver) -> ClientsFactory:
+    def create_client_factory(self, dirs: "DirResolver") -> "ClientsFactory":
+        from .web.clients import URLClientFactory
+
         return URLClientFactory(self.target, dirs)
 
 
@@ -56,19 +130,109 @@ class StaticServer(BaseServerConfig):
     root_path: str
 
     @override
-    def create_route(self, dirs: DirResolver) -> ASGIApp:
+    def create_route(self, dirs: "DirResolver") -> "ASGIApp":
+        from starlette.staticfiles import StaticFiles
+
         return StaticFiles(directory=self.root_path, html=True)
 
 
+@dataclass(kw_only=True)
+class StreamServer:
+    # `tcp://host:port` or a unix socket path, like a service's `listen`
+    listen: str
+    target: str
+
+
 ServerConfig = Union[UnixDomainSocketServer, LocalAddressServer, StaticServer]
 
 
+@dataclass(kw_only=True)
+class AgentConfig:
+    # `tcp://host:port` or a unix socket path the agent was started with
+    address: str
+    # the agent's --token, such as {env[GLUE_AGENT_TOKEN]}
+    token: Optional[str] = None
+
+
+@dataclass(kw_only=True)
+class WatchConfig:
+    # paths and globs are relative to the service's cwd
+    paths: list[str] = field(default_factory=lambda: ["."])
+    include: list[str] = field(default_factory=list)
+    ignore: list[str] = field(default_factory=list)
+    debounce: float = 0.5
+
+
+@dataclass(kw_only=True)
+class LogConfig:
+    # output is kept under the service's state dir
+    enabled: bool = True
+    # start a new file once the current one is this large or this many seconds old
+    max_bytes: int = 10 * 1024 * 1024
+    max_age: Optional[float] = None
+    # older files are deleted once all of them take up more than this
+    retention: int = 100 * 1024 * 1024
+    # gzip, zstd (requires the zstandard package) or none
+    compression: str = "gzip"
+
+
+@dataclass(kw_only=True)
+class LogParserConfig:
+    # json or logfmt; lines in neither are not indexed
+    format: str = "json"
+    # keys each field is read from, the first one present wins
+    level: list[str] = field(
+        default_factory=lambda: ["level", "lvl", "severity", "levelname"]
+    )
+    time: list[str] = field(
+        default_factory=lambda: ["time", "ts", "timestamp", "@timestamp"]
+    )
+    request_id: list[str] = field(
+        default_factory=lambda: ["request_id", "req_id", "requestId", "trace_id"]
+    )
+    # in milliseconds
+    latency: list[str] = field(
+        default_factory=lambda: ["latency_ms", "duration_ms", "elapsed_ms"]
+    )
+    # the oldest lines are dropped from the index beyond this many
+    max_lines: int = 100_000
+
+
 @dataclass(kw_only=True)
 class BaseServiceConfig:
     name: str
     cwd: str = "."
     env: dict[str, Optional[str]] = field(default_factory=dict)
     env_file: Optional[str] = None
+    # pre-bound socket passed via LISTEN_FDS; the service is spawned on first connect
+    listen: Optional[str] = None
+    idle_timeout: Optional[float] = None
+    # start the new instance next to the old one on restart, then switch over
+    blue_green: bool = False
+    ready: Optional[str] = None
+    ready_timeout: float = 60
+    drain_timeout: float = 30
+    # pick a free tcp port at startup, available as `{port}`, `{<service>.port}`
+    # and the PORT environment variable of the service
+    allocate_port: bool = False
+    # restart the service when files change
+    watch: Optional[WatchConfig] = None
+    log: LogConfig = field(default_factory=LogConfig)
+    # index the fields of structured log lines for `glue-ctl query`
+    parser: Optional[LogParserConfig] = None
+    # run the service on one of the config's agents instead of this machine
+    agent: Optional[str] = None
+    # addresses an agent's service listens on, relayed to the same address here;
+    # `listen` is always relayed
+    forward: list[str] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        # `ready = ""` means no probe address, like leaving it out
+        self.ready = self.ready or None
+
+    def relayed_addresses(self) -> list[str]:
+        """List the addresses to relay from the service's agent."""
+        return [self.listen, *self.forward] if self.listen else list(self.forward)
 
     def read_env_file(self) -> dict[str, Optional[str]]:
         env = {}
@@ -82,11 +246,31 @@ class BaseServiceConfig:
         return OrderedDict(dotenv.main.resolve_variables(env.items(), override=True))
 
 
+@dataclass(kw_only=True)
+class ZygoteConfig:
+    # imported once by the zygote; list dependencies only, since forks would run
+    # the service's own modules as they were when the zygote started
+    preload: list[str] = field(default_factory=list)
+    # the zygote is started over when these files, relative to the service's
+    # cwd, or the interpreter's site-packages change
+    lockfiles: list[str] = field(
+        default_factory=lambda: [
+            "uv.lock",
+            "poetry.lock",
+            "pdm.lock",
+            "Pipfile.lock",
+            "requirements.txt",
+        ]
+    )
+
+
 @dataclass(kw_only=True)
 class PythonServiceConfig(BaseServiceConfig):
     python: str
     module: str
     args: list[str] = field(default_factory=list)
+    # fork restarts from an interpreter that has already imported `preload`
+    zygote: Optional[ZygoteConfig] = None
 
     def resolve_command(self) -> list[str]:
         return [self.python, "-m", self.module, *self.args]
@@ -104,33 +288,138 @@ class ScriptServiceConfig(BaseServiceConfig):
 ServiceConfig = Union[PythonServiceConfig, ScriptServiceConfig]
 
 
+@dataclass(kw_only=True)
+class InProcessProxyConfig(PythonServiceConfig):
+    """The `:root:` service when the proxy runs on a thread of the glue process.
+
+    It is never read from a config file. The command it inherits is how the same
+    proxy runs as a separate process.
+    """
+
+    host: str
+    port: int
+
+
+@dataclass(kw_only=True)
+class ConfigDiff:
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    # servers are keyed by host; the default server is keyed by an empty string
+    servers: list[str] = field(default_factory=list)
+    streams: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.added or self.removed or self.changed or self.servers or self.streams
+        )
+
+
+def _diff_keys(
+    old: "Mapping[str, object]", new: "Mapping[str, object]"
+) -> tuple[list[str], ...]:
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = [k for k in new if k in old and old[k] != new[k]]
+    return added, removed, changed
+
+
 @dataclass(kw_only=True)
 class Config:
     default_server: Optional[ServerConfig] = None
     servers: dict[str, ServerConfig] = field(default_factory=dict)
+    streams: dict[str, StreamServer] = field(default_factory=dict)
+    agents: dict[str, AgentConfig] = field(default_factory=dict)
     services: list[ServiceConfig] = field(default_factory=list)
 
     def insert_root_service(
-        self, config_path: Path, *, host: str, port: int, reload: bool
+        self,
+        config_path: Path,
+        *,
+        host: str,
+        port: int,
+        reload: bool,
+        in_process: bool = False,
     ) -> None:
         for svc in self.services:
             if svc.name == ":root:":
                 return
 
-        root_service = PythonServiceConfig(
-            name=":root:",
-            python=sys.executable,
-            module="glue.web.main",
-            args=[
-                str(config_path),
-                "--host",
-                host,
-                "--port",
-                str(port),
-                *(["--reload"] if reload else []),
+        args = [str(config_path), "--host", host, "--port", str(port)]
+        root_service: PythonServiceConfig
+        if in_process:
+            # code changes can only be picked up by restarting glue itself
+            root_service = InProcessProxyConfig(
+                name=":root:",
+                python=sys.executable,
+                module="glue.web.main",
+                args=args,
+                host=host,
+                port=port,
+            )
+        else:
+            root_service = PythonServiceConfig(
+                name=":root:",
+                python=sys.executable,
+                module="glue.web.main",
+                args=args,
+                # reloads go through glue's own watcher instead of uvicorn's, and
+                # the proxy picks up changes to the config file by itself
+                watch=self._reload_watch() if reload else None,
+            )
+        self.services.insert(0, root_service)
+
+    def _reload_watch(self) -> WatchConfig:
+        """Watch glue's own code, like uvicorn's reloader did, but not services."""
+        paths = get_reload_dirs()
+        ignore = []
+        for svc in self.services:
+            if svc.cwd == ".":
+                continue
+            cwd = Path(svc.cwd).resolve()
+            for path in paths:
+                root = Path(path).resolve()
+                if cwd.is_relative_to(root):
+                    ignore.append(f"{cwd.relative_to(root).as_posix()}/*")
+        return WatchConfig(paths=paths, include=["*.py"], ignore=ignore)
+
+    def diff(self, new: "Config") -> ConfigDiff:
+        """Compare the services, servers and streams of two configs by name."""
+        old_services = {svc.name: svc for svc in self.services}
+        new_services = {svc.name: svc for svc in new.services}
+        added, removed, changed = _diff_keys(old_services, new_services)
+        agents = {
+            name for names in _diff_keys(self.agents, new.agents) for name in names
+        }
+        changed += [
+            name
+            for name, svc in new_services.items()
+            if svc.agent in agents and name in old_services and name not in changed
+        ]
+        # a service that moves to another machine stops on one and starts on the other
+        moved = [
+            name
+            for name in changed
+            if old_services[name].agent != new_services[name].agent
+        ]
+        changed = [name for name in changed if name not in moved]
+        added += moved
+        removed += moved
+        servers = _diff_keys(
+            {"": self.default_server, **self.servers},
+            {"": new.default_server, **new.servers},
+        )
+        return ConfigDiff(
+            added=added,
+            removed=removed,
+            changed=changed,
+            servers=[name for names in servers for name in names],
+            streams=[
+                name
+                for names in _diff_keys(self.streams, new.streams)
+                for name in names
             ],
         )
-        self.services.insert(0, root_service)
 
 
 def load_config(path: Path) -> Config:
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .client import ControlClient
+from .protocol import ControlError
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from glue.utils import Dirs
+
+__all__ = ["ControlClient", "ControlError", "socket_path"]
+
+
+def socket_path(dirs: Dirs) -> Path:
+    return dirs.runtime_dir / "control.sock"
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import ipaddress
+import signal
+import socket
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import click
+from click.exceptions import Exit
+from rich.console import Console
+
+from glue.activation import bind_listener, remove_socket_file
+from glue.config import Config, load_config
+from glue.pm import ServiceManager
+from glue.streams import open_connection
+from glue.typecast import TypeCastError
+from glue.utils import Dirs
+
+from . import socket_path
+from .mux import Channel, Mux, relay
+from .protocol import ControlError, decode, encode
+from .server import ControlServer
+
+if TYPE_CHECKING:
+    from asyncio import StreamReader, StreamWriter
+
+__all__ = [
+    "Agent",
+    "agent_config",
+    "agent_dirs",
+    "is_loopback",
+    "main",
+    "run_agent",
+]
+
+err = Console(stderr=True)
+
+# how long a coordinator has to introduce itself
+HELLO_TIMEOUT = 10
+
+
+def agent_dirs(config_path: Path, name: str) -> Dirs:
+    # agents that share a machine with each other or the coordinator keep apart
+    dirs = Dirs.from_path(config_path)
+    return replace(dirs, subdir=f"{dirs.subdir}@{name}")
+
+
+def agent_config(config: Config, name: str) -> Config:
+    """Keep the services of `config` that run on the agent `name`, as local ones."""
+    return Config(
+        services=[
+            replace(svc, agent=None) for svc in config.services if svc.agent == name
+        ]
+    )
+
+
+class Agent:
+    """Runs services on this machine on behalf of a coordinator.
+
+    Coordinators connect to `address`, send the agent's token, and then open
+    channels over a `Mux`: `control` channels speak the same protocol as the
+    control socket of a headless glue, and `connect` channels are relayed to one
+    of the `listen` or `forward` addresses of a service in this machine's config,
+    resolved with the variables of this machine. The services keep running when
+    a coordinator disconnects.
+    """
+
+    def __init__(
+        self, mgr: ServiceManager, address: str, *, token: str | None = None
+    ) -> None:
+        self.mgr = mgr
+        self.address = address
+        self.token = token
+        # glue-ctl on this machine talks to the agent like to a headless glue
+        self.control = ControlServer(mgr, socket_path(mgr.dirs))
+        self._muxes: set[Mux] = set()
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        sock = bind_listener(self.address)
+        if sock.family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self.handle, sock=sock)
+        else:
+            server = await asyncio.start_server(self.handle, sock=sock)
+        try:
+            async with server:
+                control = asyncio.create_task(self.control.serve(stop))
+                await stop.wait()
+                for mux in list(self._muxes):
+                    await mux.close()
+                await control
+        finally:
+            if sock.family == socket.AF_UNIX:
+                remove_socket_file(self.address)
+
+    async def _hello(self, reader: StreamReader, writer: StreamWriter) -> bool:
+        try:
+            line = await asyncio.wait_for(reader.readline(), HELLO_TIMEOUT)
+            hello = decode(line)
+        except (asyncio.TimeoutError, ControlError):
+            return False
+        token = hello.get("token") or ""
+        if self.token and not hmac.compare_digest(str(token), self.token):
+            writer.write(encode({"error": "Invalid token"}))
+            await writer.drain()
+            return False
+        writer.write(encode({"ok": True}))
+        await writer.drain()
+        return True
+
+    async def handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            if not await self._hello(reader, writer):
+                writer.close()
+                return
+        except ConnectionError:
+            writer.close()
+            return
+
+        mux = Mux(reader, writer, initiator=False, on_open=self.open_channel)
+        self._muxes.add(mux)
+        try:
+            await mux.run()
+        finally:
+            self._muxes.discard(mux)
+            await mux.close()
+
+    async def open_channel(self, channel: Channel, params: dict[str, Any]) -> None:
+        kind = params.get("type")
+        if kind == "control":
+            await self.control.handle(channel, channel)  # type: ignore[arg-type]
+        elif kind == "connect":
+            await self._connect(channel, params["service"], params["address"])
+
+    async def _connect(self, channel: Channel, name: str, address: str) -> None:
+        svc = self.mgr.services.get(name)
+        # only the addresses this machine's config relays, so coordinators cannot
+        # reach anything else, nor have templates of their own resolved here
+        if svc is None or address not in svc.config.relayed_addresses():
+            return
+        try:
+            sock = await open_connection(svc.dirs.resolve_vars(address))
+        except OSError:
+            return  # closing the channel resets the coordinator's connection
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await relay(channel, reader, writer)
+
+
+async def _serve(agent: Agent) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await agent.serve(stop)
+
+
+def is_loopback(address: str) -> bool:
+    """Whether only this machine can reach `address`, such as a unix socket."""
+    if not address.startswith("tcp://"):
+        return True
+    host = address.removeprefix("tcp://").rpartition(":")[0].strip("[]")
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def run_agent(mgr: ServiceManager, address: str, *, token: str | None) -> None:
+    """Serve coordinators until interrupted, then stop every service."""
+    try:
+        mgr.start_watcher()
+        err.print(f"Agent listening on {address}")
+        asyncio.run(_serve(Agent(mgr, address, token=token)))
+    finally:
+        mgr.shutdown()
+
+
+@click.command()
+@click.argument("config_path", type=Path)
+@click.option(
+    "--name", required=True, help="Run the services with this `agent` in the config."
+)
+@click.option(
+    "--listen",
+    default="tcp://127.0.0.1:7700",
+    show_default=True,
+    help="tcp://host:port or a unix socket path to accept coordinators on.",
+)
+@click.option(
+    "--token",
+    envvar="GLUE_AGENT_TOKEN",
+    default=None,
+    help="Only accept coordinators that send this token; required unless "
+    "--listen is a loopback address or a unix socket.",
+)
+def main(config_path: Path, *, name: str, listen: str, token: str | None) -> None:
+    """Run services of a glue config for a coordinator on another machine."""
+    if token is None and not is_loopback(listen):
+        err.print(
+            f"Refusing to accept coordinators on {listen} without a token, "
+            "set --token or GLUE_AGENT_TOKEN"
+        )
+        raise Exit(1)
+
+    def load() -> Config:
+        return agent_config(load_config(config_path), name)
+
+    try:
+        config = load()
+    except TypeCastError as e:
+        err.print(e)
+        raise Exit(1) from None
+
+    mgr = ServiceManager(agent_dirs(config_path, name), config)
+    mgr.watch_config(config_path, load)
+    run_agent(mgr, listen, token=token)
+
+
+if __name__ == "__main__":
+    main()
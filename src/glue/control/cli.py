@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+import click
+from click.exceptions import Exit
+from rich.console import Console
+from rich.table import Table
+
+from glue.utils import Dirs
+
+from . import ControlClient, ControlError, socket_path
+
+out = Console()
+err = Console(stderr=True)
+
+
+@click.group()
+@click.argument("config_path", type=Path)
+@click.pass_context
+def main(ctx: click.Context, config_path: Path) -> None:
+    """Control a glue instance started with `glue --headless`."""
+    path = socket_path(Dirs.from_path(config_path))
+    try:
+        ctx.obj = ctx.with_resource(ControlClient(path))
+    except OSError:
+        err.print(f"No glue daemon is listening on {path}")
+        raise Exit(1) from None
+
+
+def call(ctx: click.Context, method: str, **params: Any) -> Any:
+    client: ControlClient = ctx.obj
+    try:
+        return client.call(method, **params)
+    except ControlError as e:
+        err.print(e.message)
+        raise Exit(1) from None
+
+
+@main.command()
+@click.pass_context
+def status(ctx: click.Context) -> None:
+    table = Table("Service", "Status", "PID")
+    for svc in call(ctx, "status"):
+        table.add_row(svc["name"], svc["status"], str(svc["pid"] or ""))
+    out.print(table)
+
+
+@main.command()
+@click.argument("name")
+@click.pass_context
+def start(ctx: click.Context, name: str) -> None:
+    call(ctx, "start", name=name)
+
+
+@main.command()
+@click.argument("name")
+@click.pass_context
+def stop(ctx: click.Context, name: str) -> None:
+    call(ctx, "stop", name=name)
+
+
+@main.command()
+@click.argument("name")
+@click.pass_context
+def restart(ctx: click.Context, name: str) -> None:
+    call(ctx, "restart", name=name)
+
+
+@main.command()
+@click.argument("name")
+@click.option("-n", "--lines", type=int, default=None)
+@click.option("-f", "--follow", type=bool, is_flag=True)
+@click.pass_context
+def logs(ctx: click.Context, name: str, *, lines: int | None, follow: bool) -> None:
+    if not follow:
+        sys.stdout.write(call(ctx, "logs", name=name, tail=lines))
+        return
+
+    client: ControlClient = ctx.obj
+    try:
+        stream = client.follow_logs(name, tail=lines)
+    except ControlError as e:
+        err.print(e.message)
+        raise Exit(1) from None
+
+    try:
+        for params in stream:
+            if "data" in params:
+                sys.stdout.write(params["data"])
+                sys.stdout.flush()
+            elif "lagged" in params:
+                err.print(f"[{params['lagged']} bytes skipped]")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.close()
+
+
+@main.command()
+@click.option("-s", "--service", "services", multiple=True)
+@click.option("-l", "--level", default="", help="Only lines at this level or above.")
+@click.option("-r", "--request-id", default=None)
+@click.option("--since", type=float, default=None, help="Only the last N seconds.")
+@click.option("-n", "--lines", type=int, default=None)
+@click.pass_context
+def query(
+    ctx: click.Context,
+    services: tuple[str, ...],
+    *,
+    level: str,
+    request_id: str | None,
+    since: float | None,
+    lines: int | None,
+) -> None:
+    """Search the indexed log lines of services with a `parser`."""
+    for line in call(
+        ctx,
+        "query",
+        services=list(services) or None,
+        level=level,
+        request_id=request_id,
+        since=since,
+        limit=lines,
+    ):
+        sys.stdout.write(f"{line['service']}: {line['line']}\n")
+
+
+@main.command()
+@click.option("-s", "--service", "services", multiple=True)
+@click.option("-p", "--percentile", type=float, default=99, show_default=True)
+@click.option("--since", type=float, default=None, help="Only the last N seconds.")
+@click.pass_context
+def latency(
+    ctx: click.Context,
+    services: tuple[str, ...],
+    *,
+    percentile: float,
+    since: float | None,
+) -> None:
+    """Show a percentile of the latencies that services logged."""
+    result = call(
+        ctx,
+        "latency",
+        services=list(services) or None,
+        percentile=percentile,
+        since=since,
+    )
+    table = Table("Service", "Lines", f"p{percentile:g} (ms)")
+    for name, row in result["services"].items():
+        value = row["value"]
+        table.add_row(name, str(row["count"]), "" if value is None else f"{value:g}")
+    value = result["value"]
+    table.add_row("all", str(result["count"]), "" if value is None else f"{value:g}")
+    out.print(table)
+
+
+@main.command()
+@click.pass_context
+def metrics(ctx: click.Context) -> None:
+    out.print_json(json.dumps(call(ctx, "metrics")))
+
+
+if __name__ == "__main__":
+    main()
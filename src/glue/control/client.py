@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import contextlib
+import itertools
+import socket
+import threading
+from typing import TYPE_CHECKING, Any
+
+from .protocol import ControlError, decode, encode, request
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+__all__ = ["ControlClient", "LogStream"]
+
+
+class ControlClient:
+    """Blocking client for the control socket of a headless glue daemon."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sock = self._connect()
+        self._file = self._sock.makefile("rwb")
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> ControlClient:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    @staticmethod
+    def result(msg: dict[str, Any]) -> Any:
+        if "error" in msg:
+            raise ControlError(msg["error"]["code"], msg["error"]["message"])
+        return msg.get("result")
+
+    def call(self, method: str, **params: Any) -> Any:
+        with self._lock:
+            self._file.write(encode(request(next(self._ids), method, params)))
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            msg = "Connection to the glue daemon was closed"
+            raise ConnectionError(msg)
+        return self.result(decode(line))
+
+    def follow_logs(self, name: str, *, tail: int | None = None) -> LogStream:
+        return LogStream(self._connect(), name, tail=tail)
+
+
+class LogStream:
+    """Iterates over the `log` notifications of a service on its own connection.
+
+    `close` may be called from another thread to stop a blocked iteration.
+    """
+
+    def __init__(self, sock: socket.socket, name: str, *, tail: int | None) -> None:
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+        params = {"name": name, "tail": tail, "follow": True}
+        self._file.write(encode(request(0, "logs", params)))
+        self._file.flush()
+        ControlClient.result(decode(self._file.readline()))
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        with contextlib.suppress(OSError, ValueError):
+            for line in self._file:
+                yield decode(line)["params"]
+
+    def close(self) -> None:
+        with contextlib.suppress(OSError):
+            self._sock.shutdown(socket.SHUT_RDWR)
+        self._sock.close()
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import socket
+import threading
+from typing import TYPE_CHECKING, Any
+
+from glue.activation import bind_listener, remove_socket_file
+from glue.logindex import LogIndex
+from glue.output import OutputBuffer
+from glue.streams import open_connection
+
+from .client import ControlClient
+from .mux import Mux, relay
+from .protocol import ControlError, decode, encode, request
+from .remote import mirror_log
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Coroutine, Mapping
+
+    from glue.config import AgentConfig, ServiceConfig
+    from glue.utils import Dirs, VarResolver
+
+    from .mux import Channel
+
+__all__ = ["AgentLink", "AgentServiceInstance"]
+
+# errors that mean the agent could not be reached or refused a request; calls
+# from other threads time out with the error of concurrent futures
+AGENT_ERRORS = (
+    OSError,
+    ControlError,
+    asyncio.TimeoutError,
+    concurrent.futures.TimeoutError,
+)
+# how long to wait before following logs again once the agent connection dropped
+RECONNECT_INTERVAL = 1.0
+
+
+class AgentLink:
+    """The coordinator's connection to a glue agent.
+
+    Every service on the agent shares one connection, which runs on an event
+    loop thread of its own. It is opened on first use, and opened again by the
+    next call after it dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: AgentConfig,
+        resolver: VarResolver,
+        *,
+        timeout: float = 10,
+    ) -> None:
+        self.name = name
+        self.config = config
+        self.resolver = resolver
+        self.timeout = timeout
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self._mux: Mux | None = None
+        self._runner: asyncio.Task[None] | None = None
+        self._control: Channel | None = None
+        self._lock: asyncio.Lock | None = None
+        self._ids = itertools.count(1)
+
+    def _run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name=f"glue-agent-{self.name}",
+                    daemon=True,
+                )
+                self._thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(self.timeout)
+
+    async def _connect(self) -> Mux:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._mux is not None and self._runner and not self._runner.done():
+                return self._mux
+
+            address = self.resolver.resolve_vars(self.config.address)
+            sock = await open_connection(address)
+            reader, writer = await asyncio.open_connection(sock=sock)
+            token = self.config.token and self.resolver.resolve_vars(self.config.token)
+            writer.write(encode({"agent": self.name, "token": token}))
+            await writer.drain()
+            reply = decode(await reader.readline())
+            if "error" in reply:
+                writer.close()
+                raise ControlError(0, f"Agent {self.name}: {reply['error']}")
+
+            self._mux = mux = Mux(reader, writer, initiator=True)
+            self._runner = asyncio.create_task(mux.run())
+            self._control = await mux.open(type="control")
+            return mux
+
+    async def _call(self, method: str, params: dict[str, Any]) -> Any:
+        await self._connect()
+        assert self._lock is not None
+        async with self._lock:
+            control = self._control
+            assert control is not None
+            control.write(encode(request(next(self._ids), method, params)))
+            await control.drain()
+            line = await control.readline()
+        if not line:
+            msg = f"Connection to agent {self.name} was closed"
+            raise ConnectionError(msg)
+        return ControlClient.result(decode(line))
+
+    def call(self, method: str, **params: Any) -> Any:
+        return self._run(self._call(method, params))
+
+    def follow_logs(
+        self, name: str, on_log: Callable[[dict[str, Any]], None]
+    ) -> Callable[[], None]:
+        """Pass every `log` notification of a service to `on_log`.
+
+        Following resumes once the connection to the agent is back after it
+        dropped. Returns a function that stops following.
+        """
+
+        async def open_stream() -> Channel:
+            mux = await self._connect()
+            channel = await mux.open(type="control")
+            params = {"name": name, "tail": None, "follow": True}
+            channel.write(encode(request(0, "logs", params)))
+            await channel.drain()
+            ControlClient.result(decode(await channel.readline()))
+            return channel
+
+        channel: Channel = self._run(open_stream())
+
+        async def reopen_stream() -> Channel | None:
+            while True:
+                await asyncio.sleep(RECONNECT_INTERVAL)
+                try:
+                    return await asyncio.wait_for(open_stream(), self.timeout)
+                except ControlError:
+                    return None  # the agent no longer knows the service
+                except AGENT_ERRORS:
+                    continue
+
+        async def follow() -> None:
+            stream: Channel | None = channel
+            while stream is not None:
+                try:
+                    while line := await stream.readline():
+                        on_log(decode(line)["params"])
+                finally:
+                    stream.close()
+                stream = await reopen_stream()
+
+        assert self._loop is not None
+        future = asyncio.run_coroutine_threadsafe(follow(), self._loop)
+
+        def stop() -> None:
+            future.cancel()
+
+        return stop
+
+    def forward(self, service: str, local: str, remote: str) -> Callable[[], None]:
+        """Relay connections to the address `local` to `remote` of a service.
+
+        `remote` is resolved by the agent. Returns a function that stops relaying.
+        """
+
+        async def handle(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            try:
+                mux = await self._connect()
+                channel = await mux.open(
+                    type="connect", service=service, address=remote
+                )
+            except AGENT_ERRORS:
+                writer.close()
+                return
+            try:
+                await relay(channel, reader, writer)
+            finally:
+                channel.close()
+
+        async def start() -> asyncio.Server:
+            sock = bind_listener(local)
+            if sock.family == socket.AF_UNIX:
+                return await asyncio.start_unix_server(handle, sock=sock)
+            return await asyncio.start_server(handle, sock=sock)
+
+        server: asyncio.Server = self._run(start())
+
+        async def stop() -> None:
+            server.close()
+            if not local.startswith("tcp://"):
+                remove_socket_file(local)
+
+        return lambda: self._run(stop())
+
+    def close(self) -> None:
+        with self._thread_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None:
+            return
+
+        async def disconnect() -> None:
+            if self._mux is not None:
+                await self._mux.close()
+            if self._runner is not None:
+                self._runner.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._runner
+
+        asyncio.run_coroutine_threadsafe(disconnect(), loop).result(self.timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._mux = self._runner = self._control = self._lock = None
+
+
+class AgentServiceInstance:
+    """A service that runs on an agent, as seen by the coordinator.
+
+    Its output is mirrored from the agent, and the addresses it listens on are
+    relayed to the same addresses on this machine, so the proxy and other
+    services reach it as if it ran here. Files are watched by the agent.
+    """
+
+    def __init__(
+        self, dirs: Dirs, config: ServiceConfig, link: AgentLink | None
+    ) -> None:
+        self.dirs = dirs
+        self.config = config
+        self.link = link
+        self.output = OutputBuffer()
+        self.log = None
+        # the mirrored output is indexed here
+        self.index = LogIndex.for_service(self.output, config)
+        # the agent forks the service from its own zygote
+        self.zygote = None
+        self.process = None
+        self.activator = None
+        self.slot = None
+        self.blue_green = False
+        self._status = "stopped"
+        self._stops: list[Callable[[], None]] = []
+        self.on_restart: list[Callable[[], None]] = []
+
+    def profile_label(self, f_locals: Mapping[str, Any]) -> str:  # noqa: ARG002
+        return f"service {self.config.name} on agent {self.config.agent}"
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    def start(self) -> None:
+        if self._status != "stopped":
+            return
+        name, write = self.config.name, self.output.write
+        if self.link is None:
+            write(f"Unknown agent {self.config.agent!r} for {name}\n")
+            return
+
+        write(f"Starting {name} on agent {self.link.name}\n")
+        try:
+            # attached first, so the output of the start is mirrored too
+            self._stops.append(self.link.follow_logs(name, self._mirror))
+            for address in self.config.relayed_addresses():
+                local = self.dirs.resolve_vars(address)
+                self._stops.append(self.link.forward(name, local, address))
+            self.link.call("start", name=name)
+            self._status = self._remote_status()
+        except AGENT_ERRORS as e:
+            write(f"Failed to start {name} on agent {self.link.name}: {e}\n")
+            self._stop_relays()
+
+    def _mirror(self, params: dict[str, Any]) -> None:
+        # the agent's monotonic clock means nothing here, so output is stamped
+        # with the time it arrived
+        mirror_log(self.output, {**params, "time": None})
+
+    def _remote_status(self) -> str:
+        assert self.link is not None
+        for svc in self.link.call("status"):
+            if svc["name"] == self.config.name:
+                return str(svc["status"])
+        return "stopped"
+
+    def _stop_relays(self) -> None:
+        for stop in self._stops:
+            with contextlib.suppress(*AGENT_ERRORS):
+                stop()
+        self._stops.clear()
+
+    def restart(self) -> None:
+        if self._status == "stopped" or self.link is None:
+            self.start()
+            return
+        try:
+            self.link.call("restart", name=self.config.name)
+            self._status = self._remote_status()
+        except AGENT_ERRORS as e:
+            self.output.write(f"Failed to restart {self.config.name}: {e}\n")
+            return
+        # the relayed addresses reach the restarted service from here
+        for callback in self.on_restart:
+            callback()
+
+    def shutdown(self) -> None:
+        if self._status == "stopped" or self.link is None:
+            return
+        try:
+            self.link.call("stop", name=self.config.name)
+        except AGENT_ERRORS as e:
+            self.output.write(f"Failed to stop {self.config.name}: {e}\n")
+        self._stop_relays()
+        self._status = "stopped"
+
+    def close(self) -> None:
+        if self.index is not None:
+            self.index.close()
+
+    def reconfigure(self, config: ServiceConfig) -> None:
+        """Switch to a new config; the agent restarts the service with its own copy."""
+        started = self._status != "stopped"
+        self.shutdown()
+        if config.parser != self.config.parser:
+            self.close()
+            self.index = LogIndex.for_service(self.output, config)
+        self.config = config
+        if started:
+            self.start()
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import asyncio
+import signal
+from typing import TYPE_CHECKING
+
+from rich.console import Console
+
+from glue import profiling
+
+from .server import ControlServer
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from glue.pm import ServiceManager
+
+__all__ = ["run_headless"]
+
+err = Console(stderr=True)
+
+
+async def _serve(server: ControlServer) -> None:
+    profiling.watch_running_loop("control")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await server.serve(stop)
+
+
+def run_headless(mgr: ServiceManager, path: Path) -> None:
+    """Run every service without the TUI until interrupted."""
+    try:
+        mgr.start()
+        mgr.start_watcher()
+
+        err.print(f"Control socket listening on {path}")
+        asyncio.run(_serve(ControlServer(mgr, path)))
+    finally:
+        mgr.shutdown()
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import json
+import struct
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+__all__ = ["Channel", "Mux", "relay"]
+
+# frame kinds
+OPEN, DATA, EOF, CLOSE, WINDOW = range(5)
+
+# channel id, kind and payload length
+HEADER = struct.Struct("!IBI")
+
+# bytes a side may send on a channel before the other side has read them
+WINDOW_SIZE = 256 * 1024
+MAX_FRAME = 64 * 1024
+
+
+class Channel:
+    """One stream of a `Mux`, used like an asyncio `StreamReader` and `StreamWriter`.
+
+    Every channel has its own window, so a reader that falls behind only holds
+    back the sender of its own channel, never the others on the connection.
+    """
+
+    def __init__(self, mux: Mux, channel_id: int) -> None:
+        self.mux = mux
+        self.id = channel_id
+        self._buffer = bytearray()
+        self._eof = False
+        self._readable = asyncio.Event()
+        self._pending = bytearray()
+        self._credit = WINDOW_SIZE
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._closed = False
+        self._closed_event = asyncio.Event()
+
+    # reading
+
+    def feed_data(self, data: bytes) -> None:
+        self._buffer += data
+        self._readable.set()
+
+    def feed_eof(self) -> None:
+        self._eof = True
+        self._readable.set()
+
+    async def _consume(self, size: int) -> bytes:
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        if not self._buffer and not self._eof:
+            self._readable.clear()
+        if data and not self._closed:
+            with contextlib.suppress(ConnectionError):
+                await self.mux.send(self.id, WINDOW, struct.pack("!I", len(data)))
+        return data
+
+    async def read(self, n: int = -1) -> bytes:
+        """Read up to `n` bytes, or everything that arrived so far with -1."""
+        await self._readable.wait()
+        return await self._consume(len(self._buffer) if n < 0 else n)
+
+    async def readline(self) -> bytes:
+        while (end := self._buffer.find(b"\n")) < 0 and not self._eof:
+            self._readable.clear()
+            await self._readable.wait()
+        return await self._consume(end + 1 if end >= 0 else len(self._buffer))
+
+    def at_eof(self) -> bool:
+        return self._eof and not self._buffer
+
+    # writing
+
+    def add_credit(self, size: int) -> None:
+        self._credit += size
+        self._writable.set()
+
+    def write(self, data: bytes) -> None:
+        """Queue `data`, which is sent as the other side makes room for it."""
+        if self._closed:
+            msg = f"Channel {self.id} is closed"
+            raise ConnectionResetError(msg)
+        self._pending += data
+
+    async def drain(self) -> None:
+        while self._pending:
+            if self._closed:
+                msg = f"Channel {self.id} is closed"
+                raise ConnectionResetError(msg)
+            if self._credit <= 0:
+                self._writable.clear()
+                await self._writable.wait()
+                continue
+            size = min(len(self._pending), self._credit, MAX_FRAME)
+            chunk = bytes(self._pending[:size])
+            del self._pending[:size]
+            self._credit -= size
+            await self.mux.send(self.id, DATA, chunk)
+
+    async def write_eof(self) -> None:
+        await self.drain()
+        await self.mux.send(self.id, EOF)
+
+    # closing
+
+    def lost(self) -> None:
+        self._closed = True
+        self.feed_eof()
+        self._writable.set()
+        self._closed_event.set()
+
+    def is_closing(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._writable.set()
+        self.mux.forget(self)
+        self.mux.send_soon(self.id, CLOSE)
+        self._closed_event.set()
+
+    async def wait_closed(self) -> None:
+        await self._closed_event.wait()
+
+
+class Mux:
+    """Carries any number of channels over a single stream connection.
+
+    Each frame starts with `HEADER`: the channel, the kind of frame and the
+    length of the payload. Either side may open channels; the side that
+    connected uses odd ids and the side that accepted even ones, so they never
+    clash. `on_open` is run as a task of its own for every channel the other
+    side opens, with the parameters it was opened with.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        *,
+        initiator: bool,
+        on_open: Callable[[Channel, dict[str, Any]], Awaitable[None]] | None = None,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.on_open = on_open
+        self.channels: dict[int, Channel] = {}
+        self._ids = itertools.count(1 if initiator else 2, 2)
+        self._drain_lock = asyncio.Lock()
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._closed = False
+
+    async def send(self, channel_id: int, kind: int, payload: bytes = b"") -> None:
+        if self._closed:
+            msg = "The connection is closed"
+            raise ConnectionResetError(msg)
+        self.writer.write(HEADER.pack(channel_id, kind, len(payload)) + payload)
+        async with self._drain_lock:
+            await self.writer.drain()
+
+    def send_soon(self, channel_id: int, kind: int) -> None:
+        if self._closed:
+            return
+        self._spawn(self._send_quietly(channel_id, kind))
+
+    async def _send_quietly(self, channel_id: int, kind: int) -> None:
+        with contextlib.suppress(ConnectionError):
+            await self.send(channel_id, kind)
+
+    def _spawn(self, coro: Awaitable[None]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def forget(self, channel: Channel) -> None:
+        self.channels.pop(channel.id, None)
+
+    async def open(self, **params: Any) -> Channel:
+        channel = Channel(self, next(self._ids))
+        self.channels[channel.id] = channel
+        await self.send(channel.id, OPEN, json.dumps(params).encode())
+        return channel
+
+    async def run(self) -> None:
+        """Dispatch incoming frames until the connection is closed."""
+        try:
+            while True:
+                header = await self.reader.readexactly(HEADER.size)
+                channel_id, kind, size = HEADER.unpack(header)
+                payload = await self.reader.readexactly(size) if size else b""
+                self._dispatch(channel_id, kind, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._closed = True
+            for channel in list(self.channels.values()):
+                channel.lost()
+            self.channels.clear()
+
+    def _dispatch(self, channel_id: int, kind: int, payload: bytes) -> None:
+        if kind == OPEN:
+            opened = self.channels[channel_id] = Channel(self, channel_id)
+            if self.on_open is None:
+                opened.close()
+            else:
+                self._spawn(self._serve(opened, json.loads(payload)))
+            return
+
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return  # closed on this side while the frame was on its way
+        if kind == DATA:
+            channel.feed_data(payload)
+        elif kind == EOF:
+            channel.feed_eof()
+        elif kind == WINDOW:
+            channel.add_credit(struct.unpack("!I", payload)[0])
+        elif kind == CLOSE:
+            self.forget(channel)
+            channel.lost()
+
+    async def _serve(self, channel: Channel, params: dict[str, Any]) -> None:
+        assert self.on_open is not None
+        try:
+            await self.on_open(channel, params)
+        finally:
+            channel.close()
+
+    async def close(self) -> None:
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self.writer.wait_closed()
+
+
+async def relay(
+    channel: Channel, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    """Copy a channel and a connection into each other until both are done."""
+
+    async def inbound() -> None:
+        while data := await channel.read(MAX_FRAME):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    async def outbound() -> None:
+        while data := await reader.read(MAX_FRAME):
+            channel.write(data)
+            await channel.drain()
+        await channel.write_eof()
+
+    tasks = [asyncio.create_task(inbound()), asyncio.create_task(outbound())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # a reset of either side ends the whole connection
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+__all__ = [
+    "INTERNAL_ERROR",
+    "INVALID_PARAMS",
+    "INVALID_REQUEST",
+    "METHOD_NOT_FOUND",
+    "PARSE_ERROR",
+    "UNKNOWN_SERVICE",
+    "ControlError",
+    "decode",
+    "encode",
+    "error",
+    "notification",
+    "request",
+    "response",
+]
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+UNKNOWN_SERVICE = -32000
+
+
+class ControlError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        self.code = code
+        self.message = message
+        super().__init__(f"{message} ({code})")
+
+
+def encode(msg: dict[str, Any]) -> bytes:
+    # messages are newline delimited, so they must not contain raw newlines
+    return json.dumps(msg, separators=(",", ":")).encode() + b"\n"
+
+
+def decode(line: bytes) -> dict[str, Any]:
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        raise ControlError(PARSE_ERROR, "Parse error") from None
+    if not isinstance(msg, dict):
+        raise ControlError(INVALID_REQUEST, "Invalid Request")
+    return msg
+
+
+def request(id_: int, method: str, params: dict[str, Any]) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": id_, "method": method, "params": params}
+
+
+def notification(method: str, params: dict[str, Any]) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": method, "params": params}
+
+
+def response(id_: Any, result: Any) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": id_, "result": result}
+
+
+def error(id_: Any, err: ControlError) -> dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": id_,
+        "error": {"code": err.code, "message": err.message},
+    }
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any
+
+from rich.control import Control
+
+from glue.output import OutputBuffer, skipped
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from glue.config import Config, ConfigDiff, ServiceConfig
+
+    from .client import ControlClient, LogStream
+
+__all__ = ["RemoteServiceInstance", "RemoteServiceManager", "mirror_log"]
+
+
+def mirror_log(output: OutputBuffer, params: dict[str, Any]) -> None:
+    """Write a `log` notification of a service to `output`."""
+    if params.get("clear"):
+        output.write(Control.clear())
+    elif lagged := params.get("lagged"):
+        output.write(skipped(lagged))
+    else:
+        output.write(params["data"], timestamp=params.get("time"))
+
+
+class RemoteServiceManager:
+    """Stands in for `ServiceManager` when the TUI is attached to a daemon.
+
+    Shutting down only detaches from the daemon; its services keep running.
+    """
+
+    def __init__(self, client: ControlClient, config: Config) -> None:
+        self.client = client
+        self.config = config
+        self.services = {
+            svc.name: RemoteServiceInstance(client, svc) for svc in config.services
+        }
+        # the daemon reloads its own config, attached TUIs keep the initial one
+        self.on_change: list[Callable[[ConfigDiff], None]] = []
+
+    def start(self) -> None:
+        for svc in self.services.values():
+            svc.attach()
+
+    def shutdown(self) -> None:
+        for svc in self.services.values():
+            svc.detach()
+        self.client.close()
+
+
+class RemoteServiceInstance:
+    def __init__(self, client: ControlClient, config: ServiceConfig) -> None:
+        self.client = client
+        self.config = config
+        self.output = OutputBuffer()
+        self.stream: LogStream | None = None
+
+    def attach(self) -> None:
+        """Mirror the service's output from the daemon into `output`."""
+        if self.stream is not None:
+            return
+
+        self.stream = stream = self.client.follow_logs(self.config.name)
+
+        def target() -> None:
+            for params in stream:
+                mirror_log(self.output, params)
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def detach(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def start(self) -> None:
+        self.client.call("start", name=self.config.name)
+
+    def restart(self) -> None:
+        self.client.call("restart", name=self.config.name)
+
+    def shutdown(self) -> None:
+        self.client.call("stop", name=self.config.name)
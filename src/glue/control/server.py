@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+import psutil  # type: ignore[import-untyped]
+
+from glue.logindex import parse_level, query_latency, query_lines
+from glue.streams import metrics_path
+
+from .protocol import (
+    INTERNAL_ERROR,
+    INVALID_PARAMS,
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    UNKNOWN_SERVICE,
+    ControlError,
+    decode,
+    encode,
+    error,
+    notification,
+    response,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from pathlib import Path
+
+    from glue.logindex import LogIndex, LogLine
+    from glue.output import Cursor, Slice
+    from glue.pm import ServiceInstance, ServiceManager
+
+    from .coordinator import AgentServiceInstance
+
+__all__ = ["ControlServer"]
+
+
+def _process_metrics(pid: int) -> dict[str, Any]:
+    try:
+        proc = psutil.Process(pid)
+        # in-process services run in glue itself, whose children are the other
+        # services, so they only count glue
+        children = proc.children(recursive=True) if pid != os.getpid() else []
+        procs = [proc, *children]
+    except psutil.NoSuchProcess:
+        return {}
+
+    cpu_time = rss = threads = 0.0
+    for p in procs:
+        with contextlib.suppress(psutil.Error), p.oneshot():
+            times = p.cpu_times()
+            cpu_time += times.user + times.system
+            rss += p.memory_info().rss
+            threads += p.num_threads()
+    return {
+        "pid": pid,
+        "processes": len(procs),
+        "threads": int(threads),
+        "cpu_time": cpu_time,
+        "rss": int(rss),
+    }
+
+
+def _log_messages(name: str, cursor: Cursor, data: Slice) -> list[dict[str, Any]]:
+    params: list[dict[str, Any]] = []
+    if data.lagged:
+        params.append({"name": name, "lagged": data.lagged})
+    if data.cleared:
+        params.append({"name": name, "clear": True})
+    # monotonic clocks are shared by every process on the host
+    chunks = [
+        {"name": name, "data": cursor.decode(views), "time": timestamp}
+        for timestamp, views in data.chunks()
+    ]
+    if chunks and not cursor.check(data):
+        chunks = [{"name": name, "lagged": len(data)}]
+    return params + chunks
+
+
+def _nan_to_none(value: float) -> float | None:
+    return None if math.isnan(value) else value
+
+
+def _line_result(line: LogLine) -> dict[str, Any]:
+    return {
+        **line._asdict(),
+        "logged": _nan_to_none(line.logged),
+        "latency": _nan_to_none(line.latency),
+    }
+
+
+class ControlServer:
+    """JSON-RPC 2.0 server for controlling a `ServiceManager` over a unix socket.
+
+    Messages are newline-delimited JSON objects. Following logs keeps the
+    connection open and sends `log` notifications until the client disconnects.
+    """
+
+    def __init__(self, mgr: ServiceManager, path: Path) -> None:
+        self.mgr = mgr
+        self.path = path
+        self.started = time.time()
+        self._writers: set[asyncio.StreamWriter] = set()
+        self.methods: dict[str, Callable[..., Awaitable[Any]]] = {
+            "status": self.rpc_status,
+            "start": self.rpc_start,
+            "stop": self.rpc_stop,
+            "restart": self.rpc_restart,
+            "logs": self.rpc_logs,
+            "metrics": self.rpc_metrics,
+            "query": self.rpc_query,
+            "latency": self.rpc_latency,
+        }
+
+    def get_service(self, name: str) -> ServiceInstance | AgentServiceInstance:
+        try:
+            return self.mgr.services[name]
+        except KeyError:
+            raise ControlError(UNKNOWN_SERVICE, f"Unknown service {name!r}") from None
+
+    async def rpc_status(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": name,
+                "status": svc.status,
+                "pid": svc.process.pid if svc.process is not None else None,
+                "slot": svc.slot,
+            }
+            for name, svc in self.mgr.services.items()
+        ]
+
+    async def rpc_start(self, name: str) -> None:
+        await asyncio.to_thread(self.get_service(name).start)
+
+    async def rpc_stop(self, name: str) -> None:
+        await asyncio.to_thread(self.get_service(name).shutdown)
+
+    async def rpc_restart(self, name: str) -> None:
+        await asyncio.to_thread(self.get_service(name).restart)
+
+    async def rpc_logs(
+        self, name: str, *, tail: int | None = None, follow: bool = False
+    ) -> str:
+        svc = self.get_service(name)
+        # when following, `handle` streams the tail along with any new output
+        return "" if follow else svc.output.tail(tail)
+
+    async def rpc_metrics(self) -> dict[str, Any]:
+        def collect() -> dict[str, Any]:
+            return {
+                name: {
+                    "status": svc.status,
+                    "log_bytes": svc.output.size,
+                    "log_dropped": svc.log.dropped if svc.log else 0,
+                    **(_process_metrics(svc.process.pid) if svc.process else {}),
+                }
+                for name, svc in self.mgr.services.items()
+            }
+
+        return {
+            "uptime": time.time() - self.started,
+            "services": await asyncio.to_thread(collect),
+            "streams": await asyncio.to_thread(self._stream_metrics),
+        }
+
+    def _indexes(self, names: list[str] | None) -> list[LogIndex]:
+        if names is None:
+            services = list(self.mgr.services.values())
+        else:
+            services = [self.get_service(name) for name in names]
+            for svc in services:
+                if svc.index is None:
+                    msg = f"Service {svc.config.name!r} has no log parser"
+                    raise ControlError(INVALID_PARAMS, msg)
+        return [svc.index for svc in services if svc.index is not None]
+
+    async def rpc_query(
+        self,
+        *,
+        level: str = "",
+        request_id: str | None = None,
+        since: float | None = None,
+        services: list[str] | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        code = parse_level(level)
+        if level and not code:
+            raise ControlError(INVALID_PARAMS, f"Unknown level {level!r}")
+        indexes = self._indexes(services)
+        start = None if since is None else time.time() - since
+        lines = await asyncio.to_thread(
+            query_lines, indexes, level=code, request_id=request_id, since=start
+        )
+        if limit is not None:
+            lines = lines[-limit:] if limit else []
+        return [_line_result(line) for line in lines]
+
+    async def rpc_latency(
+        self,
+        *,
+        percentile: float = 99,
+        since: float | None = None,
+        services: list[str] | None = None,
+    ) -> dict[str, Any]:
+        if not 0 <= percentile <= 100:
+            msg = f"Percentile {percentile} is not between 0 and 100"
+            raise ControlError(INVALID_PARAMS, msg)
+        indexes = self._indexes(services)
+        start = None if since is None else time.time() - since
+
+        def collect() -> dict[str, Any]:
+            count, value = query_latency(indexes, percentile, since=start)
+            per_service = {}
+            for index in indexes:
+                n, v = query_latency([index], percentile, since=start)
+                per_service[index.service] = {"count": n, "value": v}
+            return {"count": count, "value": value, "services": per_service}
+
+        return {"percentile": percentile, **await asyncio.to_thread(collect)}
+
+    def _stream_metrics(self) -> dict[str, Any]:
+        # the streams run in the proxy, which may be a process of its own
+        try:
+            metrics: dict[str, Any] = json.loads(
+                metrics_path(self.mgr.dirs).read_text()
+            )
+        except (OSError, ValueError):
+            return {}
+        return metrics
+
+    async def follow_logs(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        name: str,
+        tail: int | None,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        scheduled = threading.Event()
+
+        def on_data() -> None:
+            # only wake the loop once for every batch of writes
+            if not scheduled.is_set():
+                scheduled.set()
+                loop.call_soon_threadsafe(wake.set)
+
+        cursor = self.get_service(name).output.cursor(tail=tail, on_data=on_data)
+
+        async def pump() -> None:
+            while True:
+                scheduled.clear()
+                while (data := cursor.read()) is not None:
+                    for params in _log_messages(name, cursor, data):
+                        writer.write(encode(notification("log", params)))
+                    # a slow client makes the cursor lag instead of piling up output
+                    await writer.drain()
+                await wake.wait()
+                wake.clear()
+
+        task = asyncio.create_task(pump())
+        try:
+            # anything sent by the client, including EOF, ends the stream
+            await reader.readline()
+        finally:
+            cursor.close()
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+                await task
+
+    async def dispatch(self, msg: dict[str, Any]) -> Any:
+        method = msg.get("method")
+        params = msg.get("params", {})
+        if not isinstance(method, str) or not isinstance(params, dict):
+            raise ControlError(INVALID_REQUEST, "Invalid Request")
+
+        handler = self.methods.get(method)
+        if handler is None:
+            raise ControlError(METHOD_NOT_FOUND, f"Method not found: {method}")
+
+        try:
+            return await handler(**params)
+        except TypeError as e:
+            raise ControlError(INVALID_PARAMS, str(e)) from None
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._writers.add(writer)
+        try:
+            while line := await reader.readline():
+                msg_id = None
+                try:
+                    msg = decode(line)
+                    msg_id = msg.get("id")
+                    result = await self.dispatch(msg)
+                except ControlError as e:
+                    writer.write(encode(error(msg_id, e)))
+                except Exception as e:  # noqa: BLE001
+                    err = ControlError(INTERNAL_ERROR, str(e))
+                    writer.write(encode(error(msg_id, err)))
+                else:
+                    if msg_id is None:
+                        continue
+                    writer.write(encode(response(msg_id, result)))
+                    params = msg.get("params", {})
+                    if msg["method"] == "logs" and params.get("follow"):
+                        await writer.drain()
+                        await self.follow_logs(
+                            reader, writer, params["name"], params.get("tail")
+                        )
+                        break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+
+        server = await asyncio.start_unix_server(self.handle, self.path)
+        try:
+            async with server:
+                await stop.wait()
+                # followers would otherwise keep the server from closing
+                for writer in list(self._writers):
+                    writer.close()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                self.path.unlink()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import random
+    from pathlib import Path
+
+    from .config import FaultConfig
+    from .utils import Dirs
+
+__all__ = [
+    "DISTRIBUTIONS",
+    "FaultSwitches",
+    "check_rule",
+    "sample_delay",
+    "switches_path",
+]
+
+DISTRIBUTIONS = ("uniform", "normal", "exponential")
+
+
+def switches_path(dirs: Dirs) -> Path:
+    return dirs.runtime_dir / "faults.json"
+
+
+def check_rule(rule: FaultConfig) -> None:
+    if rule.distribution not in DISTRIBUTIONS:
+        msg = (
+            f"Unknown distribution {rule.distribution!r} in fault {rule.name!r}, "
+            f"expected one of {DISTRIBUTIONS}"
+        )
+        raise ValueError(msg)
+
+
+def sample_delay(rule: FaultConfig, rng: random.Random) -> float:
+    """Draw the delay that `rule` adds to a request."""
+    if not rule.jitter:
+        return rule.latency
+    if rule.distribution == "normal":
+        return max(0.0, rng.gauss(rule.latency + rule.jitter, rule.jitter))
+    if rule.distribution == "exponential":
+        return rule.latency + rng.expovariate(1 / rule.jitter)
+    return rule.latency + rng.uniform(0, 2 * rule.jitter)
+
+
+class FaultSwitches:
+    """Whether each fault rule is switched on, shared through a file.
+
+    The TUI writes the rules it toggled to the file, and every proxy reading it
+    picks the change up within `interval` seconds, whether it runs in the glue
+    process, in a process of its own or behind a daemon. Rules that were never
+    toggled use `enabled` from the config.
+    """
+
+    def __init__(self, path: Path, *, interval: float = 0.5) -> None:
+        self.path = path
+        self.interval = interval
+        self._switches: dict[str, dict[str, bool]] = {}
+        self._mtime: int | None = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return
+        self._checked = now
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._switches = None, {}
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            switches = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return  # keep the last good state until the file is written again
+        self._mtime, self._switches = mtime, switches
+
+    def is_enabled(self, server: str, rule: FaultConfig) -> bool:
+        with self._lock:
+            self._refresh()
+            return self._switches.get(server, {}).get(rule.name, rule.enabled)
+
+    def set(self, server: str, rule: FaultConfig, *, enabled: bool) -> None:
+        with self._lock:
+            self._checked = float("-inf")
+            self._refresh()
+            self._switches.setdefault(server, {})[rule.name] = enabled
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+            tmp.write_text(json.dumps(self._switches, indent=2))
+            # proxies never see a half-written file
+            tmp.replace(self.path)
+            self._mtime = self.path.stat().st_mtime_ns
+
+    def toggle(self, server: str, rule: FaultConfig) -> bool:
+        """Flip a rule and return whether it is now enabled."""
+        enabled = not self.is_enabled(server, rule)
+        self.set(server, rule, enabled=enabled)
+        return enabled
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import contextlib
+import gzip
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO
+
+if TYPE_CHECKING:
+    from io import BufferedIOBase
+    from pathlib import Path
+
+    from .config import LogConfig
+    from .output import OutputBuffer
+
+__all__ = ["COMPRESSIONS", "LogWriter"]
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# segments of every service are compressed one at a time, off the writer threads
+_compressor: ThreadPoolExecutor | None = None
+_compressor_lock = threading.Lock()
+
+
+def _get_compressor() -> ThreadPoolExecutor:
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(1, thread_name_prefix="glue-compress")
+        return _compressor
+
+
+def _marker(message: str) -> bytes:
+    return f"\n[glue: {message}]\n".encode()
+
+
+def _open_compressed(path: Path, compression: str) -> tuple[Path, BufferedIOBase]:
+    if compression == "zstd":
+        try:
+            import zstandard  # type: ignore[import-not-found]
+        except ImportError:
+            pass  # the optional dependency is missing, use gzip instead
+        else:
+            dest = path.with_name(f"{path.name}.zst")
+            return dest, zstandard.open(dest, "wb")
+
+    dest = path.with_name(f"{path.name}.gz")
+    return dest, gzip.open(dest, "wb")
+
+
+class LogWriter:
+    """Persists the raw output of a service to rotating log files.
+
+    The writer reads the service's `OutputBuffer` through its own cursor on a
+    background thread, so the reader of the PTY never waits for the disk. Output
+    is appended in batches, straight from the ring buffer, and the current
+    segment is rotated once it grows past `max_bytes` or gets older than
+    `max_age` seconds. Rotated segments are compressed by a shared worker thread,
+    after which the oldest files are deleted until the directory fits in
+    `retention` bytes.
+
+    If the writer falls so far behind that output is overwritten before it was
+    saved, the missing bytes are marked in the file and counted in `dropped`.
+    """
+
+    def __init__(
+        self,
+        output: OutputBuffer,
+        directory: Path,
+        *,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_age: float | None = None,
+        retention: int = 100 * 1024 * 1024,
+        compression: str = "gzip",
+        flush_interval: float = 0.5,
+    ) -> None:
+        if compression not in COMPRESSIONS:
+            msg = f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}"
+            raise ValueError(msg)
+
+        self.output = output
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention = retention
+        self.compression = compression
+        self.flush_interval = flush_interval
+
+        self._cond = threading.Condition()
+        self._has_data = False
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self._rotation: Future[None] | None = None
+        # only output written from now on is saved
+        self._cursor = output.cursor(tail=0, on_data=self._on_data)
+
+        self._file: BinaryIO | None = None
+        self._segment: Path | None = None
+        self._segment_size = 0
+        self._segment_opened = 0.0
+
+    @classmethod
+    def from_config(
+        cls, output: OutputBuffer, directory: Path, config: LogConfig
+    ) -> LogWriter:
+        return cls(
+            output,
+            directory,
+            max_bytes=config.max_bytes,
+            max_age=config.max_age,
+            retention=config.retention,
+            compression=config.compression,
+        )
+
+    @property
+    def dropped(self) -> int:
+        return self._cursor.lagged
+
+    def _behind(self) -> bool:
+        return self._cursor.unread >= self.output.limit // 2
+
+    def _on_data(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="glue-log-writer", daemon=True
+                )
+                self._thread.start()
+            # wake the writer for the first write of a batch, or when it needs to
+            # catch up before output is overwritten
+            if not self._has_data or self._behind():
+                self._has_data = True
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Write out everything that is still unsaved and compress the last segment."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._cursor.close()
+        if self._rotation is not None:
+            # segments are compressed in order, so this waits for all of them
+            self._rotation.result()
+
+    def _run(self) -> None:
+        closed = False
+        while not closed:
+            with self._cond:
+                self._cond.wait_for(lambda: self._has_data or self._closed)
+                # give the service a moment to produce more output for this batch
+                self._cond.wait_for(
+                    lambda: self._closed or self._behind(), self.flush_interval
+                )
+                self._has_data = False
+                closed = self._closed
+            self._drain()
+
+        self._close_segment()
+
+    def _drain(self) -> None:
+        cursor = self._cursor
+        while (data := cursor.read()) is not None:
+            if data.lagged:
+                self._append(_marker(f"dropped {data.lagged} bytes"))
+            self._append(*data.views)
+            if not cursor.check(data):
+                self._append(
+                    _marker(f"the last {len(data)} bytes were overwritten while saving")
+                )
+        if self._file is not None:
+            self._file.flush()
+
+    def _append(self, *data: bytes | memoryview) -> None:
+        now = time.time()
+        if self._file is not None and (
+            self._segment_size >= self.max_bytes
+            or (self.max_age is not None and now - self._segment_opened >= self.max_age)
+        ):
+            self._close_segment()
+        if self._file is None:
+            self._open_segment(now)
+
+        assert self._file is not None
+        for part in data:
+            self._file.write(part)
+            self._segment_size += len(part)
+
+    def _open_segment(self, now: float) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._segment is None:
+            # segments left behind by a previous run that did not exit cleanly
+            for path in self.directory.glob("*.log"):
+                self._rotate(path)
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        path = self.directory / f"{stamp}.log"
+        n = 0
+        while path.exists() or self._compressed_exists(path):
+            n += 1
+            path = self.directory / f"{stamp}-{n}.log"
+
+        self._file = path.open("ab")
+        self._segment = path
+        self._segment_size = 0
+        self._segment_opened = now
+
+    def _compressed_exists(self, path: Path) -> bool:
+        return any(
+            path.with_name(f"{path.name}{suffix}").exists()
+            for suffix in (".gz", ".zst")
+        )
+
+    def _close_segment(self) -> None:
+        if self._file is None or self._segment is None:
+            return
+        self._file.close()
+        self._file = None
+        self._rotate(self._segment)
+
+    def _rotate(self, path: Path) -> None:
+        self._rotation = _get_compressor().submit(self._compress, path)
+
+    def _compress(self, path: Path) -> None:
+        if self.compression != "none":
+            dest, dst = _open_compressed(path, self.compression)
+            try:
+                with dst, path.open("rb") as src:
+                    shutil.copyfileobj(src, dst)
+            except OSError:
+                dest.unlink(missing_ok=True)
+                return
+            path.unlink()
+        self._apply_retention()
+
+    def _apply_retention(self) -> None:
+        files = []
+        for path in self.directory.iterdir():
+            with contextlib.suppress(OSError):
+                stat = path.stat()
+                files.append((stat.st_mtime, path.name, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, _, size, _ in files)
+        for _, _, size, path in files:
+            if total <= self.retention:
+                break
+            if path == self._segment and self._file is not None:
+                continue  # still being written to
+            with contextlib.suppress(OSError):
+                path.unlink()
+                total -= size
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import json
+import math
+import re
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+
+    from .config import LogParserConfig, ServiceConfig
+    from .output import OutputBuffer
+
+__all__ = [
+    "FORMATS",
+    "LEVELS",
+    "LogIndex",
+    "LogLine",
+    "parse_level",
+    "percentile",
+    "query_latency",
+    "query_lines",
+]
+
+FORMATS = ("json", "logfmt")
+
+# indexed by the level codes stored in the index; 0 is a line without a level
+LEVELS = ("", "trace", "debug", "info", "warning", "error", "critical")
+_LEVEL_ALIASES = {
+    "warn": "warning",
+    "err": "error",
+    "fatal": "critical",
+    "panic": "critical",
+}
+
+_ANSI = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]|\x1b\][^\x07]*\x07")
+_LOGFMT = re.compile(r'([^\s=]+)=("(?:[^"\\]|\\.)*"|\S*)')
+
+
+def parse_level(name: str) -> int:
+    """Return the code of a level name, or 0 when it is not known."""
+    name = name.strip().lower()
+    name = _LEVEL_ALIASES.get(name, name)
+    try:
+        return LEVELS.index(name) if name else 0
+    except ValueError:
+        return 0
+
+
+def _parse_json(line: str) -> dict[str, Any] | None:
+    if not line.startswith("{"):
+        return None
+    try:
+        fields = json.loads(line)
+    except ValueError:
+        return None
+    return fields if isinstance(fields, dict) else None
+
+
+def _parse_logfmt(line: str) -> dict[str, Any] | None:
+    fields: dict[str, Any] = {}
+    for key, value in _LOGFMT.findall(line):
+        if value.startswith('"'):
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        fields[key] = value
+    return fields or None
+
+
+def _parse_time(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # epoch seconds, or milliseconds for values too large to be seconds
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return _parse_time(float(value))
+        except ValueError:
+            pass
+        try:
+            stamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return math.nan
+        if stamp.tzinfo is None:
+            stamp = stamp.replace(tzinfo=timezone.utc)
+        return stamp.timestamp()
+    return math.nan
+
+
+def _parse_number(value: Any) -> float:
+    if isinstance(value, str):
+        value = value.removesuffix("ms")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _first(fields: Mapping[str, Any], keys: Iterable[str]) -> Any:
+    for key in keys:
+        if (value := fields.get(key)) is not None:
+            return value
+    return None
+
+
+class LogLine(NamedTuple):
+    service: str
+    time: float
+    """When the line was captured, in seconds since the epoch."""
+    logged: float
+    """The time the line itself carries, or NaN."""
+    level: str
+    request_id: str | None
+    latency: float
+    """The logged latency in milliseconds, or NaN."""
+    line: str
+
+
+class LogIndex:
+    """Keeps the fields of structured log lines in columns next to the raw output.
+
+    The index reads the service's `OutputBuffer` through its own cursor on a
+    background thread, like `LogWriter`. Each line that parses as JSON or logfmt
+    gets a row: its capture time, the time it carries, a level code, an interned
+    request id and the latency, each in a compact `array`, with the text kept
+    alongside. Queries filter the columns, so they never parse text again. The
+    oldest rows are dropped once there are more than `max_lines`.
+    """
+
+    def __init__(
+        self,
+        output: OutputBuffer,
+        config: LogParserConfig,
+        *,
+        service: str = "",
+        flush_interval: float = 0.1,
+    ) -> None:
+        if config.format not in FORMATS:
+            msg = f"Unknown log format {config.format!r}, expected one of {FORMATS}"
+            raise ValueError(msg)
+
+        self.output = output
+        self.config = config
+        self.service = service
+        self.flush_interval = flush_interval
+        self._parse = _parse_json if config.format == "json" else _parse_logfmt
+
+        self.times = array("d")
+        self.logged = array("d")
+        self.levels = array("B")
+        self.request_ids = array("I")
+        self.latencies = array("d")
+        self.lines: list[str] = []
+        # request id 0 stands for lines without one
+        self._ids: dict[str, int] = {}
+        self._id_names: list[str | None] = [None]
+        self._partial = ""
+        self._partial_time = 0.0
+        # capture times are monotonic, rows are stored with the wall clock
+        self._clock_offset = time.time() - time.monotonic()
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._has_data = False
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self._cursor = output.cursor(tail=0, on_data=self._on_data)
+
+    @classmethod
+    def for_service(
+        cls, output: OutputBuffer, config: ServiceConfig
+    ) -> LogIndex | None:
+        if config.parser is None:
+            return None
+        return cls(output, config.parser, service=config.name)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _on_data(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="glue-log-index", daemon=True
+                )
+                self._thread.start()
+            self._has_data = True
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Index everything that was written so far and stop following the output."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+        self._cursor.close()
+
+    def _run(self) -> None:
+        closed = False
+        while not closed:
+            with self._cond:
+                self._cond.wait_for(lambda: self._has_data or self._closed)
+                self._cond.wait_for(lambda: self._closed, self.flush_interval)
+                self._has_data = False
+                closed = self._closed
+            self.flush()
+
+    def flush(self) -> None:
+        """Index the output that was written since the last time."""
+        cursor = self._cursor
+        with self._lock:
+            while (data := cursor.read()) is not None:
+                if data.lagged or data.cleared:
+                    self._partial = ""
+                for timestamp, views in data.chunks():
+                    self._add_text(timestamp, cursor.decode(views))
+                cursor.check(data)
+            self._trim()
+
+    def _add_text(self, timestamp: float, text: str) -> None:
+        # lines are stamped with the chunk that started them
+        if not self._partial:
+            self._partial_time = timestamp
+        *lines, partial = (self._partial + text).split("\n")
+        for line in lines:
+            self._add_line(self._partial_time, line)
+            self._partial_time = timestamp
+        self._partial = partial
+
+    def _add_line(self, timestamp: float, line: str) -> None:
+        line = _ANSI.sub("", line).strip()
+        if not line or (fields := self._parse(line)) is None:
+            return
+        config = self.config
+        level = _first(fields, config.level)
+        request_id = _first(fields, config.request_id)
+        self.times.append(timestamp + self._clock_offset)
+        self.logged.append(_parse_time(_first(fields, config.time)))
+        self.levels.append(parse_level(str(level)) if level is not None else 0)
+        self.request_ids.append(
+            self._intern(str(request_id)) if request_id is not None else 0
+        )
+        self.latencies.append(_parse_number(_first(fields, config.latency)))
+        self.lines.append(line)
+
+    def _intern(self, request_id: str) -> int:
+        code = self._ids.get(request_id)
+        if code is None:
+            code = self._ids[request_id] = len(self._id_names)
+            self._id_names.append(request_id)
+        return code
+
+    def _trim(self) -> None:
+        # drop rows in batches, so trimming costs O(1) per line
+        excess = len(self.times) - self.config.max_lines
+        if excess <= 0 or excess < self.config.max_lines // 4:
+            return
+        for column in (
+            self.times,
+            self.logged,
+            self.levels,
+            self.request_ids,
+            self.latencies,
+        ):
+            del column[:excess]
+        del self.lines[:excess]
+        # forget request ids that no line refers to anymore
+        used = sorted(set(self.request_ids) - {0})
+        remap = {code: n for n, code in enumerate(used, 1)}
+        self.request_ids = array("I", (remap.get(c, 0) for c in self.request_ids))
+        self._id_names = [None, *(self._id_names[code] for code in used)]
+        self._ids = {
+            name: n for n, name in enumerate(self._id_names) if name is not None
+        }
+
+    def _start(self, since: float | None) -> int:
+        # capture times only grow, so the window is found by bisection
+        return 0 if since is None else bisect.bisect_left(self.times, since)
+
+    def select(
+        self,
+        *,
+        level: int = 0,
+        request_id: str | None = None,
+        since: float | None = None,
+    ) -> list[LogLine]:
+        """Return the lines at `level` or above, captured since `since`.
+
+        With `request_id`, only lines that logged it are returned.
+        """
+        self.flush()
+        with self._lock:
+            code = 0
+            if request_id is not None and not (code := self._ids.get(request_id, 0)):
+                return []
+            levels, ids = self.levels, self.request_ids
+            return [
+                self._row(i)
+                for i in range(self._start(since), len(self.times))
+                if levels[i] >= level and (not code or ids[i] == code)
+            ]
+
+    def _row(self, i: int) -> LogLine:
+        return LogLine(
+            self.service,
+            self.times[i],
+            self.logged[i],
+            LEVELS[self.levels[i]],
+            self._id_names[self.request_ids[i]],
+            self.latencies[i],
+            self.lines[i],
+        )
+
+    def latency(self, *, since: float | None = None) -> list[float]:
+        """Return the latencies logged since `since`, leaving out lines without one."""
+        self.flush()
+        with self._lock:
+            window = self.latencies[self._start(since) :]
+        return [value for value in window if not math.isnan(value)]
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Return the `q`th percentile of `values` by the nearest-rank method."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = math.ceil(q / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def query_lines(
+    indexes: Iterable[LogIndex],
+    *,
+    level: int = 0,
+    request_id: str | None = None,
+    since: float | None = None,
+) -> list[LogLine]:
+    """Select matching lines of several services, ordered by capture time."""
+    return list(
+        heapq.merge(
+            *(
+                index.select(level=level, request_id=request_id, since=since)
+                for index in indexes
+            ),
+            key=lambda line: line.time,
+        )
+    )
+
+
+def query_latency(
+    indexes: Iterable[LogIndex], q: float, *, since: float | None = None
+) -> tuple[int, float | None]:
+    """Return how many latencies several services logged, and their percentile."""
+    values = [value for index in indexes for value in index.latency(since=since)]
+    return len(values), percentile(values, q)
@@ -1,3 +1,5 @@
+import os
+from collections.abc import Callable
 from pathlib import Path
 
 import click
@@ -5,38 +7,149 @@ import rich
 from click.exceptions import Exit
 from rich.console import Console
 
+from glue import profiling
+from glue.faults import FaultSwitches, switches_path
 from glue.pm import ServiceManager
 from glue.utils import Dirs
 
-from .config import load_config
+from .config import Config, load_config
+from .control import ControlClient, socket_path
 from .typecast import TypeCastError
-from .ui import GlueApp
 
 out = rich.get_console()
 err = Console(stderr=True)
 
 
+def run(
+    config: Config,
+    config_path: Path,
+    load: Callable[[], Config],
+    *,
+    port: int,
+    headless: bool,
+    attach: bool,
+) -> None:
+    dirs = Dirs.from_path(config_path)
+    control_path = socket_path(dirs)
+    switches = FaultSwitches(switches_path(dirs))
+
+    # the TUI and the control server are only imported by the modes that use them
+    if attach:
+        from .control.remote import RemoteServiceManager
+        from .ui import GlueApp
+
+        try:
+            client = ControlClient(control_path)
+        except OSError:
+            err.print(f"No glue daemon is listening on {control_path}")
+            raise Exit(1) from None
+        remote = RemoteServiceManager(client, config)
+        remote.start()
+        GlueApp(remote, port, switches).run()
+        return
+
+    mgr = ServiceManager(dirs, config)
+    mgr.watch_config(config_path, load)
+
+    if headless:
+        from .control.daemon import run_headless
+
+        run_headless(mgr, control_path)
+        return
+
+    from .ui import GlueApp
+
+    mgr.start()
+    mgr.start_watcher()
+
+    app = GlueApp(mgr, port, switches)
+
+    app.run()
+
+
 @click.command()
 @click.argument("config_path", type=Path)
 @click.option("--host", type=str, default="127.0.0.1")
 @click.option("--port", type=int, default=8000)
 @click.option("--reload", type=bool, is_flag=True)
+@click.option(
+    "--in-process-proxy",
+    type=bool,
+    is_flag=True,
+    help="Run the proxy on a thread of the glue process instead of its own process.",
+)
+@click.option(
+    "--headless",
+    type=bool,
+    is_flag=True,
+    help="Run the services without the TUI, controlled through glue-ctl.",
+)
+@click.option(
+    "--attach",
+    type=bool,
+    is_flag=True,
+    help="Attach the TUI to a running headless instance.",
+)
+@click.option(
+    "--profile",
+    type=bool,
+    is_flag=True,
+    help="Sample every thread, including the proxy's, and save the profiles to the "
+    "state dir on exit.",
+)
+@click.option(
+    "--slow-callback",
+    type=float,
+    default=0.1,
+    help="Report event loop stalls longer than this many seconds when profiling.",
+)
 @click.version_option()
-def main(config_path: Path, *, host: str, port: int, reload: bool) -> None:
-    try:
+def main(
+    config_path: Path,
+    *,
+    host: str,
+    port: int,
+    reload: bool,
+    in_process_proxy: bool,
+    headless: bool,
+    attach: bool,
+    profile: bool,
+    slow_callback: float,
+) -> None:
+    def load() -> Config:
         config = load_config(config_path)
+        if config.servers or config.default_server:
+            config.insert_root_service(
+                config_path,
+                host=host,
+                port=port,
+                reload=reload,
+                in_process=in_process_proxy,
+            )
+        return config
+
+    try:
+        config = load()
     except TypeCastError as e:
         err.print(e)
         raise Exit(1) from None
 
-    if config.servers or config.default_server:
-        config.insert_root_service(config_path, host=host, port=port, reload=reload)
+    if reload and in_process_proxy:
+        err.print("--reload has no effect on a proxy that runs in the glue process")
 
-    dirs = Dirs.from_path(config_path)
-
-    app = GlueApp(ServiceManager(dirs, config), port)
-
-    app.run()
+    if profile:
+        # profiles the proxy too when it runs in a process of its own
+        os.environ[profiling.PROFILE_ENV] = str(slow_callback)
+        profiling.start_profiler(
+            Dirs.from_path(config_path).state_dir / "profile",
+            name="glue",
+            slow_callback=slow_callback,
+        )
+    try:
+        run(config, config_path, load, port=port, headless=headless, attach=attach)
+    finally:
+        for path in profiling.stop_profiler():
+            err.print(f"Saved profile to {path}")
 
 
 if __name__ == "__main__":
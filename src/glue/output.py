@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import codecs
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from rich.control import Control
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    from rich.console import RenderableType
+
+__all__ = ["Chunk", "Cursor", "OutputBuffer", "Slice", "skipped"]
+
+_INITIAL_CAPACITY = 64 * 1024
+
+
+def skipped(size: int) -> str:
+    """Mark output that a consumer missed because it fell behind."""
+    return f"\n\x1b[2m[{size} bytes skipped]\x1b[0m\n"
+
+
+class Chunk(NamedTuple):
+    timestamp: float
+    """The `time.monotonic()` at which the output was captured."""
+    text: str
+
+
+@dataclass
+class Slice:
+    """A range of output read through a `Cursor`.
+
+    `views` point straight into the ring buffer. They stay valid until the
+    writer wraps around, which `Cursor.check` tells after they have been used.
+    """
+
+    buffer: OutputBuffer
+    start: int
+    end: int
+    views: tuple[memoryview, ...]
+    lagged: int = 0
+    """Bytes that were overwritten before the cursor got to them."""
+    cleared: bool = False
+    """Whether the buffer was cleared right before this slice."""
+    _chunks: list[tuple[float, tuple[memoryview, ...]]] | None = field(
+        default=None, repr=False
+    )
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def chunks(self) -> list[tuple[float, tuple[memoryview, ...]]]:
+        """Split `views` at chunk boundaries, along with their capture time."""
+        if self._chunks is None:
+            self._chunks = self.buffer.chunk_views(self.start, self.end)
+        return self._chunks
+
+
+class Cursor:
+    """An independent reader of an `OutputBuffer`.
+
+    Reading never copies and never blocks the writer. A cursor that falls more
+    than the buffer's limit behind skips ahead and reports the skipped bytes as
+    `Slice.lagged`, which also add up in `lagged`.
+    """
+
+    def __init__(
+        self,
+        buffer: OutputBuffer,
+        position: int,
+        on_data: Callable[[], Any] | None,
+    ) -> None:
+        self.buffer = buffer
+        self.position = position
+        self.on_data = on_data
+        self.lagged = 0
+        self.clear_seen = position
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def unread(self) -> int:
+        return self.buffer.head - self.position
+
+    def read(self, max_bytes: int | None = None) -> Slice | None:
+        """Return the next unread output, or `None` when there is none."""
+        return self.buffer.read(self, max_bytes)
+
+    def check(self, data: Slice) -> bool:
+        """Whether `data` was still intact after it was used.
+
+        Slices that were overwritten in the meantime are counted as lagged.
+        """
+        if self.buffer.is_intact(data.start):
+            return True
+        self.lagged += len(data)
+        return False
+
+    def decode(self, views: Iterable[memoryview]) -> str:
+        """Decode output, keeping characters that are split across reads intact."""
+        return "".join(self._decoder.decode(view) for view in views)
+
+    def close(self) -> None:
+        self.buffer.remove_cursor(self)
+
+
+class OutputBuffer:
+    """A ring buffer of the raw output of a service, shared by all its consumers.
+
+    Each consumer reads through its own `Cursor`. Output is copied once, into
+    the ring, and cursors hand out `memoryview`s over it. Every write is stamped
+    with the monotonic time at which it was captured, so the output of several
+    services can be put back in order afterwards.
+
+    The ring starts small and grows up to `limit` bytes, after which the oldest
+    output is overwritten.
+    """
+
+    def __init__(self, limit: int = 1024 * 1024) -> None:
+        self.limit = limit
+        self._capacity = min(limit, _INITIAL_CAPACITY)
+        self._buf = bytearray(self._capacity)
+        self._view = memoryview(self._buf)
+        self._head = 0  # number of bytes ever written
+        self._reserved = 0  # end of the write in progress
+        self._cleared_at = 0
+        self._clears: deque[int] = deque()
+        self._chunks: deque[tuple[int, float]] = deque()
+        self._lock = threading.Lock()
+        self._cursors: list[Cursor] = []
+
+    @property
+    def _oldest(self) -> int:
+        return max(0, self._head - self._capacity)
+
+    @property
+    def head(self) -> int:
+        """The number of bytes written so far."""
+        return self._head
+
+    @property
+    def size(self) -> int:
+        return self._head - max(self._oldest, self._cleared_at)
+
+    def write(
+        self, data: RenderableType | bytes, *, timestamp: float | None = None
+    ) -> None:
+        """Append output, or clear the buffer when given a `Control`."""
+        if isinstance(data, Control):
+            self._clear()
+            return
+        if isinstance(data, str):
+            data = data.encode()
+        elif not isinstance(data, bytes):
+            return
+        if not data:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self._lock:
+            start, size = self._head, len(data)
+            if start + size > self._capacity:
+                self._grow(start + size)
+            self._reserved = start + size
+            self._copy_in(start, data)
+            self._head = start + size
+
+            self._chunks.append((start, timestamp))
+            oldest = self._oldest
+            while len(self._chunks) > 1 and self._chunks[1][0] <= oldest:
+                self._chunks.popleft()
+            while self._clears and self._clears[0] < oldest:
+                self._clears.popleft()
+            cursors = list(self._cursors)
+
+        self._wake(cursors, start, size)
+
+    def _wake(self, cursors: list[Cursor], start: int, size: int) -> None:
+        half = self._capacity // 2
+        for cursor in cursors:
+            # wake consumers that had read everything, or that are about to lag
+            behind = start - cursor.position
+            if cursor.on_data is not None and (
+                behind == 0 or behind < half <= behind + size
+            ):
+                cursor.on_data()
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._cleared_at = self._head
+            if not self._clears or self._clears[-1] != self._head:
+                self._clears.append(self._head)
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            if cursor.on_data is not None:
+                cursor.on_data()
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed and capacity < self.limit:
+            capacity = min(capacity * 2, self.limit)
+        if capacity == self._capacity:
+            return
+
+        # the old buffer is left alone, so views into it stay valid
+        oldest = self._oldest
+        views = self._views(oldest, self._head)
+        self._capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        position = oldest
+        for view in views:
+            self._copy_in(position, view)
+            position += len(view)
+
+    def _copy_in(self, position: int, data: bytes | memoryview) -> None:
+        capacity = self._capacity
+        if len(data) > capacity:
+            # only the end of the data fits
+            position += len(data) - capacity
+            data = memoryview(data)[-capacity:]
+        offset = position % capacity
+        first = min(len(data), capacity - offset)
+        self._view[offset : offset + first] = data[:first]
+        if first < len(data):
+            self._view[: len(data) - first] = data[first:]
+
+    def _views(self, start: int, end: int) -> tuple[memoryview, ...]:
+        if start >= end:
+            return ()
+        capacity = self._capacity
+        offset = start % capacity
+        if offset + end - start <= capacity:
+            return (self._view[offset : offset + end - start],)
+        return (self._view[offset:], self._view[: offset + end - start - capacity])
+
+    def chunk_views(
+        self, start: int, end: int
+    ) -> list[tuple[float, tuple[memoryview, ...]]]:
+        with self._lock:
+            bounds: list[tuple[int, float]] = []
+            for chunk_start, timestamp in reversed(self._chunks):
+                if chunk_start < end:
+                    bounds.append((max(chunk_start, start), timestamp))
+                if chunk_start <= start:
+                    break
+            bounds.reverse()
+            ends = [b for b, _ in bounds[1:]] + [end]
+            return [
+                (timestamp, self._views(b, e))
+                for (b, timestamp), e in zip(bounds, ends)
+            ]
+
+    def is_intact(self, position: int) -> bool:
+        """Whether the output at `position` has not been overwritten yet."""
+        return self._reserved - position <= self._capacity
+
+    def read(self, cursor: Cursor, max_bytes: int | None = None) -> Slice | None:
+        with self._lock:
+            lagged = 0
+            cleared = False
+            oldest = self._oldest
+            if cursor.position < oldest:
+                lagged = oldest - cursor.position
+                cursor.lagged += lagged
+                if cursor.clear_seen < self._cleared_at <= oldest:
+                    cleared = True
+                    cursor.clear_seen = self._cleared_at
+                cursor.position = oldest
+
+            end = self._head
+            for position in self._clears:
+                if position < cursor.position or position <= cursor.clear_seen:
+                    continue
+                if position == cursor.position:
+                    cleared = True
+                    cursor.clear_seen = position
+                    continue
+                # a slice never spans a clear
+                end = position
+                break
+
+            if max_bytes is not None:
+                end = min(end, cursor.position + max_bytes)
+            if end == cursor.position and not lagged and not cleared:
+                return None
+
+            start, cursor.position = cursor.position, end
+            return Slice(
+                self,
+                start,
+                end,
+                self._views(start, end),
+                lagged=lagged,
+                cleared=cleared,
+            )
+
+    def cursor(
+        self,
+        *,
+        tail: int | None = None,
+        on_data: Callable[[], Any] | None = None,
+    ) -> Cursor:
+        """Start reading at the last `tail` lines, or at the oldest output.
+
+        `on_data` is called from the writing thread when new output arrives for a
+        cursor that had read everything, and when a cursor falls half the buffer
+        behind. It should only wake the consumer up, which should then read until
+        there is nothing left.
+        """
+        with self._lock:
+            if tail is None:
+                position = max(self._oldest, self._cleared_at)
+            else:
+                position = self._line_start(tail)
+            cursor = Cursor(self, position, on_data)
+            self._cursors.append(cursor)
+        return cursor
+
+    def remove_cursor(self, cursor: Cursor) -> None:
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+
+    def _contents(self) -> tuple[int, bytes]:
+        start = max(self._oldest, self._cleared_at)
+        return start, b"".join(self._views(start, self._head))
+
+    def _line_start(self, lines: int) -> int:
+        if lines <= 0:
+            return self._head
+        start, data = self._contents()
+
+        # a trailing newline ends the last line instead of starting a new one
+        end = len(data) - 1 if data.endswith(b"\n") else len(data)
+        for _ in range(lines):
+            end = data.rfind(b"\n", 0, end)
+            if end < 0:
+                return start
+        return start + end + 1
+
+    def tail(self, lines: int | None = None) -> str:
+        with self._lock:
+            start, data = self._contents()
+            if lines is not None:
+                data = data[self._line_start(lines) - start :]
+        return data.decode(errors="replace")
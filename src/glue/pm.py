@@ -1,76 +1,548 @@
 from __future__ import annotations
 
+import asyncio
+import os
 import threading
+import time
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
 from rich.control import Control
 
+from . import bluegreen
+from .activation import SocketActivator
+from .compat import tomllib
+from .config import InProcessProxyConfig
+from .logfiles import LogWriter
+from .logindex import LogIndex
+from .output import OutputBuffer
+from .ports import PortTable, ports_path
 from .pty import Process, spawn
+from .typecast import TypeCastError
+from .utils import DirResolver
+from .watch import FileWatcher, WatchRule
+from .zygote import Zygote
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Mapping
 
-    from rich.console import RenderableType
-
-    from glue.config import Config, ServiceConfig
+    from glue.config import Config, ConfigDiff, ServiceConfig
+    from glue.control.coordinator import AgentLink, AgentServiceInstance
     from glue.utils import Dirs
+    from glue.warmup import ProxyPassServer, WarmupResult
+    from glue.web.inprocess import InProcessProxy
+
+ROOT_SERVICE = ":root:"
 
 
 class ServiceManager:
     def __init__(self, dirs: Dirs, config: Config) -> None:
+        self.dirs = dirs
         self.config = config
-        self.services = {
-            svc.name: ServiceInstance(dirs / svc.name, svc) for svc in config.services
+        self.ports = PortTable(ports_path(dirs))
+        self.resolver = DirResolver(self._service_dirs(config), config.services)
+        self.agents: dict[str, AgentLink] = {}
+        self.services: dict[str, ServiceInstance | AgentServiceInstance] = {
+            svc.name: self._create_instance(svc) for svc in config.services
         }
+        self._proxy: InProcessProxy | None = None
+        self.watcher = FileWatcher.for_services(self.services.values())
+        self.on_change: list[Callable[[ConfigDiff], None]] = []
+        self._config_rule: WatchRule | None = None
+        self._reload_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _service_dirs(self, config: Config) -> dict[str, Dirs]:
+        # ports are allocated before anything resolves the variables of services
+        self.ports.allocate(svc.name for svc in config.services if svc.allocate_port)
+        return {svc.name: self._dirs_for(svc) for svc in config.services}
+
+    def _dirs_for(self, config: ServiceConfig) -> Dirs:
+        return (self.dirs / config.name).with_port(self.ports.get(config.name))
+
+    def _agent_link(self, name: str) -> AgentLink | None:
+        from .control.coordinator import AgentLink
+
+        link = self.agents.get(name)
+        agent = self.config.agents.get(name)
+        if link is not None and link.config != agent:
+            link.close()
+            link = None
+        if link is None and agent is not None:
+            link = self.agents[name] = AgentLink(name, agent, self.resolver)
+        return link
+
+    def _create_instance(
+        self, config: ServiceConfig
+    ) -> ServiceInstance | AgentServiceInstance:
+        dirs = self._dirs_for(config)
+        svc: ServiceInstance | AgentServiceInstance
+        if config.agent is not None:
+            from .control.coordinator import AgentServiceInstance
+
+            svc = AgentServiceInstance(dirs, config, self._agent_link(config.agent))
+        elif isinstance(config, InProcessProxyConfig):
+            svc = ServiceInstance(
+                dirs, config, spawner=lambda: self._spawn_proxy(config)
+            )
+        else:
+            svc = ServiceInstance(dirs, config)
+        svc.on_restart.append(lambda: self.warm_up(config.name))
+        return svc
+
+    def _spawn_proxy(self, config: InProcessProxyConfig) -> Process:
+        from .faults import FaultSwitches, switches_path
+        from .streams import metrics_path
+        from .warmup import HotPathTable, hot_paths_path
+        from .web.inprocess import InProcessProxy
+
+        # built from the current config, in case the service was reconfigured
+        proxy = InProcessProxy(
+            self.config,
+            self.resolver,
+            host=config.host,
+            port=config.port,
+            record_dir=self.dirs.state_dir / "recordings",
+            switches=FaultSwitches(switches_path(self.dirs)),
+            hot_paths=HotPathTable(hot_paths_path(self.dirs)),
+            streams_metrics=metrics_path(self.dirs),
+        )
+        proxy.start()
+        self._proxy = proxy
+        return proxy
+
+    def warm_up(self, name: str) -> None:
+        """Replay the hottest paths of the servers in front of a restarted service.
+
+        The paths are fetched from a background thread, once the service accepts
+        connections. Socket activated services are left idle.
+        """
+        from .warmup import hot_paths_path, load_hot_paths, servers_in_front_of
+
+        svc = self.services.get(name)
+        if svc is None or svc.config.listen is not None:
+            return
+        hot = load_hot_paths(hot_paths_path(self.dirs))
+        jobs = {
+            host: (server, paths[: server.warmup.paths])
+            for host, server in servers_in_front_of(self.config, name).items()
+            if server.warmup is not None and (paths := hot.get(host))
+        }
+        if jobs:
+            threading.Thread(
+                target=self._warm_up,
+                args=(svc, jobs),
+                name=f"glue-warmup-{name}",
+                daemon=True,
+            ).start()
+
+    def _warm_up(
+        self,
+        svc: ServiceInstance | AgentServiceInstance,
+        jobs: dict[str, tuple[ProxyPassServer, list[str]]],
+    ) -> None:
+        from .warmup import warm_up
+
+        async def run() -> list[WarmupResult]:
+            return await asyncio.gather(
+                *(
+                    warm_up(server, host, paths, self.resolver)
+                    for host, (server, paths) in jobs.items()
+                )
+            )
+
+        try:
+            results = asyncio.run(run())
+        except (KeyError, ValueError) as e:
+            svc.output.write(f"Failed to warm up {svc.config.name}: {e}\n")
+            return
+        for (host, (_, paths)), result in zip(jobs.items(), results):
+            svc.output.write(
+                f"Warmed up {host} with {result.fetched} of {len(paths)} hot paths "
+                f"in {result.elapsed:.1f}s\n"
+            )
+
+    def start(self) -> None:
+        """Start every service from a background thread."""
+        threading.Thread(
+            target=self._start_all, name="glue-startup", daemon=True
+        ).start()
+
+    def _start_all(self) -> None:
+        for svc in self.services.values():
+            if self._stopping.is_set():
+                return
+            svc.start()
+
+    def start_watcher(self) -> None:
+        self.watcher.start()
+
+    def watch_config(self, path: Path, load: Callable[[], Config]) -> None:
+        """Apply changes to the config file at `path`, as read by `load`.
+
+        Must be called before `start_watcher`.
+        """
+        self._config_rule = WatchRule(
+            name=":config:",
+            roots=[path.absolute()],
+            include=[],
+            ignore=[],
+            debounce=0.2,
+            callback=lambda: self.reload_config(load),
+        )
+        self.watcher.rules.append(self._config_rule)
+
+    def _report(self, message: str) -> None:
+        # the proxy serves the config, so its output is where problems show up
+        svc = self.services.get(ROOT_SERVICE) or next(
+            iter(self.services.values()), None
+        )
+        if svc is not None:
+            svc.output.write(message)
+
+    def reload_config(self, load: Callable[[], Config]) -> None:
+        try:
+            config = load()
+        except (OSError, TypeCastError, tomllib.TOMLDecodeError) as e:
+            self._report(
+                f"Failed to reload the config, keeping the current one:\n{e}\n"
+            )
+            return
+        self.apply_config(config)
+
+    def apply_config(self, config: Config) -> ConfigDiff:
+        """Bring the running services in line with `config`.
+
+        Services are compared by name, and only the ones that were added, removed
+        or changed are started, stopped or restarted. Changed services keep their
+        output, so their log screens keep working across the restart.
+        """
+        with self._reload_lock:
+            diff = self.config.diff(config)
+            self.config = config
+            if not diff:
+                return diff
+
+            self.resolver.update(self._service_dirs(config), config.services)
+            if self._proxy is not None and self._proxy.is_running():
+                try:
+                    self._proxy.apply_config(config)
+                except ValueError as e:
+                    self._report(f"Failed to update the routes, keeping them:\n{e}\n")
+            if diff.added or diff.removed or diff.changed:
+                self._apply_services(config, diff)
+
+        for listener in self.on_change:
+            listener(diff)
+        return diff
+
+    def _apply_services(self, config: Config, diff: ConfigDiff) -> None:
+        for name in diff.removed:
+            svc = self.services[name]
+            svc.shutdown()
+            svc.close()
+
+        services = {}
+        for svc_config in config.services:
+            name = svc_config.name
+            if name in diff.added:
+                services[name] = self._create_instance(svc_config)
+                continue
+            svc = services[name] = self.services[name]
+            if name in diff.changed:
+                svc.output.write(f"\nThe config of {name} changed, restarting\n")
+                svc.dirs = self._dirs_for(svc_config)
+                svc.reconfigure(svc_config)
+
+        self.services = services
+        self._replace_watcher()
+
+        if not self._stopping.is_set():
+            for name in diff.added:
+                services[name].start()
+
+    def _replace_watcher(self) -> None:
+        # called from one of the watcher's own timers, which stop() does not join
+        old = self.watcher
+        running = old.running
+        self.watcher = FileWatcher.for_services(self.services.values())
+        if self._config_rule is not None:
+            self.watcher.rules.append(self._config_rule)
+        # restarts that other services had scheduled still happen
+        self.watcher.take_over(old)
+        if running and not self._stopping.is_set():
+            self.watcher.start()
 
     def shutdown(self) -> None:
+        self._stopping.set()
+        self.watcher.stop()
         for svc in self.services.values():
             svc.shutdown()
+        for svc in self.services.values():
+            svc.close()
+        for link in self.agents.values():
+            link.close()
 
 
 class ServiceInstance:
-    def __init__(self, dirs: Dirs, config: ServiceConfig) -> None:
+    def __init__(
+        self,
+        dirs: Dirs,
+        config: ServiceConfig,
+        *,
+        spawner: Callable[[], Process] | None = None,
+    ) -> None:
         self.dirs = dirs
         self.config = config
+        # runs the service without spawning a command, such as an in-process proxy
+        self.spawner = spawner
+        self.output = OutputBuffer()
+        self.log = (
+            LogWriter.from_config(self.output, dirs.state_dir / "logs", config.log)
+            if config.log.enabled
+            else None
+        )
+        self.index = LogIndex.for_service(self.output, config)
+        self.zygote = Zygote.for_service(dirs, config, self.output)
         self.process: Process | None = None
+        self.activator: SocketActivator | None = None
+        self.slot: str | None = None
+        # called once the service was restarted, such as to warm it up
+        self.on_restart: list[Callable[[], None]] = []
+        self._restart_lock = threading.Lock()
+        # set by shutdown() to give up a blue-green restart in progress
+        self._cancel_restart = threading.Event()
+
+    def profile_label(self, f_locals: Mapping[str, Any]) -> str:  # noqa: ARG002
+        return f"service {self.config.name}"
+
+    @property
+    def slot_dirs(self) -> Dirs:
+        return self.dirs.with_slot(self.slot)
+
+    @property
+    def status(self) -> str:
+        if self.process is not None:
+            return "running" if self.process.is_running() else "exited"
+        if self.activator is not None:
+            return "waiting"
+        return "stopped"
+
+    @property
+    def blue_green(self) -> bool:
+        # both slots would need the same port
+        return (
+            self.config.blue_green
+            and self.config.listen is None
+            and not self.config.allocate_port
+        )
+
+    def reconfigure(self, config: ServiceConfig) -> None:
+        """Switch to a new config, restarting the service if it was started."""
+        started = self.process is not None or self.activator is not None
+        if config.log != self.config.log:
+            if self.log is not None:
+                self.log.close()
+            self.log = (
+                LogWriter.from_config(
+                    self.output, self.dirs.state_dir / "logs", config.log
+                )
+                if config.log.enabled
+                else None
+            )
+        if config.parser != self.config.parser:
+            if self.index is not None:
+                self.index.close()
+            self.index = LogIndex.for_service(self.output, config)
+        # the interpreter, module or env of the zygote may have changed
+        if self.zygote is not None:
+            self.zygote.close()
+        self.zygote = Zygote.for_service(self.dirs, config, self.output)
+        # a blue-green restart keeps serving the old config until the new one is up
+        if not self.blue_green or config.listen is not None:
+            self.shutdown()
+        self.config = config
+        if started:
+            self.restart()
+
+    def close(self) -> None:
+        """Save and index the remaining output, and stop the zygote, once removed."""
+        if self.log is not None:
+            self.log.close()
+        if self.index is not None:
+            self.index.close()
+        if self.zygote is not None:
+            self.zygote.close()
 
     def shutdown(self) -> None:
+        # wait for a blue-green restart to give up, so its process is not left behind
+        self._cancel_restart.set()
+        with self._restart_lock:
+            self._cancel_restart.clear()
+            if self.activator is not None:
+                self.activator.stop()
+                self.activator = None
+            self.stop_process()
+
+    def stop_process(self) -> None:
         if self.process is not None:
             self.process.stop()
             self.process = None
 
-    def restart(self, write: Callable[[RenderableType], Any]) -> None:
+    def restart(self) -> None:
+        if self.blue_green and self.process is not None:
+            threading.Thread(target=self._blue_green_restart, daemon=True).start()
+            return
+
         self.shutdown()
-        self.start(write)
+        self.start()
+        self._restarted()
 
-    def start(self, write: Callable[[RenderableType], Any]) -> None:
-        if self.process is not None:
+    def _restarted(self) -> None:
+        for callback in self.on_restart:
+            callback()
+
+    def _blue_green_restart(self) -> None:
+        write = self.output.write
+        if not self._restart_lock.acquire(blocking=False):
+            write("A restart is already in progress\n")
+            return
+
+        try:
+            old_process, old_dirs = self.process, self.slot_dirs
+            new_slot = bluegreen.other_slot(self.slot)
+            new_dirs = self.dirs.with_slot(new_slot)
+
+            bluegreen.reset_slot(new_dirs)
+            write(f"Starting {new_slot} instance\n")
+            process = self._spawn_process(new_dirs)
+
+            ready = self.config.ready and new_dirs.resolve_vars(self.config.ready)
+            is_ready = bluegreen.wait_until_ready(
+                process,
+                new_dirs.runtime_dir,
+                ready,
+                self.config.ready_timeout,
+                cancel=self._cancel_restart,
+            )
+            if self._cancel_restart.is_set():
+                write(f"Shutting down, stopping the {new_slot} instance\n")
+                process.stop()
+                return
+            if not is_ready:
+                write(f"The {new_slot} instance did not become ready, stopping it\n")
+                process.stop()
+                return
+
+            bluegreen.switch_slot(self.dirs, new_slot)
+            self.process, self.slot = process, new_slot
+            self._restarted()
+
+            if old_process is not None:
+                write(f"Switched to {new_slot}, draining {old_dirs.slot}\n")
+                bluegreen.wait_until_drained(
+                    old_dirs.runtime_dir,
+                    self.config.drain_timeout,
+                    cancel=self._cancel_restart,
+                )
+                old_process.stop()
+        finally:
+            self._restart_lock.release()
+
+    def start(self) -> None:
+        if self.process is not None or self.activator is not None:
             return
 
+        write = self.output.write
         write(Control.clear())
 
-        self.dirs.runtime_dir.mkdir(parents=True, exist_ok=True)
         self.dirs.state_dir.mkdir(parents=True, exist_ok=True)
-        command = self.dirs.resolve_vars_list(self.config.resolve_command())
+        if self.blue_green:
+            self.slot = bluegreen.other_slot(None)
+            bluegreen.reset_slot(self.slot_dirs)
+            bluegreen.switch_slot(self.dirs, self.slot)
+        else:
+            self.dirs.runtime_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.config.listen is None:
+            self.spawn()
+            return
+
+        address = self.dirs.resolve_vars(self.config.listen)
+
+        def on_activate(listen_fd: int) -> Process:
+            if self.process is not None and not self.process.is_running():
+                self.process = None
+            return self.spawn(listen_fd=listen_fd)
 
-        write(f"$ cd {self.config.cwd} && {' '.join(command)}\n")
+        def on_idle() -> None:
+            self.stop_process()
+            write(f"Stopped after being idle. Waiting for connections on {address}\n")
 
-        self.process = process = spawn(
-            command,
-            cwd=Path(self.config.cwd).resolve(),
+        def on_exit(delay: float) -> None:
+            write(f"Exited, starting again on connections in {delay:g}s\n")
+
+        self.activator = SocketActivator(
+            address,
+            idle_timeout=self.config.idle_timeout,
+            on_activate=on_activate,
+            on_idle=on_idle,
+            on_exit=on_exit,
         )
+        self.activator.start()
+        write(f"Waiting for connections on {address}\n")
+
+    def spawn(self, *, listen_fd: int | None = None) -> Process:
+        if self.process is None:
+            self.process = self._spawn_process(self.slot_dirs, listen_fd=listen_fd)
+        return self.process
+
+    def _spawn_process(self, dirs: Dirs, *, listen_fd: int | None = None) -> Process:
+        write = self.output.write
+        if self.spawner is not None:
+            write(f"Starting {self.config.name} in the glue process\n")
+            process = self.spawner()
+        else:
+            command = dirs.resolve_vars_list(self.config.resolve_command())
+            env = None if dirs.port is None else {**os.environ, "PORT": str(dirs.port)}
+            forked = None
+            # socket activated services get their socket from a shim instead
+            if self.zygote is not None and listen_fd is None:
+                args = dirs.resolve_vars_list(self.config.args)
+                forked = self.zygote.fork(args, os.environ if env is None else env)
+            if forked is not None:
+                write(f"$ {' '.join(command)} (forked from the zygote)\n")
+                process = forked
+            else:
+                write(f"$ cd {self.config.cwd} && {' '.join(command)}\n")
+                process = spawn(
+                    command,
+                    cwd=Path(self.config.cwd).resolve(),
+                    env=env,
+                    listen_fd=listen_fd,
+                )
 
         def target() -> None:
             data = b""
-            while process.is_running():
-                if data := process.read(1024):
-                    write(data.decode())
+            # read to the end of the output, which outlasts the process, so the
+            # last words of one that exits at once are kept
+            while True:
+                try:
+                    chunk = process.read(1024)
+                except (OSError, EOFError):  # winpty raises once the process exits
+                    break
+                if not chunk:
+                    break
+                data = chunk
+                # consumers decode the raw output themselves
+                write(data, timestamp=time.monotonic())
             if not data.endswith(b"\n"):
                 write("%")
 
         t = threading.Thread(target=target, daemon=True)
         t.start()
 
+        return process
+
     def __del__(self) -> None:
         self.shutdown()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+    from .utils import Dirs
+
+__all__ = ["PortTable", "load_ports", "ports_path"]
+
+
+def ports_path(dirs: Dirs) -> Path:
+    return dirs.runtime_dir / "ports.json"
+
+
+def load_ports(path: Path) -> dict[str, int]:
+    """Read the ports allocated by a running glue, such as from the proxy."""
+    try:
+        ports = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return {name: port for name, port in ports.items() if isinstance(port, int)}
+
+
+def _is_free(host: str, port: int) -> bool:
+    with socket.socket() as sock:
+        # like the servers that will bind it, ignore connections in TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port: int = sock.getsockname()[1]
+    return port
+
+
+class PortTable:
+    """Free TCP ports allocated to the services of a glue instance.
+
+    Ports are picked by the kernel, and written to `path` for proxies running
+    in a process of their own. A service keeps its port for as long as glue
+    runs, and the next glue run hands out the same ports again where they are
+    still free, so bookmarks keep working across restarts.
+    """
+
+    def __init__(self, path: Path, *, host: str = "127.0.0.1") -> None:
+        self.path = path
+        self.host = host
+        self.ports: dict[str, int] = {}
+        self._previous = load_ports(path)
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> int | None:
+        return self.ports.get(name)
+
+    def allocate(self, names: Iterable[str]) -> dict[str, int]:
+        """Allocate ports to `names`, releasing those of every other service."""
+        with self._lock:
+            ports: dict[str, int] = {}
+            for name in names:
+                port = self.ports.get(name)
+                if port is None:
+                    # ports of other services are reserved, but not bound yet
+                    taken = {*ports.values(), *self.ports.values()}
+                    port = self._previous.pop(name, None)
+                    if port is not None and (
+                        port in taken or not _is_free(self.host, port)
+                    ):
+                        port = None
+                    while port is None or port in taken:
+                        port = _free_port(self.host)
+                ports[name] = port
+            if ports != self.ports or not self.path.exists():
+                self.ports = ports
+                self._save()
+            return dict(ports)
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps(self.ports, indent=2))
+        # proxies never see a half-written file
+        tmp.replace(self.path)
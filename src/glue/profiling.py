@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+    from types import CodeType, FrameType
+
+__all__ = [
+    "PROFILE_ENV",
+    "LoopMonitor",
+    "Profiler",
+    "Sampler",
+    "Stall",
+    "get_profiler",
+    "start_profiler",
+    "stop_profiler",
+    "watch_running_loop",
+]
+
+logger = logging.getLogger("glue.profile")
+
+# set to the slow callback threshold to profile child processes such as the proxy
+PROFILE_ENV = "GLUE_PROFILE"
+
+Stack = tuple["CodeType", ...]
+
+
+def _frame_name(code: CodeType) -> str:
+    # qualified names need python 3.11
+    name: str = getattr(code, "co_qualname", code.co_name)
+    return name
+
+
+def _walk(frame: FrameType | None) -> Stack:
+    """Return the code objects of a stack, outermost first."""
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return tuple(codes)
+
+
+def _attribute(frame: FrameType | None) -> str | None:
+    """Find the innermost object on the stack that can tell what it is working on.
+
+    Objects opt in with a `profile_label(f_locals)` method, such as the proxy of a
+    vhost or a service instance.
+    """
+    while frame is not None:
+        label = getattr(frame.f_locals.get("self"), "profile_label", None)
+        if callable(label):
+            result: str = label(frame.f_locals)
+            return result
+        frame = frame.f_back
+    return None
+
+
+class Sampler:
+    """A statistical profiler that periodically samples the stack of every thread.
+
+    Only code objects are recorded, so a sample costs a walk of each stack and a
+    counter update. Identical stacks are counted once, keyed by thread name.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: Counter[tuple[str, Stack]] = Counter()
+        self.started = 0.0
+        self.duration = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="glue-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.duration = time.monotonic() - self.started
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            self.sample(skip=own)
+
+    def sample(self, *, skip: int | None = None) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():  # noqa: SLF001
+            if ident != skip:
+                self.samples[names.get(ident, str(ident)), _walk(frame)] += 1
+
+    def collapsed(self) -> str:
+        """Render the samples in the collapsed stack format of flamegraph.pl."""
+        lines = []
+        for (thread, stack), count in sorted(
+            self.samples.items(), key=lambda item: item[0][0]
+        ):
+            frames = ";".join([thread, *(_frame_name(code) for code in stack)])
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict[str, Any]:
+        """Render the samples as a speedscope file with a profile per thread."""
+        frames: list[dict[str, Any]] = []
+        index: dict[CodeType, int] = {}
+        profiles: dict[str, dict[str, Any]] = {}
+
+        for (thread, stack), count in self.samples.items():
+            for code in stack:
+                if code not in index:
+                    index[code] = len(frames)
+                    frames.append(
+                        {
+                            "name": _frame_name(code),
+                            "file": code.co_filename,
+                            "line": code.co_firstlineno,
+                        }
+                    )
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append([index[code] for code in stack])
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "glue",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+@dataclass
+class Stall:
+    loop: str
+    duration: float
+    """Seconds from the moment the loop was pinged until it answered."""
+    label: str | None
+    """What the blocked code was working on, such as a vhost or a service."""
+    stack: list[str]
+
+    def __str__(self) -> str:
+        where = f" in {self.label}" if self.label else ""
+        lines = [f"The {self.loop} loop was blocked for {self.duration:.3f}s{where}:"]
+        lines.extend(f"  {line}" for line in self.stack)
+        return "\n".join(lines)
+
+
+class LoopMonitor:
+    """Detects callbacks that keep an event loop from running other work.
+
+    A watchdog thread pings the loop every `threshold / 2` seconds. When the loop
+    takes longer than `threshold` to answer, the stack of the loop's thread is
+    captured while it is still blocked and reported once the loop is back.
+    Unlike the loop's own debug mode, this costs nothing on the loop itself.
+
+    Must be created from the thread running the loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        threshold: float,
+        report: Callable[[Stall], None],
+    ) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.report = report
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"glue-monitor:{name}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _running(self) -> bool:
+        return not self._stopped.is_set() and self.loop.is_running()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.threshold / 2):
+            answered = threading.Event()
+            started = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # the loop was closed
+            if answered.wait(self.threshold):
+                continue
+
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            label = _attribute(frame)
+            stack = [
+                f"{_frame_name(code)} ({code.co_filename}:{code.co_firstlineno})"
+                for code in _walk(frame)
+            ]
+            del frame
+            while not answered.wait(0.1):
+                if not self._running():
+                    return
+            self.report(Stall(self.name, time.monotonic() - started, label, stack))
+
+
+class Profiler:
+    """Samples every thread of the process and watches its event loops for stalls.
+
+    `stop` writes the samples to `directory` in speedscope and collapsed stack
+    formats, along with a report of the stalls, named after `name` and the pid so
+    that several processes can profile into the same directory.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        name: str,
+        interval: float = 0.01,
+        slow_callback: float = 0.1,
+    ) -> None:
+        self.directory = directory
+        self.name = name
+        self.slow_callback = slow_callback
+        self.sampler = Sampler(interval)
+        self.stalls: list[Stall] = []
+        self._monitors: list[LoopMonitor] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.sampler.start()
+
+    def watch_loop(self, name: str) -> None:
+        """Watch the running event loop for stalls. Call from the loop's thread."""
+        monitor = LoopMonitor(name, self.slow_callback, self._report)
+        with self._lock:
+            self._monitors.append(monitor)
+        monitor.start()
+
+    def _report(self, stall: Stall) -> None:
+        with self._lock:
+            self.stalls.append(stall)
+        logger.warning("%s", stall)
+
+    def stop(self) -> list[Path]:
+        """Stop profiling and return the files that were written."""
+        with self._lock:
+            monitors, self._monitors = self._monitors, []
+        for monitor in monitors:
+            monitor.stop()
+        self.sampler.stop()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{os.getpid()}"
+        speedscope = self.directory / f"{stem}.speedscope.json"
+        speedscope.write_text(json.dumps(self.sampler.speedscope(self.name)))
+        collapsed = self.directory / f"{stem}.collapsed"
+        collapsed.write_text(self.sampler.collapsed())
+        paths = [speedscope, collapsed]
+
+        if self.stalls:
+            stalls = self.directory / f"{stem}.stalls.txt"
+            stalls.write_text("\n\n".join(str(stall) for stall in self.stalls) + "\n")
+            paths.append(stalls)
+        return paths
+
+
+_profiler: Profiler | None = None
+
+
+def start_profiler(directory: Path, *, name: str, slow_callback: float) -> Profiler:
+    """Start the profiler of this process, which is shared by all its event loops."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(directory, name=name, slow_callback=slow_callback)
+        _profiler.start()
+    return _profiler
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+def stop_profiler() -> list[Path]:
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler.stop() if profiler is not None else []
+
+
+def watch_running_loop(name: str) -> None:
+    """Watch the running event loop for stalls, if this process is being profiled."""
+    if _profiler is not None:
+        _profiler.watch_loop(name)
@@ -3,16 +3,20 @@ from __future__ import annotations
 import os
 from typing import TYPE_CHECKING, Protocol
 
+from ._master import PtyMaster
+
 if os.name == "nt":
     from ._winpty import spawn as _spawn
 else:
     from ._unixpty import spawn as _spawn
 
 
-__all__ = ["spawn", "Process"]
+__all__ = ["spawn", "Process", "PtyMaster"]
 
 
 class Process(Protocol):
+    @property
+    def pid(self) -> int: ...
     def is_running(self) -> bool: ...
     def read(self, length: int) -> bytes: ...
     def write(self, data: bytes) -> None: ...
@@ -27,6 +31,7 @@ if TYPE_CHECKING:
         *,
         cwd: os.PathLike,
         env: Mapping[str, str] | None = None,
+        listen_fd: int | None = None,
     ) -> Process: ...
 else:
     spawn = _spawn
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import errno
+import os
+import select
+import threading
+
+
+class PtyMaster:
+    """The master side of a process's pty, closed once its output is read.
+
+    The thread reading the output holds the lock while it waits for data, so the
+    fd is never closed, and its number reused, under it. Closing it from another
+    thread keeps the output that is left, for the reader to pick up.
+    """
+
+    def __init__(self, fd: int) -> None:
+        self.fd: int | None = fd
+        self._rest = b""
+        self._lock = threading.Lock()
+
+    def read(self, length: int) -> bytes:
+        """Read the output, returning `b""` once the process exited and all was read."""
+        with self._lock:
+            if self.fd is None:
+                data, self._rest = self._rest[:length], self._rest[length:]
+                return data
+            try:
+                data = os.read(self.fd, length)
+            except OSError as e:
+                # linux reports the end of the output as EIO
+                if e.errno != errno.EIO:
+                    raise
+                data = b""
+            if not data:
+                self._close()
+            return data
+
+    def write(self, data: bytes) -> int:
+        fd = self.fd
+        if fd is None:
+            raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        return os.write(fd, data)
+
+    def close(self) -> None:
+        """Close the pty of an exited process, unless a reader is waiting on it."""
+        if not self._lock.acquire(blocking=False):
+            return  # the reader closes it at the end of the output
+        try:
+            while self.fd is not None and select.select([self.fd], [], [], 0)[0]:
+                try:
+                    chunk = os.read(self.fd, 65536)
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                self._rest += chunk
+            self._close()
+        finally:
+            self._lock.release()
+
+    def _close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self) -> None:
+        self._close()
@@ -6,6 +6,8 @@ import signal
 import subprocess
 from typing import TYPE_CHECKING
 
+from ._master import PtyMaster
+
 if TYPE_CHECKING:
     from collections.abc import Mapping
 
@@ -13,16 +15,23 @@ if TYPE_CHECKING:
 class _UnixProcess:
     def __init__(self, process: subprocess.Popen[bytes], master_fd: int) -> None:
         self.process = process
-        self.master_fd = master_fd
+        self.pty = PtyMaster(master_fd)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
 
     def is_running(self) -> bool:
-        return self.process.poll() is None
+        if self.process.poll() is None:
+            return True
+        self.pty.close()
+        return False
 
     def read(self, length: int) -> bytes:
-        return os.read(self.master_fd, length)
+        return self.pty.read(length)
 
     def write(self, data: bytes) -> int:
-        return os.write(self.master_fd, data)
+        return self.pty.write(data)
 
     def stop(self) -> None:
         self.process.send_signal(signal.SIGINT)
@@ -31,6 +40,12 @@ class _UnixProcess:
         except subprocess.TimeoutExpired:
             self.process.kill()
             self.process.wait()
+        self.pty.close()
+
+
+# Moves the socket passed as stdin to fd 3 and sets LISTEN_PID to the pid of the
+# process that ends up being exec'd, as expected by sd_listen_fds(3).
+_LISTEN_FDS_SHIM = 'exec 3<&0 0</dev/null; LISTEN_PID=$$ exec "$0" "$@"'
 
 
 def spawn(
@@ -38,14 +53,23 @@ def spawn(
     *,
     cwd: os.PathLike,
     env: Mapping[str, str] | None = None,
+    listen_fd: int | None = None,
 ) -> _UnixProcess:
+    stdin: int = subprocess.DEVNULL
+    if listen_fd is not None:
+        argv = ["/bin/sh", "-c", _LISTEN_FDS_SHIM, *argv]
+        env = {**(os.environ if env is None else env), "LISTEN_FDS": "1"}
+        stdin = listen_fd
+
     master_fd, slave_fd = pty.openpty()
     process = subprocess.Popen(  # noqa: S603
         argv,
         cwd=cwd,
         env=env,
-        stdin=subprocess.DEVNULL,
+        stdin=stdin,
         stdout=slave_fd,
         stderr=slave_fd,
     )
+    # only the process holds the slave, so reads see the end of its output
+    os.close(slave_fd)
     return _UnixProcess(process, master_fd)
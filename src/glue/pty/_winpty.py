@@ -16,6 +16,7 @@ if TYPE_CHECKING:
 
         class PtyProcess:
             delayafterclose: int
+            pid: int
 
             @classmethod
             def spawn(
@@ -37,6 +38,10 @@ class _WinProcess:
     def __init__(self, process: PtyProcess) -> None:
         self.process = process
 
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
     def is_running(self) -> bool:
         return self.process.isalive()
 
@@ -56,7 +61,12 @@ def spawn(
     *,
     cwd: os.PathLike,
     env: Mapping[str, str] | None = None,
+    listen_fd: int | None = None,
 ) -> _WinProcess:
+    if listen_fd is not None:
+        msg = "socket activation is not supported on Windows"
+        raise NotImplementedError(msg)
+
     process = PtyProcess.spawn(argv, cwd=cwd, env=env)
     process.delayafterclose = 5
     return _WinProcess(process)
@@ -0,0 +1,170 @@
+"""Forks copies of a Python service from an interpreter that has its imports done.
+
+Started by `glue.zygote` with the service's own interpreter, which may not have
+glue installed, so this only uses the standard library. The arguments are the
+socket to listen on and the modules to import before listening.
+
+Every connection asks for one thing, as a JSON line: `info` about the
+interpreter, or to `fork` a service with the pty passed along as a file
+descriptor. A fork is answered with the pid of the child, and once the child
+exits, with its exit code. The zygote exits when its stdin is closed.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import importlib
+import json
+import os
+import runpy
+import selectors
+import signal
+import socket
+import sys
+import sysconfig
+import termios
+from pathlib import Path
+from typing import Any
+
+
+def _send(conn: socket.socket, message: dict[str, Any]) -> None:
+    with contextlib.suppress(OSError):
+        conn.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _receive(conn: socket.socket) -> tuple[dict[str, Any], list[int]]:
+    data, fds, _, _ = socket.recv_fds(conn, 65536, 1)
+    while data and not data.endswith(b"\n"):
+        more = conn.recv(65536)
+        if not more:
+            break
+        data += more
+    return json.loads(data or b"{}"), fds
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _fork(
+    conn: socket.socket, children: dict[int, socket.socket]
+) -> dict[str, Any] | None:
+    """Answer a request; returns the request in the child when it forks."""
+    try:
+        request, fds = _receive(conn)
+    except (OSError, ValueError):
+        conn.close()
+        return None
+    if request.get("type") == "info":
+        paths = sysconfig.get_paths()
+        _send(conn, {"paths": [paths["purelib"], paths["platlib"]]})
+        conn.close()
+        return None
+    if len(fds) != 1:
+        _send(conn, {"error": "A fork needs a pty"})
+        conn.close()
+        return None
+
+    pid = os.fork()
+    if pid == 0:
+        for other in children.values():
+            other.close()
+        conn.close()
+        return {**request, "tty": fds[0]}
+
+    os.close(fds[0])
+    _send(conn, {"pid": pid})
+    children[pid] = conn
+    return None
+
+
+def serve(path: str, preload: list[str]) -> dict[str, Any] | None:
+    """Answer requests until stdin is closed; only returns in a forked child."""
+    # like `python -m`, instead of the directory this file is in
+    sys.path[0] = str(Path.cwd())
+    for module in preload:
+        importlib.import_module(module)
+
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.listen()
+
+    stdin = sys.stdin.fileno()
+    selector = selectors.DefaultSelector()
+    for fileobj in (server, wakeup_r, stdin):
+        selector.register(fileobj, selectors.EVENT_READ)
+    children: dict[int, socket.socket] = {}
+
+    child = None
+    while child is None:
+        for key, _ in selector.select():
+            if key.fd == stdin and not os.read(stdin, 1024):
+                # glue is gone; forked services are in sessions of their own
+                return None
+            if key.fd == wakeup_r:
+                os.read(wakeup_r, 1024)
+                _reap(children)
+            elif key.fileobj is server:
+                child = _fork(server.accept()[0], children)
+                if child is not None:
+                    break
+
+    selector.close()
+    server.close()
+    for fd in (wakeup_r, wakeup_w):
+        os.close(fd)
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    return child
+
+
+def _reap(children: dict[int, socket.socket]) -> None:
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is not None:
+            _send(conn, {"exit": _exit_code(status)})
+            conn.close()
+
+
+def become(request: dict[str, Any]) -> None:
+    """Turn the forked child into the service, attached to its pty."""
+    os.setsid()
+    tty = request["tty"]
+    fcntl.ioctl(tty, termios.TIOCSCTTY, 0)
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    os.dup2(tty, 1)
+    os.dup2(tty, 2)
+    for fd in (null, tty):
+        os.close(fd)
+    # the streams were opened for the zygote's pipes, so buffer them for a tty
+    sys.stdin = open(0, closefd=False)  # noqa: SIM115
+    sys.stdout = open(1, "w", buffering=1, closefd=False)  # noqa: SIM115
+    sys.stderr = open(2, "w", buffering=1, closefd=False)  # noqa: SIM115
+
+    os.chdir(request["cwd"])
+    sys.path[0] = str(Path.cwd())
+    os.environ.clear()
+    os.environ.update(request["env"])
+    sys.argv = ["-m", *request["args"]]
+
+
+if __name__ == "__main__":
+    child = serve(sys.argv[1], sys.argv[2:])
+    if child is not None:
+        become(child)
+        runpy.run_module(child["module"], run_name="__main__", alter_sys=True)
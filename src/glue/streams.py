@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .activation import bind_listener
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Coroutine, Mapping
+    from typing import Any
+
+    from .config import StreamServer
+    from .utils import Dirs, VarResolver
+
+__all__ = [
+    "CAN_SPLICE",
+    "StreamGroup",
+    "StreamMetrics",
+    "StreamProxy",
+    "metrics_path",
+    "open_connection",
+]
+
+# the proxy runs streams, so their messages go wherever the proxy's log goes
+logger = logging.getLogger("glue.web.streams")
+
+CAN_SPLICE = sys.platform.startswith("linux") and hasattr(os, "splice")
+
+# bytes moved per system call, and the size of the pipe splice moves them through
+CHUNK = 256 * 1024
+
+
+def metrics_path(dirs: Dirs) -> Path:
+    return dirs.runtime_dir / "streams.json"
+
+
+def _split(address: str) -> tuple[str, int] | str:
+    if address.startswith("tcp://"):
+        host, _, port = address.removeprefix("tcp://").rpartition(":")
+        return host or "127.0.0.1", int(port)
+    return address.removeprefix("unix://")
+
+
+async def open_connection(address: str) -> socket.socket:
+    """Connect a non-blocking socket to `tcp://host:port` or a unix socket path."""
+    loop = asyncio.get_running_loop()
+    target = _split(address)
+    if isinstance(target, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        addr: Any = target
+    else:
+        family, kind, proto, _, addr = (
+            await loop.getaddrinfo(*target, type=socket.SOCK_STREAM)
+        )[0]
+        sock = socket.socket(family, kind, proto)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setblocking(False)  # noqa: FBT003
+    try:
+        await loop.sock_connect(sock, addr)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+async def _ready(
+    add: Callable[..., None], remove: Callable[[int], object], sock: socket.socket
+) -> None:
+    fd = sock.fileno()
+    future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+    def wake() -> None:
+        if not future.done():
+            future.set_result(None)
+
+    add(fd, wake)
+    try:
+        await future
+    finally:
+        remove(fd)
+
+
+@dataclass
+class StreamMetrics:
+    connections: int = 0
+    active: int = 0
+    failed: int = 0
+    """Connections that were closed because the target could not be reached."""
+    bytes_in: int = 0
+    """Bytes sent by clients to the target."""
+    bytes_out: int = 0
+    """Bytes sent by the target to clients."""
+
+
+class StreamProxy:
+    """Relays the connections of a listening socket to a target address.
+
+    On Linux the bytes are moved with `splice` through a pipe, so they never
+    leave the kernel. Elsewhere they are copied through one reusable buffer per
+    direction.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: StreamServer,
+        resolver: VarResolver,
+        *,
+        splice: bool = CAN_SPLICE,
+    ) -> None:
+        self.name = name
+        self.config = config
+        self.resolver = resolver
+        self.listen = resolver.resolve_vars(config.listen)
+        self.splice = splice
+        self.metrics = StreamMetrics()
+        self._sock: socket.socket | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    @property
+    def target(self) -> str:
+        # resolved for every connection, so the target can move to a new socket
+        return self.resolver.resolve_vars(self.config.target)
+
+    @property
+    def address(self) -> tuple[str, int] | str:
+        """The address the proxy listens on, with the port it was given."""
+        assert self._sock is not None
+        address: tuple[str, int] | str = self._sock.getsockname()[:2]
+        return address
+
+    def start(self) -> None:
+        self._sock = bind_listener(self.listen)
+        self._sock.setblocking(False)  # noqa: FBT003
+        self._spawn(self._accept(self._sock))
+
+    def _spawn(self, coro: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _accept(self, sock: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            client, _ = await loop.sock_accept(sock)
+            client.setblocking(False)  # noqa: FBT003
+            if client.family != socket.AF_UNIX:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._spawn(self._handle(client))
+
+    async def _handle(self, client: socket.socket) -> None:
+        metrics = self.metrics
+        metrics.connections += 1
+        metrics.active += 1
+        target = self.target
+        try:
+            try:
+                upstream = await open_connection(target)
+            except OSError as e:
+                metrics.failed += 1
+                logger.warning("%s: cannot connect to %s: %s", self.name, target, e)
+                return
+            with upstream:
+                await self._relay(client, upstream)
+        finally:
+            metrics.active -= 1
+            client.close()
+
+    async def _relay(self, client: socket.socket, upstream: socket.socket) -> None:
+        def count_in(n: int) -> None:
+            self.metrics.bytes_in += n
+
+        def count_out(n: int) -> None:
+            self.metrics.bytes_out += n
+
+        copy = self._splice if self.splice else self._copy
+        tasks = [
+            asyncio.create_task(copy(client, upstream, count_in)),
+            asyncio.create_task(copy(upstream, client, count_out)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # a reset by either side ends the whole connection
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, OSError):
+                logger.debug("%s: %s", self.name, result)
+
+    @staticmethod
+    def _half_close(sock: socket.socket) -> None:
+        # the other direction keeps going until its side is done as well
+        with contextlib.suppress(OSError):
+            sock.shutdown(socket.SHUT_WR)
+
+    async def _copy(
+        self, src: socket.socket, dst: socket.socket, count: Callable[[int], None]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        buffer = bytearray(CHUNK)
+        view = memoryview(buffer)
+        while size := await loop.sock_recv_into(src, buffer):
+            await loop.sock_sendall(dst, view[:size])
+            count(size)
+        self._half_close(dst)
+
+    async def _splice(
+        self, src: socket.socket, dst: socket.socket, count: Callable[[int], None]
+    ) -> None:
+        import fcntl
+
+        loop = asyncio.get_running_loop()
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+        read_fd, write_fd = os.pipe()
+        with contextlib.suppress(OSError):
+            # pipes hold 64KiB by default, and unprivileged users may grow them to 1MiB
+            fcntl.fcntl(write_fd, fcntl.F_SETPIPE_SZ, CHUNK)
+        try:
+            while True:
+                try:
+                    size = os.splice(src.fileno(), write_fd, CHUNK, flags=flags)
+                except BlockingIOError:
+                    await _ready(loop.add_reader, loop.remove_reader, src)
+                    continue
+                if size == 0:
+                    break
+                # the pipe is drained before reading again, so it never fills up
+                while size:
+                    try:
+                        sent = os.splice(read_fd, dst.fileno(), size, flags=flags)
+                    except BlockingIOError:
+                        await _ready(loop.add_writer, loop.remove_writer, dst)
+                        continue
+                    size -= sent
+                    count(sent)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+        self._half_close(dst)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._close_listener()
+
+    def _close_listener(self) -> None:
+        if self._sock is None:
+            return
+        if self._sock.family == socket.AF_UNIX:
+            with contextlib.suppress(FileNotFoundError):
+                Path(self.listen.removeprefix("unix://")).unlink()
+        self._sock.close()
+        self._sock = None
+
+
+class StreamGroup:
+    """Runs the stream servers of a config on the running event loop.
+
+    `apply` only restarts the servers whose config or listening address changed,
+    so the connections of every other server survive a config reload. With
+    `metrics_file`, the metrics of every server are written to it while the group
+    runs.
+    """
+
+    def __init__(
+        self,
+        resolver: VarResolver,
+        *,
+        metrics_file: Path | None = None,
+        interval: float = 1.0,
+    ) -> None:
+        self.resolver = resolver
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.proxies: dict[str, StreamProxy] = {}
+        self._writer: asyncio.Task[None] | None = None
+
+    async def apply(self, streams: Mapping[str, StreamServer]) -> None:
+        for name, proxy in list(self.proxies.items()):
+            if (
+                streams.get(name) != proxy.config
+                or self.resolver.resolve_vars(proxy.config.listen) != proxy.listen
+            ):
+                await proxy.close()
+                del self.proxies[name]
+
+        for name, config in streams.items():
+            if name in self.proxies:
+                continue
+            proxy = StreamProxy(name, config, self.resolver)
+            try:
+                proxy.start()
+            except OSError:
+                logger.exception("Failed to listen on %s for %s", proxy.listen, name)
+                continue
+            logger.info("Relaying %s to %s for %s", proxy.listen, proxy.target, name)
+            self.proxies[name] = proxy
+
+        if self.metrics_file is not None and self.proxies and self._writer is None:
+            self._writer = asyncio.create_task(self._write_metrics(self.metrics_file))
+
+    def metrics(self) -> dict[str, dict[str, int]]:
+        return {name: asdict(proxy.metrics) for name, proxy in self.proxies.items()}
+
+    async def _write_metrics(self, path: Path) -> None:
+        last = None
+        while True:
+            metrics = json.dumps(self.metrics())
+            if metrics != last:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f".{path.name}.{os.getpid()}")
+                tmp.write_text(metrics)
+                tmp.replace(path)
+                last = metrics
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._writer
+            self._writer = None
+        await self.apply({})
+        if self.metrics_file is not None:
+            with contextlib.suppress(FileNotFoundError):
+                self.metrics_file.unlink()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .output import Chunk
+
+__all__ = ["Timeline", "TimelineEntry"]
+
+
+class TimelineEntry(NamedTuple):
+    timestamp: float
+    service: str
+    line: str
+
+
+class Timeline:
+    """Merges the output of several services into a single time-ordered stream.
+
+    Chunks are split into lines as they are added and queued per service, and
+    `pop` does a k-way merge of the queues using a heap keyed on the timestamp of
+    each queue's first line. Only one entry per service is ever on the heap, so
+    each line costs O(log k) for k services regardless of how much is buffered.
+
+    Output reaches subscribers a little after it was captured, so `pop` holds
+    back lines that are younger than `delay` to give the other services a chance
+    to deliver anything that was captured earlier.
+    """
+
+    def __init__(
+        self,
+        services: Iterable[str],
+        *,
+        delay: float = 0.05,
+        partial_timeout: float = 1.0,
+    ) -> None:
+        self.delay = delay
+        self.partial_timeout = partial_timeout
+        self._queues: dict[str, deque[TimelineEntry]] = {
+            name: deque() for name in services
+        }
+        self._partials: dict[str, TimelineEntry] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def services(self) -> list[str]:
+        return list(self._queues)
+
+    def add(self, service: str, item: Chunk) -> None:
+        """Queue the lines of a chunk. May be called from any thread."""
+        text = item.text
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        lines = text.split("\n")
+
+        with self._lock:
+            queue = self._queues[service]
+            was_empty = not queue
+
+            # a line is placed at the time its first character was captured
+            timestamp = item.timestamp
+            if (partial := self._partials.pop(service, None)) is not None:
+                timestamp = partial.timestamp
+                lines[0] = partial.line + lines[0]
+            for line in lines[:-1]:
+                queue.append(TimelineEntry(timestamp, service, line))
+                timestamp = item.timestamp
+            if lines[-1]:
+                self._partials[service] = TimelineEntry(timestamp, service, lines[-1])
+
+            if was_empty and queue:
+                self._push(service, queue)
+
+    def _push(self, service: str, queue: deque[TimelineEntry]) -> None:
+        # the counter keeps ties stable without comparing service names
+        heapq.heappush(self._heap, (queue[0].timestamp, next(self._counter), service))
+
+    def _flush_partials(self, until: float) -> None:
+        for service, partial in list(self._partials.items()):
+            if partial.timestamp <= until:
+                del self._partials[service]
+                queue = self._queues[service]
+                queue.append(partial)
+                if len(queue) == 1:
+                    self._push(service, queue)
+
+    def pop(self, now: float | None = None) -> list[TimelineEntry]:
+        """Return the lines that are old enough to be placed, oldest first."""
+        if now is None:
+            now = time.monotonic()
+        until = now - self.delay
+
+        entries = []
+        with self._lock:
+            # output without a trailing newline, like a prompt, still shows up
+            self._flush_partials(now - self.partial_timeout)
+
+            heap, queues = self._heap, self._queues
+            while heap and heap[0][0] <= until:
+                _, _, service = heapq.heappop(heap)
+                queue = queues[service]
+                entries.append(queue.popleft())
+                # pop every line of this service that precedes the next service
+                limit = min(heap[0][0], until) if heap else until
+                while queue and queue[0].timestamp <= limit:
+                    entries.append(queue.popleft())
+                if queue:
+                    self._push(service, queue)
+        return entries
@@ -8,9 +8,9 @@ from typing_extensions import TypeAlias, get_args, get_origin, overload
 from .compat import NoneType, UnionType
 
 if TYPE_CHECKING:
-    from _typeshed import DataclassInstance
+    from collections.abc import Callable
 
-    T_Data = TypeVar("T_Data", bound=DataclassInstance)
+    from _typeshed import DataclassInstance
 
 
 T = TypeVar("T")
@@ -18,6 +18,8 @@ T = TypeVar("T")
 Primitive: TypeAlias = (
     "str | float | int | bool | None | list[Primitive] | dict[str, Primitive]"
 )
+Converter: TypeAlias = "Callable[[Primitive, str], Any]"
+Predicate: TypeAlias = "Callable[[Primitive], bool]"
 
 
 class TypeCastError(Exception):
@@ -31,88 +33,227 @@ def _build_obj_key(key: str, next_key: str) -> str:
     return f"{key}{'.' if key else ''}{next_key}"
 
 
-def _coerce_dataclass(typ: type[T_Data], val: Primitive, *, key: str) -> T_Data:
-    val = _coerce_type(dict, val, key=key)
-    all_fields = {f.name: f.type for f in fields(typ)}
-    kwargs = {
-        k: typecast(all_fields.get(k, Any), v, key=_build_obj_key(key, k))
-        for k, v in val.items()
-    }
-    try:
-        return typ(**kwargs)
-    except TypeError:
-        available_keys = {f.name for f in fields(typ)}
-        required_keys = {
-            f.name for f in fields(typ) if f.default is f.default_factory is MISSING
-        }
-        actual_keys = set(kwargs.keys())
+def _type_error(typ: type, val: Primitive, key: str) -> TypeCastError:
+    msg = f"Value was {type(val).__name__}, but expected {typ.__name__}"
+    return TypeCastError(key, msg)
+
+
+def _check_type(typ: type) -> Converter:
+    def convert(val: Primitive, key: str) -> Any:
+        if type(val) is typ or isinstance(val, typ):
+            return val
+        raise _type_error(typ, val, key)
+
+    return convert
+
+
+def _compile_float() -> Converter:
+    def convert(val: Primitive, key: str) -> Any:
+        if isinstance(val, float):
+            return val
+        # toml writes whole numbers as integers, so allow them where floats are expected
+        if isinstance(val, int) and not isinstance(val, bool):
+            return float(val)
+        raise _type_error(float, val, key)
+
+    return convert
 
-        missing = list(required_keys.difference(actual_keys))
-        unknown = list(actual_keys.difference(available_keys))
 
-        missing.sort()
-        unknown.sort()
+def _compile_none() -> Converter:
+    def convert(val: Primitive, key: str) -> Any:
+        if val is None:
+            return val
+        raise _type_error(NoneType, val, key)
+
+    return convert
+
+
+class _DataclassConverter:
+    """Converts dicts to a dataclass.
+
+    The converters of the fields are compiled on first use, which allows
+    dataclasses to refer to themselves.
+    """
+
+    def __init__(self, typ: type[DataclassInstance]) -> None:
+        self.typ = typ
+        self.available = frozenset(f.name for f in fields(typ))
+        self.required = frozenset(
+            f.name
+            for f in fields(typ)
+            if f.default is MISSING and f.default_factory is MISSING
+        )
+        self._fields: dict[str, Converter] | None = None
+
+    @property
+    def field_converters(self) -> dict[str, Converter]:
+        if self._fields is None:
+            self._fields = {f.name: compile_type(f.type) for f in fields(self.typ)}
+        return self._fields
+
+    def accepts(self, val: Primitive) -> bool:
+        """Whether `val` has the right keys, without looking at their values."""
+        return isinstance(val, dict) and self.required <= val.keys() <= self.available
+
+    def key_error(self, val: dict[str, Primitive]) -> str:
+        missing = sorted(self.required.difference(val))
+        unknown = sorted(set(val).difference(self.available))
 
         msg_parts = []
         if missing:
             msg_parts.append(f"missing keys: {missing}")
         if unknown:
             msg_parts.append(f"unknown keys: {unknown}")
+        return ", ".join(msg_parts)
+
+    def __call__(self, val: Primitive, key: str) -> Any:
+        if not isinstance(val, dict):
+            raise _type_error(dict, val, key)
 
-        msg = ", ".join(msg_parts)
-        if not msg:
-            raise  # something else went wrong
+        converters = self.field_converters
+        kwargs = {
+            k: converters[k](v, _build_obj_key(key, k)) if k in converters else v
+            for k, v in val.items()
+        }
+        if msg := self.key_error(kwargs):
+            raise TypeCastError(key, msg)
+        try:
+            return self.typ(**kwargs)
+        except ValueError as e:
+            # raised by the checks in `__post_init__`
+            raise TypeCastError(key, str(e)) from None
 
-        raise TypeCastError(key, msg) from None
 
+def _compile_dict(typ: Any) -> Converter:
+    kt, vt = get_args(typ)
+    assert kt is str, "non-string dict keys are not supported"
+    convert_value = compile_type(vt)
 
-@overload
-def _coerce_type(typ: type[T], val: Primitive, *, key: str) -> T: ...
-@overload
-def _coerce_type(typ: Any, val: Primitive, *, key: str) -> Any: ...
-def _coerce_type(typ: Any, val: Primitive, *, key: str) -> Any:
-    assert isinstance(typ, type)
+    def convert(val: Primitive, key: str) -> Any:
+        if not isinstance(val, dict):
+            raise _type_error(dict, val, key)
+        return {k: convert_value(v, _build_obj_key(key, k)) for k, v in val.items()}
 
-    if is_dataclass(typ):
-        return _coerce_dataclass(typ, val, key=key)
+    return convert
 
-    if (typ is NoneType and val is not None) or not isinstance(val, typ):
-        msg = f"Value was {type(val).__name__}, but expected {typ.__name__}"
-        raise TypeCastError(key, msg)
-    return val
 
+def _compile_list(typ: Any) -> Converter:
+    (it,) = get_args(typ)
+    convert_item = compile_type(it)
 
-def _coerce_dict(typ: type[dict[str, T]], val: Primitive, *, key: str) -> dict[str, T]:
-    val = _coerce_type(dict, val, key=key)
+    def convert(val: Primitive, key: str) -> Any:
+        if not isinstance(val, list):
+            raise _type_error(list, val, key)
+        return [convert_item(item, f"{key}[{index}]") for index, item in enumerate(val)]
 
-    kt, vt = get_args(typ)
-    assert kt is str, "non-string dict keys are not supported"
-    return {k: typecast(vt, v, key=_build_obj_key(key, k)) for k, v in val.items()}
+    return convert
 
 
-def _coerce_list(typ: type[list[T]], val: Primitive, *, key: str) -> list[T]:
-    val = _coerce_type(list, val, key=key)
-    (it,) = get_args(typ)
-    return [typecast(it, item, key=f"{key}[{index}]") for index, item in enumerate(val)]
+def _predicate(typ: Any) -> Predicate:
+    """Build a cheap check for whether `typ` could be the right member of a union."""
+    if typ is Any:
+        return lambda _: True
+    if typ is NoneType:
+        return lambda val: val is None
+    if typ is float:
+        return lambda val: isinstance(val, (float, int)) and not isinstance(val, bool)
+    if isinstance(converter := compile_type(typ), _DataclassConverter):
+        return converter.accepts
+    if (origin := get_origin(typ)) in (Union, UnionType):
+        predicates = [_predicate(ut) for ut in get_args(typ)]
+        return lambda val: any(p(val) for p in predicates)
+
+    cls = origin or typ
+    return lambda val: isinstance(val, cls)
+
+
+def _discriminators(members: tuple[Any, ...]) -> dict[str, int]:
+    """Map the keys that only one dataclass of a union has to its index."""
+    owners: dict[str, set[int]] = {}
+    for index, typ in enumerate(members):
+        if is_dataclass(typ):
+            for f in fields(typ):
+                owners.setdefault(f.name, set()).add(index)
+    return {name: next(iter(idx)) for name, idx in owners.items() if len(idx) == 1}
+
+
+class _UnionConverter:
+    """Picks the member of a union to convert to without trying each in turn.
+
+    For unions of dataclasses, a key that only one of them has decides the
+    type. Otherwise the members are narrowed down by cheap checks of the value,
+    and only values that fit none or several of them may raise internally.
+    """
+
+    def __init__(self, typ: Any) -> None:
+        members = get_args(typ)
+        self.converters = [compile_type(ut) for ut in members]
+        self.predicates = [_predicate(ut) for ut in members]
+        self.discriminators = _discriminators(members)
+
+    def error(self, val: Primitive, key: str) -> TypeCastError:
+        errors = []
+        for convert in self.converters:
+            try:
+                convert(val, key)
+            except TypeCastError as e:  # noqa: PERF203
+                errors.append(f"- {e.message}")
+        return TypeCastError(key, "\nPossible issues:\n" + "\n".join(errors))
+
+    def __call__(self, val: Primitive, key: str) -> Any:
+        if self.discriminators and isinstance(val, dict):
+            for k in val:
+                if (index := self.discriminators.get(k)) is not None:
+                    return self.converters[index](val, key)
+
+        candidates = [
+            convert
+            for convert, accepts in zip(self.converters, self.predicates)
+            if accepts(val)
+        ]
+        if len(candidates) == 1:
+            return candidates[0](val, key)
+        for candidate in candidates:
+            try:
+                return candidate(val, key)
+            except TypeCastError:  # noqa: PERF203
+                continue
+        raise self.error(val, key)
+
+
+def _compile(typ: Any) -> Converter:
+    if typ is Any:
+        return lambda val, _: val
+    if typ is float:
+        return _compile_float()
+    if typ is NoneType:
+        return _compile_none()
 
+    origin = get_origin(typ)
+    if origin is None and isinstance(typ, type):
+        if is_dataclass(typ):
+            return _DataclassConverter(typ)
+        return _check_type(typ)
+    if origin is dict:
+        return _compile_dict(typ)
+    if origin is list:
+        return _compile_list(typ)
+    if origin in (Union, UnionType):
+        return _UnionConverter(typ)
 
-def _coerce_union(typ: type[T], val: Primitive, *, key: str) -> T:
-    errors = []
-    for ut in get_args(typ):
-        try:
-            return typecast(ut, val, key=key)
-        except TypeCastError as e:  # noqa: PERF203
-            errors.append(f"- {e.message}")
-    raise TypeCastError(key, "\nPossible issues:\n" + "\n".join(errors))
+    raise NotImplementedError(f"{typ} is not supported yet")
 
 
-_origin_mapper = {
-    None: _coerce_type,
-    dict: _coerce_dict,
-    list: _coerce_list,
-    Union: _coerce_union,
-    UnionType: _coerce_union,
-}
+_converters: dict[Any, Converter] = {}
+
+
+def compile_type(typ: Any) -> Converter:
+    """Return a converter for `typ`, compiling it the first time it is needed."""
+    try:
+        return _converters[typ]
+    except KeyError:
+        converter = _converters[typ] = _compile(typ)
+        return converter
 
 
 @overload
@@ -120,12 +261,4 @@ def typecast(typ: type[T], val: Primitive, *, key: str = ...) -> T: ...
 @overload
 def typecast(typ: Any, val: Primitive, *, key: str = ...) -> Any: ...
 def typecast(typ: Any, val: Primitive, *, key: str = "") -> Any:
-    if typ is Any:
-        return val
-
-    if (origin := get_origin(typ)) in _origin_mapper:
-        coerce = _origin_mapper[origin]
-    else:
-        raise NotImplementedError(f"{typ} is not supported yet")
-
-    return coerce(typ, val, key=key)
+    return compile_type(typ)(val, key)
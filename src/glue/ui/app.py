@@ -8,15 +8,25 @@ from textual.binding import Binding
 from textual.containers import Container
 from textual.widgets import Footer, Header, Label
 
+from glue import profiling
+
 from .commands import BaseCommandProvider, Matricies, cmd
-from .screens import ProcessLogScreen
+from .screens import ProcessLogScreen, TimelineScreen
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from textual.command import Provider
 
+    from glue.config import ConfigDiff, FaultConfig
+    from glue.control.remote import RemoteServiceManager
+    from glue.faults import FaultSwitches
     from glue.pm import ServiceManager
 
 
+TIMELINE = "glue:timeline"
+
+
 class RootAppCommands(BaseCommandProvider):
     def view_log_matrix(self: Provider) -> Matricies:
         app = self.app
@@ -26,10 +36,28 @@ class RootAppCommands(BaseCommandProvider):
 
     @cmd("View logs for {svc}", view_log_matrix)
     def view_logs(self, svc: str) -> None:
-        try:
-            self.app.switch_screen(svc)
-        except IndexError:
-            self.app.push_screen(svc)
+        app = self.app
+        assert isinstance(app, GlueApp)
+        app.action_view_logs(svc)
+
+    @cmd("View timeline", help="The output of every service, in order")
+    def view_timeline(self) -> None:
+        app = self.app
+        assert isinstance(app, GlueApp)
+        app.action_view_logs(TIMELINE)
+
+    def fault_matrix(self: Provider) -> Matricies:
+        app = self.app
+        assert isinstance(app, GlueApp)
+        for server, rule in app.fault_rules():
+            state = "on" if app.switches.is_enabled(server, rule) else "off"
+            yield {"server": server, "rule": rule.name, "state": state}
+
+    @cmd("Toggle fault {rule} on {server}", fault_matrix, help="Currently {state}")
+    def toggle_fault(self, server: str, rule: str, state: str) -> None:  # noqa: ARG002
+        app = self.app
+        assert isinstance(app, GlueApp)
+        app.action_toggle_fault(server, rule)
 
 
 class GlueApp(App[object]):
@@ -38,6 +66,7 @@ class GlueApp(App[object]):
         *App.BINDINGS,
         Binding("escape", "home", "Home"),
         Binding("ctrl+z", "suspend_process"),
+        Binding("t", f"view_logs('{TIMELINE}')", "Timeline"),
     ]
 
     CSS = """
@@ -49,32 +78,82 @@ class GlueApp(App[object]):
     }
     """
 
-    def __init__(self, mgr: ServiceManager, port: int) -> None:
+    def __init__(
+        self,
+        mgr: ServiceManager | RemoteServiceManager,
+        port: int,
+        switches: FaultSwitches,
+    ) -> None:
         super().__init__()
         self.mgr = mgr
+        self.switches = switches
         atexit.register(mgr.shutdown)
-        for index, (name, svc) in enumerate(mgr.services.items()):
-            self.install_screen(ProcessLogScreen(svc), name)
+        mgr.on_change.append(self.on_config_change)
+        self.bind_services()
+        self.port = port
+
+    def bind_services(self) -> None:
+        for index, name in enumerate(self.mgr.services):
             if index < 10:
                 self.bind(str(index), f"view_logs('{name}')", description=name)
-        self.app_names = list(mgr.services.keys())
-        self.port = port
+        self.app_names = list(self.mgr.services.keys())
+
+    def on_config_change(self, diff: ConfigDiff) -> None:
+        """Update the screens from the manager's thread after a config reload."""
+        self.call_from_thread(self.services_changed, diff)
+
+    def services_changed(self, diff: ConfigDiff) -> None:
+        self.bind_services()
+        # changed services keep their instance, so only removed ones lose a screen
+        stale = [*diff.removed, TIMELINE] if diff.added or diff.removed else []
+        for name in stale:
+            if not self.is_screen_installed(name):
+                continue
+            if self.screen.name == name:
+                if name == TIMELINE:
+                    continue  # rebuilt the next time it is opened
+                self.pop_screen()
+            self.uninstall_screen(name)
+        self.refresh_bindings()
 
     def on_mount(self) -> None:
-        self.push_screen(self.app_names[0])
-        for x in self.app_names:
-            self.switch_screen(x)
-        self.pop_screen()
+        profiling.watch_running_loop("tui")
 
     def on_exit_app(self) -> None:
         self.mgr.shutdown()
 
+    def install_log_screen(self, name: str) -> None:
+        # screens are only built the first time they are viewed
+        if self.is_screen_installed(name):
+            return
+        if name == TIMELINE:
+            self.install_screen(TimelineScreen(self.mgr.services, name=name), name)
+        else:
+            self.install_screen(ProcessLogScreen(self.mgr.services[name]), name)
+
     def action_view_logs(self, screen: str) -> None:
+        self.install_log_screen(screen)
         if len(self.screen_stack) > 1:
             self.switch_screen(screen)
         else:
             self.push_screen(screen)
 
+    def fault_rules(self) -> Iterator[tuple[str, FaultConfig]]:
+        """Yield the fault rules of every server, with the name they are switched by."""
+        config = self.mgr.config
+        servers = [*config.servers.items(), ("default", config.default_server)]
+        for name, server in servers:
+            for rule in getattr(server, "faults", ()):
+                yield name, rule
+
+    def action_toggle_fault(self, server: str, rule_name: str) -> None:
+        for name, rule in self.fault_rules():
+            if (name, rule.name) == (server, rule_name):
+                enabled = self.switches.toggle(server, rule)
+                state = "on" if enabled else "off"
+                self.notify(f"Fault {rule_name} on {server} is {state}")
+                return
+
     def action_home(self) -> None:
         self.pop_screen()
 
@@ -87,6 +166,11 @@ class GlueApp(App[object]):
             and self.screen.name == parameters[0]
         ):
             return None
+        if action == "view_logs" and parameters[0] not in (
+            TIMELINE,
+            *self.mgr.services,
+        ):
+            return False
 
         return super().check_action(action, parameters)
 
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import TYPE_CHECKING
+
+from rich.cells import cell_len
+from rich.control import Control
+from rich.segment import ControlType
+from rich.text import Text
+from textual.cache import LRUCache
+from textual.geometry import Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+from glue.output import skipped
+
+if TYPE_CHECKING:
+    from rich.console import RenderableType
+
+    from glue.output import Cursor
+
+__all__ = ["LogView"]
+
+FRAME_INTERVAL = 1 / 60
+
+_ANSI_ESCAPE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07]*\x07|[@-Z\\-_])")
+
+
+def _is_clear(control: Control) -> bool:
+    return any(ControlType.CLEAR in code for code in control.segment.control or ())
+
+
+class LogView(ScrollView, can_focus=True):
+    """A virtualized view over the raw output of a service.
+
+    `write` may be called from any thread. Output is buffered and added to the view
+    at most once per frame, and ANSI sequences are only parsed for the lines that
+    are actually on screen. Alternatively, `follow` reads straight from the
+    cursor of an `OutputBuffer` once per frame.
+    """
+
+    DEFAULT_CSS = """
+    LogView {
+        background: $surface;
+        color: $text;
+        overflow-y: scroll;
+    }
+    """
+
+    class Pending(Message):
+        """Posted from `write` when output is waiting to be flushed."""
+
+    def __init__(
+        self,
+        *,
+        max_lines: int | None = 1_000_000,
+        name: str | None = None,
+        id: str | None = None,  # noqa: A002
+        classes: str | None = None,
+    ) -> None:
+        super().__init__(name=name, id=id, classes=classes)
+        self.max_lines = max_lines
+        self.lines: list[str] = []
+        self.partial = ""
+        self._widest = 0
+        self._pending: list[str] = []
+        self._pending_clear = False
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+        self._strips: LRUCache[int, Strip] = LRUCache(1024)
+        self._offset = 0  # number of lines trimmed off the start
+        self._cursor: Cursor | None = None
+
+    def write(self, text: RenderableType) -> None:
+        if isinstance(text, Control):
+            if not _is_clear(text):
+                return
+            with self._lock:
+                self._pending.clear()
+                self._pending_clear = True
+        else:
+            with self._lock:
+                self._pending.append(str(text))
+        self._schedule_flush()
+
+    def follow(self, cursor: Cursor) -> None:
+        """Show the output read through `cursor`, which is closed on unmount."""
+        self._cursor = cursor
+        cursor.on_data = self._schedule_flush
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        with self._lock:
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            self.post_message(self.Pending())
+
+    def on_unmount(self) -> None:
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+    def _read_cursor(self, cursor: Cursor) -> tuple[bool, list[str]]:
+        clear = False
+        pending: list[str] = []
+        while (data := cursor.read()) is not None:
+            if data.cleared:
+                clear = True
+                pending.clear()
+            if data.lagged:
+                pending.append(skipped(data.lagged))
+            text = cursor.decode(data.views)
+            pending.append(text if cursor.check(data) else skipped(len(data)))
+        return clear, pending
+
+    def clear(self) -> None:
+        self.lines.clear()
+        self.partial = ""
+        self._widest = 0
+        self._offset = 0
+        self._strips.clear()
+        self.virtual_size = Size(0, 0)
+        self.refresh()
+
+    def on_log_view_pending(self, event: LogView.Pending) -> None:
+        event.stop()
+        self.set_timer(FRAME_INTERVAL, self.flush)
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            clear, self._pending_clear = self._pending_clear, False
+            self._flush_scheduled = False
+        if self._cursor is not None:
+            clear, pending = self._read_cursor(self._cursor)
+
+        at_end = self.scroll_offset.y >= self.max_scroll_y
+        if clear:
+            self.clear()
+        if not pending:
+            return
+
+        text = self.partial + "".join(pending)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        new_lines = text.split("\n")
+        self.partial = new_lines.pop()
+        self.lines.extend(new_lines)
+
+        # measuring is only needed for lines that could be wider than the widest
+        widest = self._widest
+        for line in (*new_lines, self.partial):
+            if len(line) > widest:
+                widest = max(widest, self._measure(line))
+        self._widest = widest
+
+        excess = 0
+        if self.max_lines is not None and len(self.lines) > self.max_lines:
+            # trim in batches so that appending stays cheap
+            excess = len(self.lines) - self.max_lines + self.max_lines // 10
+            del self.lines[:excess]
+            self._offset += excess
+
+        self.virtual_size = Size(self._widest, len(self.lines) + bool(self.partial))
+        if at_end:
+            self.scroll_y = self.max_scroll_y
+        elif excess:
+            # keep the lines a reader scrolled back to in place
+            self.scroll_to(y=max(0, self.scroll_offset.y - excess), animate=False)
+        self.refresh()
+
+    @staticmethod
+    def _measure(line: str) -> int:
+        return cell_len(_ANSI_ESCAPE.sub("", line))
+
+    def _get_strip(self, index: int) -> Strip | None:
+        if index < len(self.lines):
+            key = self._offset + index
+            strip = self._strips.get(key)
+            if strip is None:
+                strip = self._render_text(self.lines[index])
+                self._strips[key] = strip
+            return strip
+        if index == len(self.lines) and self.partial:
+            return self._render_text(self.partial)
+        return None
+
+    def _render_text(self, line: str) -> Strip:
+        text = Text.from_ansi(line, end="")
+        return Strip(text.render(self.app.console), text.cell_len)
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.scrollable_content_region.width
+        strip = self._get_strip(scroll_y + y)
+        if strip is None:
+            return Strip.blank(width, self.rich_style)
+        return strip.crop_extend(
+            scroll_x, scroll_x + width, self.rich_style
+        ).apply_style(self.rich_style)
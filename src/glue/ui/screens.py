@@ -1,17 +1,30 @@
-from typing import ClassVar
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import TYPE_CHECKING, ClassVar
 
-from rich.console import RenderableType
 from rich.control import Control
-from rich.segment import ControlType
-from rich.text import Text
-from textual.app import ComposeResult
 from textual.binding import Binding
 from textual.screen import Screen
-from textual.widgets import Footer, Header, RichLog
+from textual.widgets import Footer, Header, Input
+
+from glue.output import Chunk, skipped
+from glue.timeline import Timeline, TimelineEntry
+
+from .commands import BaseCommandProvider, Matricies, cmd
+from .log import FRAME_INTERVAL, LogView
 
-from glue.pm import ServiceInstance
+if TYPE_CHECKING:
+    from collections.abc import Mapping
 
-from .commands import BaseCommandProvider, cmd
+    from textual.app import ComposeResult
+    from textual.command import Provider
+
+    from glue.control.coordinator import AgentServiceInstance
+    from glue.control.remote import RemoteServiceInstance
+    from glue.output import Cursor
+    from glue.pm import ServiceInstance
 
 
 class ProcessCommands(BaseCommandProvider):
@@ -29,31 +42,143 @@ class ProcessLogScreen(Screen[object]):
 
     ALLOW_MAXIMIZE = False
 
-    def __init__(self, instance: ServiceInstance) -> None:
+    def __init__(
+        self, instance: ServiceInstance | AgentServiceInstance | RemoteServiceInstance
+    ) -> None:
         super().__init__(name=instance.config.name)
         self.instance = instance
-        self.widget_log = RichLog()
-
-        self.instance.start(self.write_log)
+        self.widget_log = LogView()
         self.title = self.instance.config.name
 
-    def write_log(self, text: RenderableType) -> None:
-        if isinstance(text, Control):
-            for code in text.segment.control or ():
-                if ControlType.CLEAR in code:
-                    self.widget_log.clear()
-                    break
-            return
+    def on_mount(self) -> None:
+        # backfill with everything the service printed before this screen existed
+        self.widget_log.follow(self.instance.output.cursor())
 
-        if isinstance(text, str):
-            text = Text.from_ansi(text)
+    def action_restart_service(self) -> None:
+        self.run_worker(self.instance.restart, thread=True, group="restart")
 
-        self.widget_log.write(text)
+    def compose(self) -> ComposeResult:
+        yield Header()
+        yield self.widget_log
+        yield Footer()
 
-    def action_restart_service(self) -> None:
-        self.instance.restart(self.write_log)
+
+# foreground colours that stay readable on both light and dark themes
+_COLORS = (36, 33, 35, 32, 34, 31, 96, 93, 95, 92, 94, 91)
+
+
+class TimelineCommands(BaseCommandProvider):
+    def service_matrix(self: Provider) -> Matricies:
+        screen = self.screen
+        assert isinstance(screen, TimelineScreen)
+        for svc in screen.timeline.services:
+            action = "Show" if svc in screen.hidden else "Hide"
+            yield {"svc": svc, "action": action}
+
+    @cmd("{action} {svc} in the timeline", service_matrix, discovery=True)
+    def toggle_service(self, svc: str, action: str) -> None:  # noqa: ARG002
+        assert isinstance(self.screen, TimelineScreen)
+        self.screen.toggle_service(svc)
+
+
+class TimelineScreen(Screen[object]):
+    """The output of every service merged into a single, time-ordered view."""
+
+    COMMANDS: ClassVar = {TimelineCommands}
+    BINDINGS: ClassVar = [
+        Binding("ctrl+f", "focus_filter", "Filter"),
+    ]
+
+    ALLOW_MAXIMIZE = False
+
+    def __init__(
+        self,
+        instances: Mapping[
+            str, ServiceInstance | AgentServiceInstance | RemoteServiceInstance
+        ],
+        *,
+        max_entries: int = 100_000,
+        name: str | None = None,
+    ) -> None:
+        super().__init__(name=name)
+        self.title = "Timeline"
+        self.instances = instances
+        self.timeline = Timeline(instances)
+        self.entries: deque[TimelineEntry] = deque(maxlen=max_entries)
+        self.hidden: set[str] = set()
+        self.pattern = ""
+        self.widget_log = LogView(max_lines=max_entries)
+        self.widget_filter = Input(placeholder="Filter", id="timeline-filter")
+        width = max(map(len, instances), default=0)
+        self._prefixes = {
+            svc: f"\x1b[{_COLORS[i % len(_COLORS)]}m{svc:<{width}}\x1b[0m │ "
+            for i, svc in enumerate(instances)
+        }
+        self._cursors: dict[str, Cursor] = {}
+
+    def on_mount(self) -> None:
+        self._cursors = {
+            svc: instance.output.cursor() for svc, instance in self.instances.items()
+        }
+        self.set_interval(FRAME_INTERVAL, self.drain)
+
+    def on_unmount(self) -> None:
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors.clear()
+
+    def read_output(self) -> None:
+        for svc, cursor in self._cursors.items():
+            while (data := cursor.read()) is not None:
+                if data.lagged:
+                    self.timeline.add(
+                        svc, Chunk(time.monotonic(), skipped(data.lagged))
+                    )
+                chunks = [
+                    Chunk(timestamp, cursor.decode(views))
+                    for timestamp, views in data.chunks()
+                ]
+                if chunks and not cursor.check(data):
+                    chunks = [Chunk(chunks[0].timestamp, skipped(len(data)))]
+                for chunk in chunks:
+                    self.timeline.add(svc, chunk)
+
+    def matches(self, entry: TimelineEntry) -> bool:
+        return entry.service not in self.hidden and self.pattern in entry.line
+
+    def format(self, entries: list[TimelineEntry]) -> str:
+        return "".join(
+            f"{self._prefixes[e.service]}{e.line}\n" for e in entries if self.matches(e)
+        )
+
+    def drain(self) -> None:
+        self.read_output()
+        if entries := self.timeline.pop():
+            self.entries.extend(entries)
+            if text := self.format(entries):
+                self.widget_log.write(text)
+
+    def refilter(self) -> None:
+        self.widget_log.write(Control.clear())
+        if text := self.format(list(self.entries)):
+            self.widget_log.write(text)
+
+        hidden = ", ".join(sorted(self.hidden))
+        self.sub_title = f"hiding {hidden}" if hidden else ""
+
+    def toggle_service(self, svc: str) -> None:
+        self.hidden ^= {svc}
+        self.refilter()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        self.pattern = event.value
+        self.refilter()
+
+    def action_focus_filter(self) -> None:
+        self.widget_filter.focus()
 
     def compose(self) -> ComposeResult:
         yield Header()
         yield self.widget_log
+        yield self.widget_filter
         yield Footer()
@@ -1,17 +1,101 @@
 from __future__ import annotations
 
 import base64
+import functools
 import hashlib
+import importlib.metadata
+import json
+import os
+import re
+import string
+import urllib.parse
 from dataclasses import dataclass, replace
 from pathlib import Path
 from types import SimpleNamespace
-from typing import Any, Protocol
+from typing import TYPE_CHECKING, Any, Protocol, TypedDict
 
 import platformdirs
-from typing_extensions import Self
+from typing_extensions import NotRequired, Self
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Mapping
+
+    from .config import ServiceConfig
 
 dirs = platformdirs.PlatformDirs("glue")
 
+# variables whose values may change while glue runs, and are never cached
+DYNAMIC_VARS = frozenset({"env"})
+
+_FIELD_START = re.compile(r"[^.[]+")
+_ACCESSOR = re.compile(r"\.([^.[]+)|\[([^\]]+)\]")
+_CONVERSIONS: dict[str | None, Callable[[Any], Any]] = {
+    None: lambda value: value,
+    "s": str,
+    "r": repr,
+    "a": ascii,
+}
+
+
+def _compile_field(
+    name: str, conversion: str | None, spec: str
+) -> tuple[str, Callable[[Mapping[str, Any]], str]]:
+    match = _FIELD_START.match(name)
+    if match is None:
+        msg = f"Positional fields are not supported: {{{name}}}"
+        raise ValueError(msg)
+    first = match.group()
+    steps = [
+        (attr, int(key) if key.isdigit() else key)
+        for attr, key in _ACCESSOR.findall(name, match.end())
+    ]
+    convert = _CONVERSIONS[conversion]
+
+    def render(namespace: Mapping[str, Any]) -> str:
+        value = namespace[first]
+        for attr, key in steps:
+            value = getattr(value, attr) if attr else value[key]
+        return format(convert(value), spec)
+
+    return first, render
+
+
+class Template:
+    """A `str.format` template that is parsed once and rendered many times.
+
+    Fields are compiled to lookups in the namespace, so rendering costs the
+    same no matter how many variables the namespace holds.
+    """
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self.names: set[str] = set()
+        self._parts: list[str | Callable[[Mapping[str, Any]], str]] = []
+
+        for literal, name, spec, conversion in string.Formatter().parse(template):
+            if literal:
+                self._parts.append(literal)
+            if name is None:
+                continue
+            if spec and "{" in spec:
+                # nested fields are rare enough to leave to str.format
+                self._parts = [template.format_map]
+                self.names.update(DYNAMIC_VARS)
+                return
+            first, render = _compile_field(name, conversion, spec or "")
+            self.names.add(first)
+            self._parts.append(render)
+
+    def render(self, namespace: Mapping[str, Any]) -> str:
+        return "".join(
+            [part if isinstance(part, str) else part(namespace) for part in self._parts]
+        )
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(template: str) -> Template:
+    return Template(template)
+
 
 class IPlatformDirs(Protocol):
     @property
@@ -29,23 +113,46 @@ class VarResolver(Protocol):
 class Dirs:
     subdir: Path | str
     _dirs: IPlatformDirs = dirs
+    # blue/green deployments run each slot in its own runtime dir
+    slot: str | None = None
+    # allocated by glue for services with `allocate_port`
+    port: int | None = None
 
     def __truediv__(self, subdir: Path | str) -> Dirs:
         return replace(self, subdir=Path(self.subdir) / subdir)
 
-    @property
+    def with_slot(self, slot: str | None) -> Dirs:
+        return replace(self, slot=slot)
+
+    def with_port(self, port: int | None) -> Dirs:
+        return replace(self, port=port)
+
+    @functools.cached_property
     def runtime_dir(self) -> Path:
-        return self._dirs.user_runtime_path / self.subdir
+        path = self._dirs.user_runtime_path / self.subdir
+        if self.slot is not None:
+            path = path.with_name(f"{path.name}@{self.slot}")
+        return path
 
-    @property
+    @functools.cached_property
     def state_dir(self) -> Path:
         return self._dirs.user_state_path / self.subdir
 
-    def build_namespace(self) -> dict[str, Path]:
-        return {"xdg_run": self.runtime_dir, "xdg_state": self.state_dir}
+    def build_namespace(self) -> dict[str, Path | int]:
+        namespace: dict[str, Path | int] = {
+            "xdg_run": self.runtime_dir,
+            "xdg_state": self.state_dir,
+        }
+        if self.port is not None:
+            namespace["port"] = self.port
+        return namespace
+
+    @functools.cached_property
+    def _namespace(self) -> dict[str, Any]:
+        return {"env": os.environ, **self.build_namespace()}
 
     def resolve_vars(self, arg: str) -> str:
-        return arg.format(**self.build_namespace())
+        return compile_template(arg).render(self._namespace)
 
     def resolve_vars_list(self, args: list[str]) -> list[str]:
         return [self.resolve_vars(arg) for arg in args]
@@ -61,15 +168,89 @@ class Dirs:
         )
 
 
+def service_namespace(dirs: Dirs, config: ServiceConfig | None) -> SimpleNamespace:
+    """Build the variables of a service that others can refer to."""
+    namespace = SimpleNamespace(**dirs.build_namespace())
+    if config is not None:
+        namespace.env = {
+            k: v for k, v in config.read_env_file().items() if v is not None
+        }
+        if config.listen is not None:
+            address = dirs.resolve_vars(config.listen)
+            if address.startswith("tcp://"):
+                namespace.socket = address.removeprefix("tcp://")
+                namespace.port = int(namespace.socket.rpartition(":")[2])
+            else:
+                namespace.socket = address.removeprefix("unix://")
+    return namespace
+
+
 class DirResolver:
-    def __init__(self, dirs: dict[str, Dirs]) -> None:
-        self._dirs = dirs
+    """Resolves variables that refer to services, such as `{api.xdg_run}`.
+
+    The namespace is built once per config, and since it only changes on
+    `update`, resolved templates are cached unless they use `DYNAMIC_VARS`. This
+    keeps resolving on every request independent of the number of services.
+    """
+
+    def __init__(
+        self, dirs: dict[str, Dirs], services: Iterable[ServiceConfig] = ()
+    ) -> None:
+        self.update(dirs, services)
+
+    def update(
+        self, dirs: dict[str, Dirs], services: Iterable[ServiceConfig] = ()
+    ) -> None:
+        """Replace the services that can be referred to, such as after a reload."""
+        configs = {svc.name: svc for svc in services}
+        namespace: dict[str, Any] = {"env": os.environ}
+        for name, svc_dirs in dirs.items():
+            namespace[name] = service_namespace(svc_dirs, configs.get(name))
+        self._namespace = namespace
+        self._resolved: dict[str, str] = {}
 
     def resolve_vars(self, arg: str) -> str:
-        f_args: dict[str, Any] = {}
-        for name, dirs in self._dirs.items():
-            f_args[name] = SimpleNamespace(**dirs.build_namespace())
-        return arg.format(**f_args)
+        try:
+            return self._resolved[arg]
+        except KeyError:
+            pass
+        template = compile_template(arg)
+        value = template.render(self._namespace)
+        if template.names.isdisjoint(DYNAMIC_VARS):
+            self._resolved[arg] = value
+        return value
 
     def resolve_vars_list(self, args: list[str]) -> list[str]:
         return [self.resolve_vars(arg) for arg in args]
+
+
+def uri_to_path(uri: str) -> str:
+    p = urllib.parse.urlparse(uri)
+    assert p.scheme == "file"
+    return str(Path(p.netloc, p.path).absolute())
+
+
+class DirInfo(TypedDict, total=False):
+    editable: bool
+
+
+class DirectUrlJson(TypedDict):
+    url: str
+    dir_info: NotRequired[DirInfo]
+
+
+def get_editable_dirs() -> list[str]:
+    direct_url = importlib.metadata.distribution("glue").read_text("direct_url.json")
+    if direct_url:
+        data: DirectUrlJson = json.loads(direct_url)
+        if data.get("dir_info", {}).get("editable", False):
+            return [uri_to_path(data["url"])]
+    return []
+
+
+def get_reload_dirs() -> list[str]:
+    """List the dirs to watch for changes to glue's own code.
+
+    That is the checkout of an editable install, or else the installed package.
+    """
+    return get_editable_dirs() or [str(Path(__file__).parent)]
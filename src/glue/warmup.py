@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Union
+
+import httpx
+
+from .config import LocalAddressServer, UnixDomainSocketServer
+from .utils import compile_template
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+    from .config import Config
+    from .utils import DirResolver, Dirs
+
+__all__ = [
+    "DEFAULT_SERVER",
+    "HotPathTable",
+    "HotPaths",
+    "ProxyPassServer",
+    "WarmupResult",
+    "hot_paths_path",
+    "load_hot_paths",
+    "servers_in_front_of",
+    "warm_up",
+    "warmed_servers",
+]
+
+# the name of the default server's route in the proxy
+DEFAULT_SERVER = "default"
+
+# requests per path kept between halving the counts
+DECAY_PERIOD = 16
+
+ProxyPassServer = Union[UnixDomainSocketServer, LocalAddressServer]
+
+
+def hot_paths_path(dirs: Dirs) -> Path:
+    return dirs.runtime_dir / "hot-paths.json"
+
+
+def load_hot_paths(path: Path) -> dict[str, list[str]]:
+    """Read the hottest paths of every server, written by the proxy."""
+    try:
+        hot = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return {server: list(paths) for server, paths in hot.items()}
+
+
+class HotPaths:
+    """Counts the requests for the paths of a server, keeping the most frequent.
+
+    Up to twice `max_paths` are counted between trims, so trimming is cheap per
+    request. Counts are halved every `DECAY_PERIOD` requests per path kept, so
+    paths that are no longer requested make way for the ones that are.
+    """
+
+    def __init__(self, max_paths: int = 256) -> None:
+        self.max_paths = max_paths
+        self.counts: dict[str, float] = {}
+        self._since_decay = 0
+
+    def add(self, path: str) -> None:
+        self.counts[path] = self.counts.get(path, 0) + 1
+        self._since_decay += 1
+        if self._since_decay >= DECAY_PERIOD * self.max_paths:
+            self._since_decay = 0
+            self.counts = {p: n / 2 for p, n in self.counts.items() if n >= 2}
+        if len(self.counts) > 2 * self.max_paths:
+            self.counts = {p: self.counts[p] for p in self.top(self.max_paths)}
+
+    def top(self, n: int) -> list[str]:
+        return heapq.nlargest(n, self.counts, key=self.counts.__getitem__)
+
+
+class HotPathTable:
+    """The `HotPaths` of every server of a proxy, shared with the glue process.
+
+    Changes are written to `path` at most once every `interval` seconds, from
+    the event loop of the proxy.
+    """
+
+    def __init__(self, path: Path, *, interval: float = 1) -> None:
+        self.path = path
+        self.interval = interval
+        self.servers: dict[str, HotPaths] = {}
+        self._scheduled = False
+
+    def server(self, name: str, max_paths: int) -> HotPaths:
+        """Return the paths of a server, kept when its route is recreated."""
+        paths = self.servers.get(name)
+        if paths is None:
+            paths = self.servers[name] = HotPaths(max_paths)
+        paths.max_paths = max_paths
+        return paths
+
+    def retain(self, names: Iterable[str]) -> None:
+        """Forget the servers that are no longer warmed up, after a reload."""
+        names = set(names)
+        self.servers = {n: p for n, p in self.servers.items() if n in names}
+
+    def add(self, paths: HotPaths, path: str) -> None:
+        paths.add(path)
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_later(self.interval, self.save)
+
+    def save(self) -> None:
+        self._scheduled = False
+        hot = {name: paths.top(paths.max_paths) for name, paths in self.servers.items()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps(hot))
+        # the glue process never sees a half-written file
+        tmp.replace(self.path)
+
+
+def warmed_servers(config: Config) -> dict[str, ProxyPassServer]:
+    """Return the servers with warm-up configured, named like their routes."""
+    servers = {**config.servers}
+    if config.default_server is not None:
+        servers[DEFAULT_SERVER] = config.default_server
+    return {
+        name: server
+        for name, server in servers.items()
+        if isinstance(server, (UnixDomainSocketServer, LocalAddressServer))
+        and server.warmup is not None
+    }
+
+
+def servers_in_front_of(config: Config, service: str) -> dict[str, ProxyPassServer]:
+    """Return the warmed-up servers whose upstream address refers to `service`."""
+    return {
+        name: server
+        for name, server in warmed_servers(config).items()
+        if service in compile_template(_upstream(server)).names
+    }
+
+
+def _upstream(server: ProxyPassServer) -> str:
+    if isinstance(server, UnixDomainSocketServer):
+        return server.uds
+    return server.target
+
+
+@dataclass
+class WarmupResult:
+    fetched: int
+    failed: int
+    elapsed: float
+
+
+async def warm_up(
+    server: ProxyPassServer,
+    host: str,
+    paths: list[str],
+    resolver: DirResolver,
+) -> WarmupResult:
+    """Fetch `paths` from the upstream of a server, once it accepts connections.
+
+    Requests that cannot connect are retried until the service comes up or the
+    warm-up times out.
+    """
+    config = server.warmup
+    assert config is not None
+    started = time.monotonic()
+    deadline = started + config.timeout
+    semaphore = asyncio.Semaphore(config.concurrency)
+    # forwarded like the proxy does, for services that build URLs from it
+    headers = (
+        {}
+        if host == DEFAULT_SERVER
+        else {
+            "forwarded": f"host={host};proto=http",
+            "x-forwarded-host": host,
+            "x-forwarded-proto": "http",
+        }
+    )
+    fetched = failed = 0
+
+    async def fetch(client: httpx.AsyncClient, path: str) -> None:
+        nonlocal fetched, failed
+        async with semaphore:
+            while True:
+                try:
+                    await client.get(path, headers=headers)
+                except httpx.TransportError:  # noqa: PERF203
+                    # not accepting connections yet
+                    if time.monotonic() >= deadline:
+                        failed += 1
+                        return
+                    await asyncio.sleep(0.1)
+                except httpx.HTTPError:
+                    failed += 1
+                    return
+                else:
+                    fetched += 1
+                    return
+
+    factory = server.create_client_factory(resolver)
+    async with factory.create_http_client() as client:
+        client.timeout = httpx.Timeout(config.timeout)
+        await asyncio.gather(*(fetch(client, path) for path in paths))
+    return WarmupResult(fetched, failed, time.monotonic() - started)
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import fnmatch
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import watchfiles
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    from .config import WatchConfig
+    from .control.coordinator import AgentServiceInstance
+    from .pm import ServiceInstance
+
+__all__ = ["FileWatcher", "WatchRule"]
+
+
+def _matches(path: Path, patterns: list[str]) -> bool:
+    posix = path.as_posix()
+    return any(
+        fnmatch.fnmatch(posix, pattern)
+        or any(fnmatch.fnmatch(part, pattern) for part in path.parts)
+        for pattern in patterns
+    )
+
+
+@dataclass
+class WatchRule:
+    name: str
+    roots: list[Path]
+    include: list[str]
+    ignore: list[str]
+    debounce: float
+    callback: Callable[[], None]
+    # directory roots are watched with their subdirectories
+    recursive: bool = True
+
+    @classmethod
+    def from_config(
+        cls, name: str, cwd: Path, config: WatchConfig, callback: Callable[[], None]
+    ) -> WatchRule:
+        return cls(
+            name=name,
+            roots=[(cwd / p).resolve() for p in config.paths],
+            include=config.include,
+            ignore=config.ignore,
+            debounce=config.debounce,
+            callback=callback,
+        )
+
+    def matches(self, path: Path) -> bool:
+        for root in self.roots:
+            if path == root:
+                return True
+            if not path.is_relative_to(root):
+                continue
+
+            relpath = path.relative_to(root)
+            if self.ignore and _matches(relpath, self.ignore):
+                continue
+            if not self.include or _matches(relpath, self.include):
+                return True
+        return False
+
+
+class FileWatcher:
+    """A single file watcher shared by every service with a `watch` section.
+
+    Changes are collected per service and the service is restarted once no new
+    changes have come in for its debounce window, so an event storm such as a
+    git checkout results in a single restart.
+    """
+
+    def __init__(self, rules: Iterable[WatchRule]) -> None:
+        self.rules = list(rules)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._timers: dict[str, threading.Timer] = {}
+        # set to watch the roots of the rules again, once they were updated
+        self._wake = threading.Event()
+        # directories are watched with their subdirectories, files on their own
+        self._threads = [
+            threading.Thread(
+                target=self._run,
+                kwargs={"recursive": recursive},
+                name="glue-watcher",
+                daemon=True,
+            )
+            for recursive in (True, False)
+        ]
+
+    @classmethod
+    def for_services(
+        cls, services: Iterable[ServiceInstance | AgentServiceInstance]
+    ) -> FileWatcher:
+        services = list(services)
+        zygotes = [svc.zygote for svc in services if svc.zygote is not None]
+        watcher = cls(
+            [
+                *(
+                    WatchRule.from_config(
+                        svc.config.name,
+                        Path(svc.config.cwd),
+                        svc.config.watch,
+                        svc.restart,
+                    )
+                    for svc in services
+                    # agents watch the files of their services on their own machine
+                    if svc.config.watch is not None and svc.config.agent is None
+                ),
+                *(zygote.watch_rule() for zygote in zygotes),
+            ]
+        )
+        for zygote in zygotes:
+            zygote.watcher = watcher
+        return watcher
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> None:
+        if self.rules:
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        with self._lock:
+            self._wake.set()
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+
+    def take_over(self, old: FileWatcher) -> None:
+        """Stop `old`, and schedule the restarts it had pending on this watcher."""
+        with old._lock:
+            pending = set(old._timers)
+        old.stop()
+        for rule in self.rules:
+            if rule.name in pending:
+                self._schedule(rule)
+
+    def update(self, rule: WatchRule) -> None:
+        """Add `rule`, or replace the rule of the same name, and watch its roots."""
+        with self._lock:
+            self.rules = [r for r in self.rules if r.name != rule.name]
+            self.rules.append(rule)
+            wake, self._wake = self._wake, threading.Event()
+        wake.set()
+
+    def dispatch(self, paths: Iterable[Path]) -> None:
+        paths = list(paths)
+        for rule in self.rules:
+            if any(rule.matches(path) for path in paths):
+                self._schedule(rule)
+
+    def _schedule(self, rule: WatchRule) -> None:
+        with self._lock:
+            if (timer := self._timers.get(rule.name)) is not None:
+                timer.cancel()
+            timer = threading.Timer(rule.debounce, self._fire, args=(rule,))
+            timer.daemon = True
+            self._timers[rule.name] = timer
+            timer.start()
+
+    def _fire(self, rule: WatchRule) -> None:
+        with self._lock:
+            self._timers.pop(rule.name, None)
+        if not self._stopped.is_set():
+            rule.callback()
+
+    def _roots(self, *, recursive: bool) -> set[Path]:
+        roots = {(root, rule.recursive) for rule in self.rules for root in rule.roots}
+        if recursive:
+            dirs = {root for root, deep in roots if deep and root.is_dir()}
+            # nested roots are already covered by their parents
+            return {r for r in dirs if not any(p in dirs for p in r.parents)}
+        # files are watched through their directory, which keeps working when an
+        # editor replaces them on save, without the subdirectories
+        return {
+            root if root.is_dir() else root.parent
+            for root, deep in roots
+            if not (deep and root.is_dir()) and root.parent.is_dir()
+        }
+
+    def _run(self, *, recursive: bool) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                wake = self._wake
+                roots = self._roots(recursive=recursive)
+            if not roots:
+                wake.wait()
+                continue
+
+            for changes in watchfiles.watch(
+                *roots,
+                # the rules pick the files that matter, such as site-packages in a
+                # .venv, which the default filter ignores
+                watch_filter=watchfiles.DefaultFilter() if recursive else None,
+                stop_event=wake,
+                raise_interrupt=False,
+                recursive=recursive,
+            ):
+                self.dispatch(Path(path) for _, path in changes)
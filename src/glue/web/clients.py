@@ -1,50 +1,79 @@
-from typing import Protocol
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Protocol
 from urllib.parse import urlparse
 
 import httpx
-from starlette.websockets import WebSocket
 from websockets import Subprotocol
 from websockets.asyncio.client import connect, unix_connect
 
-from glue.utils import VarResolver
+from .native import ConnectionPool
+
+if TYPE_CHECKING:
+    from starlette.websockets import WebSocket
+
+    from glue.utils import VarResolver
 
 
 class ClientsFactory(Protocol):
     def create_http_client(self) -> httpx.AsyncClient: ...
-    def create_ws_client(self, websocket: WebSocket) -> connect: ...
+    def create_ws_client(
+        self, websocket: WebSocket, *, compression: bool = False
+    ) -> connect: ...
+    def get_connection_pool(self) -> ConnectionPool: ...
 
 
-def _get_protocols(websocket: WebSocket) -> list[Subprotocol]:
-    return [
-        Subprotocol(x.strip())
-        for x in websocket.headers.get("Sec-WebSocket-Protocol", "").split(",")
-    ]
+def _get_protocols(websocket: WebSocket) -> list[Subprotocol] | None:
+    # an empty list would still send the header, which servers reject
+    header = websocket.headers.get("Sec-WebSocket-Protocol", "")
+    return [Subprotocol(x.strip()) for x in header.split(",") if x.strip()] or None
 
 
 class URLClientFactory(ClientsFactory):
     def __init__(self, target: str, resolver: VarResolver) -> None:
         self.target = target
         self.resolver = resolver
+        self._pools: dict[str, ConnectionPool] = {}
 
     def create_http_client(self) -> httpx.AsyncClient:
         return httpx.AsyncClient(
             base_url=self.resolver.resolve_vars(self.target),
         )
 
-    def create_ws_client(self, websocket: WebSocket) -> connect:
+    def create_ws_client(
+        self, websocket: WebSocket, *, compression: bool = False
+    ) -> connect:
         urlp = urlparse(self.target)
         scheme = {"http": "ws", "https": "wss"}.get(urlp.scheme, "ws")
         url = str(websocket.url.replace(scheme=scheme, netloc=urlp.netloc))
         return connect(
             url,
             subprotocols=_get_protocols(websocket),
+            compression="deflate" if compression else None,
         )
 
+    def get_connection_pool(self) -> ConnectionPool:
+        # pools are kept per resolved target, which may change on a config reload
+        target = self.resolver.resolve_vars(self.target)
+        pool = self._pools.get(target)
+        if pool is None:
+            urlp = urlparse(target)
+            if urlp.scheme != "http":
+                msg = f"The h11 engine only supports http:// targets, not {target!r}"
+                raise ValueError(msg)
+            address = f"tcp://{urlp.hostname}:{urlp.port or 80}"
+            pool = ConnectionPool(address, host=urlp.netloc, prefix=urlp.path)
+            self._pools[target] = pool
+        return pool
+
 
 class UnixClientFactory(ClientsFactory):
     def __init__(self, uds: str, resolver: VarResolver) -> None:
         self.uds = uds
         self.resolver = resolver
+        # the pool of each socket path, with the file the path pointed to
+        self._pools: dict[str, tuple[str, ConnectionPool]] = {}
 
     def get_socket_path(self) -> str:
         return self.resolver.resolve_vars(self.uds)
@@ -57,10 +86,27 @@ class UnixClientFactory(ClientsFactory):
             ),
         )
 
-    def create_ws_client(self, websocket: WebSocket) -> connect:
+    def create_ws_client(
+        self, websocket: WebSocket, *, compression: bool = False
+    ) -> connect:
         url = str(websocket.url.replace(scheme="ws", netloc="localhost"))
         return unix_connect(
             self.get_socket_path(),
             url,
             subprotocols=_get_protocols(websocket),
+            compression="deflate" if compression else None,
         )
+
+    def get_connection_pool(self) -> ConnectionPool:
+        path = self.get_socket_path()
+        # a blue/green switch points a symlink on the path at the other slot, and
+        # kept-alive connections would keep reaching the old one until it stops
+        real = os.path.realpath(path)
+        entry = self._pools.get(path)
+        if entry is not None and entry[0] == real:
+            return entry[1]
+        if entry is not None:
+            entry[1].close()
+        pool = ConnectionPool(path, host="localhost")
+        self._pools[path] = (real, pool)
+        return pool
@@ -1,50 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import logging
 import os
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+import watchfiles
 from starlette.applications import Starlette
 from starlette.responses import Response
 from starlette.routing import BaseRoute, Host, Mount
 
-from glue.config import Config, load_config
+from glue import profiling
+from glue.config import Config, ServerConfig, load_config
+from glue.faults import FaultSwitches, switches_path
+from glue.ports import load_ports, ports_path
+from glue.streams import StreamGroup, metrics_path
 from glue.utils import DirResolver, Dirs
+from glue.warmup import HotPathTable, hot_paths_path, warmed_servers
 
+from .faults import FaultInjector
+from .record import Recorder
+from .warmup import HotPathRecorder
 
-def load_config_from_env() -> tuple[Config, DirResolver]:
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from starlette.types import ASGIApp
+
+logger = logging.getLogger("glue.web")
+
+
+def get_config_path() -> Path:
     config_file = os.environ.get("GLUE_CONFIG_FILE")
 
     if not config_file:
         msg = "Config file was not set. Was the server started though `glue.web.main`?"
         raise AssertionError(msg)
 
-    config_path = Path(config_file)
+    return Path(config_file)
 
-    config = load_config(config_path)
+
+def service_dirs(config_path: Path, config: Config) -> dict[str, Dirs]:
     dirs = Dirs.from_path(config_path)
-    resolver = DirResolver({svc.name: dirs / svc.name for svc in config.services})
+    # the ports glue allocated to services, which it shares with the proxy
+    ports = load_ports(ports_path(dirs))
+    return {
+        svc.name: (dirs / svc.name).with_port(ports.get(svc.name))
+        for svc in config.services
+    }
+
+
+def profile_dir(config_path: Path) -> Path:
+    return Dirs.from_path(config_path).state_dir / "profile"
+
+
+def recordings_dir(config_path: Path) -> Path:
+    return Dirs.from_path(config_path).state_dir / "recordings"
+
+
+def load_config_from_env() -> tuple[Config, DirResolver]:
+    config_path = get_config_path()
+
+    config = load_config(config_path)
+    resolver = DirResolver(service_dirs(config_path, config), config.services)
 
     return config, resolver
 
 
-def create_app() -> Starlette:
-    config, resolver = load_config_from_env()
+class RouteTable:
+    """Builds the routes of the proxy, keeping the routes of unchanged servers.
+
+    Routes are only created for servers that are new or whose config changed,
+    so the clients and state of every other server survive a config reload.
+
+    Servers with `record` set are recorded into a new file per server under
+    `record_dir`, and the fault rules of servers are applied if `switches` is
+    given. The GET requests of servers with `warmup` set are counted in
+    `hot_paths`, if given.
+    """
 
-    routes: list[BaseRoute] = []
+    def __init__(
+        self,
+        resolver: DirResolver,
+        *,
+        record_dir: Path | None = None,
+        switches: FaultSwitches | None = None,
+        hot_paths: HotPathTable | None = None,
+    ) -> None:
+        self.resolver = resolver
+        self.record_dir = record_dir
+        self.switches = switches
+        self.hot_paths = hot_paths
+        self._recordings = itertools.count()
+        self._hosts: dict[str, tuple[ServerConfig, BaseRoute]] = {}
+        self._default: tuple[ServerConfig | None, BaseRoute] | None = None
 
-    for name, server in config.servers.items():
-        routes.append(Host(name, server.create_route(resolver), name=name))
+    def build(self, config: Config) -> list[BaseRoute]:
+        if self.hot_paths is not None:
+            self.hot_paths.retain(warmed_servers(config))
+        hosts: dict[str, tuple[ServerConfig, BaseRoute]] = {}
+        for name, server in config.servers.items():
+            previous = self._hosts.get(name)
+            if previous is not None and previous[0] == server:
+                hosts[name] = previous
+            else:
+                route = Host(name, self._create_app(name, server), name=name)
+                hosts[name] = (server, route)
 
-    if config.default_server:
-        routes.append(
-            Mount(
+        default = self._default
+        if default is None or default[0] != config.default_server:
+            default = (config.default_server, self._default_route(config))
+
+        replaced = [route for _, route in self._hosts.values()]
+        if self._default is not None:
+            replaced.append(self._default[1])
+        self._hosts, self._default = hosts, default
+        routes = [route for _, route in hosts.values()] + [default[1]]
+
+        for old in replaced:
+            app = getattr(old, "app", None)
+            if isinstance(app, Recorder) and old not in routes:
+                app.close()
+        return routes
+
+    def _create_app(self, name: str, server: ServerConfig) -> ASGIApp:
+        app = server.create_route(self.resolver)
+        if self.record_dir is not None and getattr(server, "record", False):
+            # a recording starts over whenever the route is recreated
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = f"{stamp}-{os.getpid()}-{next(self._recordings)}.rec"
+            app = Recorder(
+                app,
+                self.record_dir / name / path,
+                keep_credentials=getattr(server, "record_credentials", False),
+            )
+        faults = getattr(server, "faults", None)
+        if self.switches is not None and faults:
+            app = FaultInjector(app, name, faults, self.switches)
+        warmup = getattr(server, "warmup", None)
+        if self.hot_paths is not None and warmup is not None:
+            paths = self.hot_paths.server(name, warmup.max_paths)
+            app = HotPathRecorder(app, paths, self.hot_paths)
+        return app
+
+    def _default_route(self, config: Config) -> BaseRoute:
+        if config.default_server:
+            return Mount(
                 "",
-                config.default_server.create_route(resolver),
+                self._create_app("default", config.default_server),
                 name="default-server",
             )
-        )
-    else:
         resp = Response("The resource is not available", status_code=502)
-        routes.append(Mount("", resp))
+        return Mount("", resp)
+
+
+async def watch_config(
+    app: Starlette,
+    config_path: Path,
+    table: RouteTable,
+    resolver: DirResolver,
+    streams: StreamGroup,
+    stop_event: asyncio.Event,
+) -> None:
+    """Swap the routes and streams whose config changed whenever the file is saved.
+
+    Targets are resolved again when glue allocates ports to new services, which
+    it may do after the proxy has seen the new config.
+    """
+    ports_file = ports_path(Dirs.from_path(config_path))
+    ports_file.parent.mkdir(parents=True, exist_ok=True)
+    paths = (config_path, ports_file)
+    # editors often replace the file, so watch the directories the files live in
+    async for changes in watchfiles.awatch(
+        config_path.parent, ports_file.parent, recursive=False, stop_event=stop_event
+    ):
+        if not any(Path(path) in paths for _, path in changes):
+            continue
+        try:
+            config = await asyncio.to_thread(load_config, config_path)
+            resolver.update(service_dirs(config_path, config), config.services)
+            routes = table.build(config)
+        except Exception:
+            logger.exception(
+                "Failed to reload %s, keeping the current routes", config_path
+            )
+            continue
+
+        # the router looks routes up on every request, so replacing them is atomic
+        app.router.routes = routes
+        await streams.apply(config.streams)
+        logger.info("Reloaded routes from %s", config_path)
+
+
+def create_app() -> Starlette:
+    config_path = get_config_path().absolute()
+    config, resolver = load_config_from_env()
+    dirs = Dirs.from_path(config_path)
+    table = RouteTable(
+        resolver,
+        record_dir=recordings_dir(config_path),
+        switches=FaultSwitches(switches_path(dirs)),
+        hot_paths=HotPathTable(hot_paths_path(dirs)),
+    )
+    streams = StreamGroup(resolver, metrics_file=metrics_path(dirs))
+
+    # the env var also reaches uvicorn's reload workers
+    if slow_callback := os.environ.get(profiling.PROFILE_ENV):
+        profiling.start_profiler(
+            profile_dir(config_path), name="proxy", slow_callback=float(slow_callback)
+        )
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        profiling.watch_running_loop("proxy")
+        await streams.apply(config.streams)
+        stop_event = asyncio.Event()
+        task = asyncio.create_task(
+            watch_config(app, config_path, table, resolver, streams, stop_event)
+        )
+        try:
+            yield
+        finally:
+            # cancelling would leave the watcher's thread blocked until exit
+            stop_event.set()
+            await task
+            await streams.close()
+            for path in profiling.stop_profiler():
+                logger.info("Saved profile to %s", path)
 
     return Starlette(
-        routes=routes,
+        routes=table.build(config),
+        lifespan=lifespan,
     )
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import logging
+import random
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+import anyio
+from starlette.responses import PlainTextResponse
+from starlette.websockets import WebSocketClose
+
+from glue.faults import check_rule, sample_delay
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+    from glue.config import FaultConfig
+    from glue.faults import FaultSwitches
+
+__all__ = ["FaultInjector"]
+
+# bandwidth limits are applied in slices of a tenth of a second
+_SLICES_PER_SECOND = 10
+
+logger = logging.getLogger("glue.web")
+
+# set in the task of a request whose response is dropped on purpose
+_dropped: ContextVar[bool] = ContextVar("dropped", default=False)
+
+
+class _DroppedResponseFilter(logging.Filter):
+    """Hides uvicorn's error about the responses dropped by a fault rule.
+
+    Uvicorn closes the connection of a response left incomplete, which is the
+    drop; only its error log is unwanted.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not (
+            _dropped.get()
+            and record.getMessage().startswith("ASGI callable returned without")
+        )
+
+
+_dropped_response_filter = _DroppedResponseFilter()
+
+
+class FaultInjector:
+    """Degrades the traffic of a server according to its fault rules.
+
+    Every rule that is switched on and matches the path of a request applies:
+    their delays add up, the lowest bandwidth wins, and each rule gets its own
+    chance to fail or drop the request.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        server: str,
+        rules: list[FaultConfig],
+        switches: FaultSwitches,
+        *,
+        rng: random.Random | None = None,
+    ) -> None:
+        for rule in rules:
+            check_rule(rule)
+        self.app = app
+        self.server = server
+        self.rules = rules
+        self.switches = switches
+        self.rng = rng or random.Random()  # noqa: S311
+        # adding the same filter again is a no-op
+        logging.getLogger("uvicorn.error").addFilter(_dropped_response_filter)
+
+    def active_rules(self, path: str) -> list[FaultConfig]:
+        return [
+            rule
+            for rule in self.rules
+            if path.startswith(rule.path)
+            and self.switches.is_enabled(self.server, rule)
+        ]
+
+    def _chance(self, percentage: float) -> bool:
+        return percentage > 0 and self.rng.random() * 100 < percentage
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        rules = self.active_rules(scope["path"])
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        delay = sum(sample_delay(rule, self.rng) for rule in rules)
+        if delay > 0:
+            await anyio.sleep(delay)
+
+        for rule in rules:
+            if self._chance(rule.error_rate):
+                await self._fail(scope, receive, send, rule.status)
+                return
+
+        drop = any(self._chance(rule.drop_rate) for rule in rules)
+        bandwidth = min(
+            (rule.bandwidth for rule in rules if rule.bandwidth), default=None
+        )
+        if drop or bandwidth:
+            send = self._degrade(send, drop=drop, bandwidth=bandwidth)
+        await self.app(scope, receive, send)
+
+    async def _fail(
+        self, scope: Scope, receive: Receive, send: Send, status: int
+    ) -> None:
+        if scope["type"] == "websocket":
+            # refuses the handshake
+            await WebSocketClose(code=1013)(scope, receive, send)
+        else:
+            await PlainTextResponse("Injected fault", status_code=status)(
+                scope, receive, send
+            )
+
+    def _degrade(self, send: Send, *, drop: bool, bandwidth: int | None) -> Send:
+        dropped = False
+
+        async def throttle(data: bytes) -> None:
+            if bandwidth:
+                await anyio.sleep(len(data) / bandwidth)
+
+        async def wrapper(message: Message) -> None:
+            nonlocal dropped
+            if dropped:
+                return  # the server finishes its side, the client is gone
+            kind = message["type"]
+            if drop and kind == "http.response.body":
+                # the server closes the connection when the body is incomplete
+                dropped = True
+                _dropped.set(True)
+                logger.debug("Dropped a response of %s", self.server)
+                return
+            if drop and kind == "websocket.send":
+                dropped = True
+                await send({"type": "websocket.close", "code": 1011})
+                return
+
+            if kind == "http.response.body" and bandwidth:
+                body = message.get("body", b"")
+                size = max(1, bandwidth // _SLICES_PER_SECOND)
+                for start in range(0, len(body), size):
+                    chunk = body[start : start + size]
+                    await send({"type": kind, "body": chunk, "more_body": True})
+                    await throttle(chunk)
+                await send({"type": kind, "more_body": message.get("more_body", False)})
+                return
+            if kind == "websocket.send":
+                await throttle(message.get("bytes") or message.get("text", "").encode())
+            await send(message)
+
+        return wrapper
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import errno
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import uvicorn
+from starlette.applications import Starlette
+from uvicorn.logging import DefaultFormatter
+
+from glue import profiling
+from glue.streams import StreamGroup
+
+from .factory import RouteTable
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from glue.config import Config
+    from glue.faults import FaultSwitches
+    from glue.utils import DirResolver
+    from glue.warmup import HotPathTable
+
+__all__ = ["InProcessProxy"]
+
+_LOGGERS = ("uvicorn", "glue.web")
+
+
+class InProcessProxy:
+    """Runs the proxy on its own event loop thread inside the glue process.
+
+    The proxy shares the manager's parsed config and `DirResolver` instead of
+    loading them again in a child process, and `apply_config` swaps routes as
+    soon as the manager has applied a new config.
+
+    It implements `Process`, so the `:root:` service hosts it like any other
+    process: log records are written to a pipe that the service reads as its
+    output, and stopping it shuts the server down gracefully.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        resolver: DirResolver,
+        *,
+        host: str,
+        port: int,
+        record_dir: Path | None = None,
+        switches: FaultSwitches | None = None,
+        hot_paths: HotPathTable | None = None,
+        streams_metrics: Path | None = None,
+    ) -> None:
+        self.table = RouteTable(
+            resolver, record_dir=record_dir, switches=switches, hot_paths=hot_paths
+        )
+        self.app = Starlette(routes=self.table.build(config))
+        self.config = config
+        self.streams = StreamGroup(resolver, metrics_file=streams_metrics)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                self.app,
+                host=host,
+                port=port,
+                lifespan="on",
+                timeout_graceful_shutdown=5,
+                log_config=None,
+                access_log=False,
+            )
+        )
+
+        read_fd, write_fd = os.pipe()
+        self._read_fd: int | None = read_fd
+        self._output = os.fdopen(write_fd, "w", buffering=1, encoding="utf-8")
+        self._handler = logging.StreamHandler(self._output)
+        self._handler.setFormatter(DefaultFormatter("%(levelprefix)s %(message)s"))
+        self._thread = threading.Thread(
+            target=self._run, name="glue-proxy", daemon=True
+        )
+
+    @property
+    def pid(self) -> int:
+        return os.getpid()
+
+    def start(self) -> None:
+        for name in _LOGGERS:
+            logger = logging.getLogger(name)
+            logger.addHandler(self._handler)
+            logger.setLevel(logging.INFO)
+            # keep the records out of the terminal the TUI is drawing on
+            logger.propagate = False
+        self._thread.start()
+
+    async def _serve(self) -> None:
+        profiling.watch_running_loop("proxy")
+        self._loop = asyncio.get_running_loop()
+        await self.streams.apply(self.config.streams)
+        try:
+            await self.server.serve()
+        finally:
+            self._loop = None
+            await self.streams.close()
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._serve())
+        except SystemExit:
+            pass  # uvicorn exits when it cannot bind, after logging why
+        finally:
+            for name in _LOGGERS:
+                logging.getLogger(name).removeHandler(self._handler)
+            # the reader sees the end of the output once the server is gone
+            self._output.close()
+
+    def apply_config(self, config: Config) -> None:
+        """Swap the routes and streams whose config changed, from any thread."""
+        # the router looks routes up on every request, so replacing them is atomic
+        self.app.router.routes = self.table.build(config)
+        self.config = config
+        if (loop := self._loop) is not None:
+            asyncio.run_coroutine_threadsafe(self.streams.apply(config.streams), loop)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def read(self, length: int) -> bytes:
+        if self._read_fd is None:
+            raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        data = os.read(self._read_fd, length)
+        if not data:
+            os.close(self._read_fd)
+            self._read_fd = None
+        return data
+
+    def write(self, data: bytes) -> None:
+        pass  # the proxy has no input
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+    def __del__(self) -> None:
+        if self._read_fd is not None:
+            with contextlib.suppress(OSError):
+                os.close(self._read_fd)
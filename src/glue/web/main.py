@@ -1,41 +1,14 @@
 from __future__ import annotations
 
-import importlib.metadata
-import json
 import os
-import urllib.parse
 from pathlib import Path
-from typing import TypedDict
 
 import click
 import uvicorn
-from typing_extensions import NotRequired
 
+from glue import profiling
 from glue.config import Config, load_config
-
-
-def uri_to_path(uri: str) -> str:
-    p = urllib.parse.urlparse(uri)
-    assert p.scheme == "file"
-    return str(Path(p.netloc, p.path).absolute())
-
-
-class DirInfo(TypedDict, total=False):
-    editable: bool
-
-
-class DirectUrlJson(TypedDict):
-    url: str
-    dir_info: NotRequired[DirInfo]
-
-
-def get_editable_dirs() -> list[str]:
-    direct_url = importlib.metadata.distribution("glue").read_text("direct_url.json")
-    if direct_url:
-        data: DirectUrlJson = json.loads(direct_url)
-        if data.get("dir_info", {}).get("editable", False):
-            return [uri_to_path(data["url"])]
-    return []
+from glue.utils import get_reload_dirs
 
 
 def get_service_paths(config: Config) -> list[str]:
@@ -47,9 +20,32 @@ def get_service_paths(config: Config) -> list[str]:
 @click.option("--host", type=str, default="127.0.0.1")
 @click.option("--port", type=int, default=8000)
 @click.option("--reload", type=bool, is_flag=True)
-def main(config_path: Path, *, host: str, port: int, reload: bool) -> None:
+@click.option(
+    "--profile",
+    type=bool,
+    is_flag=True,
+    help="Sample every thread and save the profile to the state dir on exit.",
+)
+@click.option(
+    "--slow-callback",
+    type=float,
+    default=0.1,
+    help="Report event loop stalls longer than this many seconds when profiling.",
+)
+def main(
+    config_path: Path,
+    *,
+    host: str,
+    port: int,
+    reload: bool,
+    profile: bool,
+    slow_callback: float,
+) -> None:
     """Start and manage development infrastructure."""
     os.environ["GLUE_CONFIG_FILE"] = str(config_path.absolute())
+    if profile:
+        # the profiler is started by the app factory, wherever uvicorn runs it
+        os.environ[profiling.PROFILE_ENV] = str(slow_callback)
 
     config = load_config(config_path)
 
@@ -61,7 +57,7 @@ def main(config_path: Path, *, host: str, port: int, reload: bool) -> None:
         lifespan="on",
         timeout_graceful_shutdown=5,
         factory=True,
-        reload_dirs=get_editable_dirs() if reload else None,
+        reload_dirs=get_reload_dirs() if reload else None,
         reload_includes=[str(config_path)] if reload else None,
         reload_excludes=get_service_paths(config) if reload else None,
         access_log=False,
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+import anyio
+import h11
+from starlette import status
+from starlette.exceptions import HTTPException
+from starlette.requests import ClientDisconnect
+
+if TYPE_CHECKING:
+    from starlette.types import Receive, Scope, Send
+
+__all__ = ["ConnectionPool", "NativeHttpHandler"]
+
+CHUNK = 64 * 1024
+
+# connection-specific headers, which h11 and the ASGI server set for each side
+_HOP_BY_HOP = frozenset(
+    {
+        b"connection",
+        b"host",
+        b"keep-alive",
+        b"proxy-connection",
+        b"te",
+        b"trailer",
+        b"transfer-encoding",
+        b"upgrade",
+    }
+)
+
+
+class Connection:
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        *,
+        read_timeout: float,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.read_timeout = read_timeout
+        self.state = h11.Connection(h11.CLIENT)
+        self.idle_since = 0.0
+
+    async def send(self, event: h11.Event) -> None:
+        data = self.state.send(event)
+        if data:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def next_event(self) -> h11.Event:
+        while True:
+            event = self.state.next_event()
+            if event is not h11.NEED_DATA:
+                return event  # type: ignore[return-value]
+            with anyio.fail_after(self.read_timeout):
+                data = await self.reader.read(CHUNK)
+            self.state.receive_data(data)
+
+    @property
+    def usable(self) -> bool:
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Keeps HTTP/1.1 connections to an upstream alive between requests.
+
+    The most recently used connection is handed out first, so connections that
+    sat idle for longer than `idle_timeout` (just under uvicorn's keep-alive
+    timeout) are the ones that get closed. Connecting and every read give up
+    after `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        *,
+        host: str,
+        prefix: str = "",
+        max_idle: int = 100,
+        idle_timeout: float = 4.0,
+        timeout: float = 30,
+    ) -> None:
+        self.address = address
+        self.host = host.encode("latin-1")
+        self.prefix = prefix.rstrip("/").encode()
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: list[Connection] = []
+        self._closed = False
+
+    async def _connect(self) -> Connection:
+        if self.address.startswith("tcp://"):
+            host, _, port = self.address.removeprefix("tcp://").rpartition(":")
+            reader, writer = await asyncio.open_connection(host, int(port))
+        else:
+            path = self.address.removeprefix("unix://")
+            reader, writer = await asyncio.open_unix_connection(path)
+        return Connection(reader, writer, read_timeout=self.timeout)
+
+    async def acquire(self) -> Connection:
+        now = time.monotonic()
+        while self._idle:
+            conn = self._idle.pop()
+            if now - conn.idle_since < self.idle_timeout and conn.usable:
+                return conn
+            conn.close()
+        return await self._connect()
+
+    def release(self, conn: Connection) -> None:
+        state = conn.state
+        if (
+            not self._closed
+            and state.our_state is h11.DONE
+            and state.their_state is h11.DONE
+            and len(self._idle) < self.max_idle
+        ):
+            state.start_next_cycle()
+            conn.idle_since = time.monotonic()
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self) -> None:
+        """Close the idle connections, and the busy ones once they are released."""
+        self._closed = True
+        for conn in self._idle:
+            conn.close()
+        self._idle.clear()
+
+
+class NativeHttpHandler:
+    """Forwards a request with h11 over a pooled connection.
+
+    Headers are passed along as the raw bytes of the ASGI scope, and both bodies
+    are streamed as they arrive, without building URLs or header models.
+    Response bodies keep their content encoding.
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+
+    def prepare_headers(self, scope: Scope) -> list[tuple[bytes, bytes]]:
+        headers = [(b"host", self.pool.host)]
+        chunked = False
+        host = b""
+        for name, value in scope["headers"]:
+            if name == b"host":
+                host = value
+            elif name == b"transfer-encoding":
+                chunked = True
+            if name not in _HOP_BY_HOP:
+                headers.append((name, value))
+        if chunked:
+            headers.append((b"transfer-encoding", b"chunked"))
+
+        if client := scope.get("client"):
+            forwarded = {
+                b"for": client[0].encode(),
+                b"host": host,
+                b"proto": scope["scheme"].encode(),
+            }
+            headers.append(
+                (b"forwarded", b";".join(k + b"=" + v for k, v in forwarded.items()))
+            )
+            headers.extend((b"x-forwarded-" + k, v) for k, v in forwarded.items())
+        return headers
+
+    def target(self, scope: Scope) -> bytes:
+        path = scope.get("raw_path") or scope["path"].encode()
+        if query := scope["query_string"]:
+            path += b"?" + query
+        return self.pool.prefix + path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            with anyio.fail_after(self.pool.timeout):
+                conn = await self.pool.acquire()
+        except TimeoutError:
+            raise HTTPException(status.HTTP_504_GATEWAY_TIMEOUT) from None
+        except OSError:
+            raise HTTPException(status.HTTP_502_BAD_GATEWAY) from None
+
+        started = False
+        try:
+            await self._send_request(conn, scope, receive)
+            response = await self._receive_head(conn)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (k, v) for k, v in response.headers if k not in _HOP_BY_HOP
+                    ],
+                }
+            )
+            started = True
+            await self._stream_body(conn, send)
+        except ClientDisconnect:
+            conn.close()
+        except (TimeoutError, OSError, h11.ProtocolError) as e:
+            conn.close()
+            if started:
+                raise  # the server aborts a response that cannot be completed
+            code = (
+                status.HTTP_504_GATEWAY_TIMEOUT
+                if isinstance(e, TimeoutError)
+                else status.HTTP_502_BAD_GATEWAY
+            )
+            raise HTTPException(code) from None
+        except BaseException:
+            conn.close()
+            raise
+        else:
+            self.pool.release(conn)
+
+    async def _send_request(
+        self, conn: Connection, scope: Scope, receive: Receive
+    ) -> None:
+        await conn.send(
+            h11.Request(
+                method=scope["method"],
+                target=self.target(scope),
+                headers=self.prepare_headers(scope),
+            )
+        )
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnect
+            if body := message.get("body"):
+                await conn.send(h11.Data(data=body))
+            more_body = message.get("more_body", False)
+        await conn.send(h11.EndOfMessage())
+
+    async def _receive_head(self, conn: Connection) -> h11.Response:
+        while True:
+            event = await conn.next_event()
+            if isinstance(event, h11.Response):
+                return event
+            if not isinstance(event, h11.InformationalResponse):
+                msg = f"Expected a response, got {event!r}"
+                raise h11.RemoteProtocolError(msg)
+
+    async def _stream_body(self, conn: Connection, send: Send) -> None:
+        while True:
+            event = await conn.next_event()
+            if isinstance(event, h11.EndOfMessage):
+                break
+            if not isinstance(event, h11.Data):
+                msg = f"Expected the response body, got {event!r}"
+                raise h11.RemoteProtocolError(msg)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": bytes(event.data),
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
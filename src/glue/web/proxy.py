@@ -1,33 +1,57 @@
 from __future__ import annotations
 
-import contextlib
 from typing import TYPE_CHECKING
 
-import anyio
 import httpx
 from starlette import status
+from starlette.datastructures import Headers
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import Response, StreamingResponse
-from starlette.websockets import WebSocket, WebSocketDisconnect
-from websockets import ConnectionClosed, InvalidState
+from starlette.websockets import WebSocket
+
+from .native import NativeHttpHandler
+from .relay import WebSocketHandler
 
 if TYPE_CHECKING:
+    from collections.abc import Mapping
+    from typing import Any
+
     from starlette.types import Receive, Scope, Send
-    from websockets.asyncio.connection import Connection
+
+    from glue.config import WebSocketConfig
 
     from .clients import ClientsFactory
 
+ENGINES = ("httpx", "h11")
+
 
 class ProxyApp:
-    def __init__(self, clients_factory: ClientsFactory) -> None:
+    def __init__(
+        self,
+        clients_factory: ClientsFactory,
+        *,
+        engine: str = "httpx",
+        websocket: WebSocketConfig | None = None,
+    ) -> None:
+        if engine not in ENGINES:
+            msg = f"Unknown engine {engine!r}, expected one of {ENGINES}"
+            raise ValueError(msg)
         self.clients = clients_factory
+        self.max_queue = websocket.max_queue if websocket else 32
+        self.compression = websocket.compression if websocket else False
 
         self.handlers = {
-            "http": self.handle_http,
+            "http": self.handle_http if engine == "httpx" else self.handle_http_native,
             "websocket": self.handle_websocket,
         }
 
+    def profile_label(self, f_locals: Mapping[str, Any]) -> str:
+        """Name the vhost of the request being handled, for stall reports."""
+        scope = f_locals.get("scope")
+        host = Headers(scope=scope).get("host") if scope else None
+        return f"vhost {host or '?'}"
+
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         handler = self.handlers.get(scope["type"])
         if handler is not None:
@@ -37,14 +61,27 @@ class ProxyApp:
         request = Request(scope, receive, send)
         async with self.clients.create_http_client() as client:
             handler = HttpHandler(client)
-            await handler(request)
+            response = await handler(request)
+            await response(scope, receive, send)
+
+    async def handle_http_native(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        handler = NativeHttpHandler(self.clients.get_connection_pool())
+        await handler(scope, receive, send)
 
     async def handle_websocket(
         self, scope: Scope, receive: Receive, send: Send
     ) -> None:
         websocket = WebSocket(scope, receive, send)
-        async with self.clients.create_ws_client(websocket) as client:
-            handler = WebSocketHandler(client)
+        # the service's side is only compressed when the browser's side is as well
+        offered = "permessage-deflate" in websocket.headers.get(
+            "sec-websocket-extensions", ""
+        )
+        async with self.clients.create_ws_client(
+            websocket, compression=self.compression and offered
+        ) as client:
+            handler = WebSocketHandler(client, max_queue=self.max_queue)
             await handler(websocket)
 
 
@@ -93,49 +130,11 @@ class HttpHandler:
         # content-encoding should be removed to prevent invalid client response decoding
         if "content-encoding" in resp_headers:
             del resp_headers["content-encoding"]
+            # the length was that of the encoded body
+            resp_headers.pop("content-length", None)
 
         return StreamingResponse(
             content=resp.iter_bytes(),
             status_code=resp.status_code,
             headers=resp_headers,
         )
-
-
-class WebSocketHandler:
-    def __init__(self, client: Connection) -> None:
-        self.client = client
-
-    async def recv_client(self, websocket: WebSocket) -> None:
-        try:
-            while True:
-                data = await self.client.recv()
-                if isinstance(data, str):
-                    await websocket.send_text(data)
-                else:
-                    await websocket.send_bytes(data)
-        except ConnectionClosed as e:
-            with contextlib.suppress(RuntimeError):
-                await websocket.close(e.code, e.reason)
-
-    async def recv_server(self, websocket: WebSocket) -> None:
-        try:
-            while True:
-                msg = await websocket.receive()
-                if msg["type"] == "websocket.disconnect":
-                    await self.client.close(msg["code"], msg.get("reason", ""))
-                    break
-
-                if "bytes" in msg:
-                    await self.client.send(msg["bytes"])
-                elif "text" in msg:
-                    await self.client.send(msg["text"])
-        except WebSocketDisconnect as e:
-            with contextlib.suppress(InvalidState):
-                await self.client.close(e.code, e.reason)
-
-    async def __call__(self, websocket: WebSocket) -> None:
-        async with anyio.create_task_group() as tg:
-            tg.start_soon(self.recv_client, websocket)
-            tg.start_soon(self.recv_server, websocket)
-
-            await websocket.accept(subprotocol=self.client.subprotocol)
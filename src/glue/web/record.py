@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import itertools
+import json
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = ["Exchange", "Frame", "Recorder", "load_exchanges", "read_events"]
+
+# every event is framed by the sizes of its json header and its raw body
+_FRAME = struct.Struct("<II")
+MAX_BODY = 1024 * 1024
+# headers that carry credentials, whose values are left out of recordings
+CREDENTIAL_HEADERS = frozenset(
+    {"authorization", "proxy-authorization", "cookie", "set-cookie"}
+)
+REDACTED = "[redacted]"
+
+
+def _headers(
+    scope_headers: list[tuple[bytes, bytes]], *, redact: bool
+) -> list[list[str]]:
+    headers = []
+    for k, v in scope_headers:
+        name = k.decode("latin-1")
+        if redact and name.lower() in CREDENTIAL_HEADERS:
+            headers.append([name, REDACTED])
+        else:
+            headers.append([name, v.decode("latin-1")])
+    return headers
+
+
+class Recorder:
+    """Records the traffic of a vhost into an append-only file.
+
+    Wraps the route of a server as ASGI middleware and writes an event for every
+    request and response once its body is complete, and for every WebSocket
+    frame as it passes, each stamped with the seconds since recording started.
+    Bodies are stored as raw bytes, cut off after `max_body` bytes. The values of
+    `CREDENTIAL_HEADERS` are redacted, unless `keep_credentials` is set.
+
+    Events are written by a background thread, so the event loop never waits for
+    the disk.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        path: Path,
+        *,
+        max_body: int = MAX_BODY,
+        keep_credentials: bool = False,
+    ) -> None:
+        self.app = app
+        self.path = path
+        self.max_body = max_body
+        self.keep_credentials = keep_credentials
+        self._ids = itertools.count()
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+        self._pending: list[bytes] = []
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def _write(self, event: dict[str, Any], body: bytes = b"") -> None:
+        header = json.dumps(event, separators=(",", ":")).encode()
+        with self._cond:
+            if self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="glue-recorder", daemon=True
+                )
+                self._thread.start()
+            self._pending.append(_FRAME.pack(len(header), len(body)) + header + body)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("ab") as f:
+            closed = False
+            while not closed:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._pending or self._closed)
+                    pending, self._pending = self._pending, []
+                    closed = self._closed
+                f.writelines(pending)
+                # small writes go to the page cache, and flushing keeps the file
+                # usable if glue is killed
+                f.flush()
+
+    def _now(self) -> float:
+        return time.monotonic() - self._started
+
+    def _capture(self, buffer: bytearray, data: bytes) -> None:
+        if len(buffer) < self.max_body:
+            buffer += data[: self.max_body - len(buffer)]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            await self._record_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._record_websocket(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    def _request_event(
+        self, scope: Scope, exchange_id: int, start: float
+    ) -> dict[str, Any]:
+        return {
+            "e": "request",
+            "id": exchange_id,
+            "t": start,
+            "type": scope["type"],
+            "method": scope.get("method", "GET"),
+            "path": scope["path"],
+            "query": scope["query_string"].decode("latin-1"),
+            "headers": _headers(scope["headers"], redact=not self.keep_credentials),
+        }
+
+    async def _record_http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        exchange_id, start = next(self._ids), self._now()
+        request_body, response_body = bytearray(), bytearray()
+        response: dict[str, Any] = {"e": "response", "id": exchange_id, "status": 0}
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                self._capture(request_body, message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = _headers(
+                    message.get("headers", []), redact=not self.keep_credentials
+                )
+            elif message["type"] == "http.response.body":
+                self._capture(response_body, message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            request = self._request_event(scope, exchange_id, start)
+            self._write(request, bytes(request_body))
+            response["t"] = self._now()
+            self._write(response, bytes(response_body))
+
+    async def _record_websocket(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        exchange_id = next(self._ids)
+        self._write(self._request_event(scope, exchange_id, self._now()))
+
+        def frame(kind: str, message: Message) -> None:
+            text = message.get("text")
+            data = text.encode() if text is not None else message.get("bytes") or b""
+            event = {
+                "e": kind,
+                "id": exchange_id,
+                "t": self._now(),
+                "text": text is not None,
+            }
+            self._write(event, data[: self.max_body])
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                frame("ws_in", message)
+            elif message["type"] == "websocket.disconnect":
+                self._write({"e": "close", "id": exchange_id, "t": self._now()})
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "websocket.send":
+                frame("ws_out", message)
+            await send(message)
+
+        await self.app(scope, receive_wrapper, send_wrapper)
+
+    def close(self) -> None:
+        """Write out the events that are still pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+def read_events(path: Path) -> Iterator[tuple[dict[str, Any], bytes]]:
+    """Read the events of a recording, ignoring a torn write at its end."""
+    with path.open("rb") as f:
+        while len(frame := f.read(_FRAME.size)) == _FRAME.size:
+            header_size, body_size = _FRAME.unpack(frame)
+            header = f.read(header_size)
+            body = f.read(body_size)
+            if len(header) < header_size or len(body) < body_size:
+                return
+            yield json.loads(header), body
+
+
+@dataclass
+class Frame:
+    time: float
+    incoming: bool
+    """Whether the frame was sent by the client."""
+    text: bool
+    data: bytes
+
+
+@dataclass
+class Exchange:
+    """A request and its response, or a WebSocket session, as recorded."""
+
+    id: int
+    type: str
+    start: float
+    method: str
+    path: str
+    query: str
+    headers: list[list[str]]
+    body: bytes
+    status: int = 0
+    response_headers: list[list[str]] = field(default_factory=list)
+    response_body: bytes = b""
+    end: float | None = None
+    frames: list[Frame] = field(default_factory=list)
+
+    @property
+    def host(self) -> str:
+        return next((v for k, v in self.headers if k.lower() == "host"), "")
+
+    @property
+    def latency(self) -> float | None:
+        return None if self.end is None else self.end - self.start
+
+
+def load_exchanges(path: Path) -> list[Exchange]:
+    """Group the events of a recording into exchanges, in the order they started."""
+    exchanges: dict[int, Exchange] = {}
+    for event, body in read_events(path):
+        kind = event["e"]
+        if kind == "request":
+            exchanges[event["id"]] = Exchange(
+                id=event["id"],
+                type=event["type"],
+                start=event["t"],
+                method=event["method"],
+                path=event["path"],
+                query=event["query"],
+                headers=event["headers"],
+                body=body,
+            )
+            continue
+        exchange = exchanges.get(event["id"])
+        if exchange is None:
+            continue  # its request was lost to a torn write
+        if kind == "response":
+            exchange.status = event["status"]
+            exchange.response_headers = event.get("headers", [])
+            exchange.response_body = body
+            exchange.end = event["t"]
+        elif kind in ("ws_in", "ws_out"):
+            exchange.frames.append(
+                Frame(event["t"], kind == "ws_in", event["text"], body)
+            )
+        elif kind == "close":
+            exchange.end = event["t"]
+    return sorted(exchanges.values(), key=lambda exchange: exchange.start)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Union
+
+import anyio
+from starlette.websockets import WebSocketDisconnect
+from websockets import ConnectionClosed
+
+if TYPE_CHECKING:
+    from anyio.abc import TaskGroup
+    from starlette.websockets import WebSocket
+    from websockets.asyncio.connection import Connection
+
+__all__ = ["Direction", "WebSocketHandler", "WebSocketMetrics"]
+
+logger = logging.getLogger("glue.web")
+
+# close codes that are reported, but must never be sent in a close frame
+_RESERVED_CODES = frozenset({1005, 1006, 1015})
+
+
+@dataclass
+class _Close:
+    code: int
+    reason: str = ""
+
+    @property
+    def sendable_code(self) -> int:
+        return 1000 if self.code in _RESERVED_CODES else self.code
+
+
+_Item = Union[str, bytes, _Close]
+
+
+def _size(data: str | bytes) -> int:
+    # ASCII text is as long as its encoding, which spares encoding it again
+    if isinstance(data, str) and not data.isascii():
+        return len(data.encode())
+    return len(data)
+
+
+@dataclass
+class Direction:
+    messages: int = 0
+    size: int = 0
+    """Payload bytes, before compression."""
+    max_queue: int = 0
+    """The most messages that were waiting to be sent at once."""
+    stalls: int = 0
+    """Times the reader had to wait for the queue to make room."""
+
+    def rate(self, elapsed: float) -> float:
+        return self.messages / elapsed if elapsed > 0 else 0.0
+
+
+@dataclass
+class WebSocketMetrics:
+    path: str
+    started: float = field(default_factory=time.monotonic)
+    inbound: Direction = field(default_factory=Direction)
+    """Messages from the browser to the service."""
+    outbound: Direction = field(default_factory=Direction)
+    """Messages from the service to the browser."""
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        parts = [
+            f"{name} {d.messages} msgs ({d.rate(elapsed):.1f}/s), {d.size} bytes, "
+            f"queue peak {d.max_queue}, {d.stalls} stalls"
+            for name, d in (("in", self.inbound), ("out", self.outbound))
+        ]
+        return f"{self.path} closed after {elapsed:.1f}s: " + "; ".join(parts)
+
+
+class WebSocketHandler:
+    """Relays the messages of a WebSocket between the browser and a service.
+
+    Each direction has a reader that queues messages and a writer that sends
+    them on. Once `max_queue` messages are waiting, the reader stops reading, so
+    a slow receiver holds its sender back through the socket buffers and TCP
+    flow control instead of messages piling up in the proxy.
+    """
+
+    def __init__(self, client: Connection, *, max_queue: int = 32) -> None:
+        if max_queue < 1:
+            msg = f"max_queue must be at least 1, got {max_queue}"
+            raise ValueError(msg)
+        self.client = client
+        self.max_queue = max_queue
+        self.metrics: WebSocketMetrics | None = None
+
+    async def __call__(self, websocket: WebSocket) -> None:
+        await websocket.accept(subprotocol=self.client.subprotocol)
+        metrics = self.metrics = WebSocketMetrics(websocket.url.path)
+        inbound: asyncio.Queue[_Item] = asyncio.Queue(self.max_queue)
+        outbound: asyncio.Queue[_Item] = asyncio.Queue(self.max_queue)
+        try:
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(self._read_browser, websocket, inbound, metrics.inbound)
+                tg.start_soon(self._write_service, inbound, metrics.inbound, tg)
+                tg.start_soon(self._read_service, outbound, metrics.outbound)
+                tg.start_soon(
+                    self._write_browser, websocket, outbound, metrics.outbound, tg
+                )
+        finally:
+            logger.info("WebSocket %s", metrics.summary())
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue[_Item], data: _Item, d: Direction) -> None:
+        if queue.full():
+            d.stalls += 1
+        await queue.put(data)
+        d.max_queue = max(d.max_queue, queue.qsize())
+
+    async def _read_browser(
+        self, websocket: WebSocket, queue: asyncio.Queue[_Item], d: Direction
+    ) -> None:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await queue.put(
+                    _Close(message.get("code", 1000), message.get("reason") or "")
+                )
+                return
+            data = message.get("bytes")
+            if data is None:
+                data = message.get("text")
+            if data is not None:
+                await self._put(queue, data, d)
+
+    async def _read_service(self, queue: asyncio.Queue[_Item], d: Direction) -> None:
+        try:
+            while True:
+                await self._put(queue, await self.client.recv(), d)
+        except ConnectionClosed as e:
+            # a service that vanished without a close frame is an error to the browser
+            close = _Close(e.rcvd.code, e.rcvd.reason) if e.rcvd else _Close(1011)
+            await queue.put(close)
+
+    async def _write_service(
+        self, queue: asyncio.Queue[_Item], d: Direction, tg: TaskGroup
+    ) -> None:
+        try:
+            while not isinstance(item := await queue.get(), _Close):
+                await self.client.send(item)
+                d.messages += 1
+                d.size += _size(item)
+            await self.client.close(item.sendable_code, item.reason)
+        except ConnectionClosed:
+            pass
+        finally:
+            tg.cancel_scope.cancel()
+
+    async def _write_browser(
+        self,
+        websocket: WebSocket,
+        queue: asyncio.Queue[_Item],
+        d: Direction,
+        tg: TaskGroup,
+    ) -> None:
+        try:
+            while not isinstance(item := await queue.get(), _Close):
+                if isinstance(item, str):
+                    await websocket.send_text(item)
+                else:
+                    await websocket.send_bytes(item)
+                d.messages += 1
+                d.size += _size(item)
+            with contextlib.suppress(RuntimeError):
+                await websocket.close(item.sendable_code, item.reason)
+        except (OSError, WebSocketDisconnect):
+            pass  # the browser went away
+        finally:
+            tg.cancel_scope.cancel()
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import difflib
+import itertools
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import click
+import httpx
+from rich.console import Console
+from rich.table import Table
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from .record import REDACTED, load_exchanges
+
+if TYPE_CHECKING:
+    from websockets.asyncio.client import ClientConnection
+
+    from .record import Exchange
+
+__all__ = ["Replay", "Report", "main"]
+
+# set by httpx itself, and would be wrong for a body that is sent as a whole
+_SKIPPED_HEADERS = frozenset({"content-length", "transfer-encoding", "connection"})
+
+out = Console()
+
+
+@dataclass
+class Result:
+    exchange: Exchange
+    latency: float
+    status: int
+    body: bytes
+    error: str | None = None
+
+
+@dataclass
+class Report:
+    results: list[Result] = field(default_factory=list)
+
+    @property
+    def latencies(self) -> list[float]:
+        return sorted(r.latency for r in self.results if r.error is None)
+
+    def percentile(self, p: float) -> float:
+        latencies = self.latencies
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    def mismatches(self) -> list[tuple[Result, str]]:
+        """Return the results that differ from the recording, with how they do."""
+        found = []
+        for result in self.results:
+            recorded = result.exchange
+            if result.error is not None:
+                found.append((result, result.error))
+            elif recorded.type == "websocket":
+                continue  # frames were compared while replaying
+            elif result.status != recorded.status:
+                found.append((result, f"status {recorded.status} -> {result.status}"))
+            elif result.body != recorded.response_body:
+                found.append((result, _diff(recorded.response_body, result.body)))
+        return found
+
+
+def _diff(recorded: bytes, replayed: bytes, *, limit: int = 20) -> str:
+    try:
+        old, new = recorded.decode(), replayed.decode()
+    except UnicodeDecodeError:
+        return f"binary body changed ({len(recorded)} -> {len(replayed)} bytes)"
+    lines = difflib.unified_diff(
+        old.splitlines(), new.splitlines(), "recorded", "replayed", lineterm="", n=1
+    )
+    return "\n".join(itertools.islice(lines, limit))
+
+
+class Replay:
+    """Drives recorded traffic through the proxy again.
+
+    With `speed`, exchanges start at their recorded offsets divided by `speed`.
+    Without it they start as soon as one of `concurrency` slots is free.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        speed: float | None = 1.0,
+        concurrency: int = 10,
+        timeout: float = 30,
+    ) -> None:
+        self.url = url
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    async def run(self, exchanges: list[Exchange]) -> Report:
+        report = Report()
+        limit = asyncio.Semaphore(self.concurrency if self.speed is None else 1 << 30)
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.timeout) as client:
+
+            async def play(exchange: Exchange) -> None:
+                async with limit:
+                    if exchange.type == "websocket":
+                        result = await self._websocket(exchange)
+                    else:
+                        result = await self._http(client, exchange)
+                report.results.append(result)
+
+            started = time.monotonic()
+            tasks = []
+            for exchange in exchanges:
+                if self.speed is not None:
+                    delay = started + exchange.start / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(play(exchange)))
+            await asyncio.gather(*tasks)
+
+        report.results.sort(key=lambda result: result.exchange.start)
+        return report
+
+    async def _http(self, client: httpx.AsyncClient, exchange: Exchange) -> Result:
+        # redacted credentials are left out rather than sent as recorded
+        headers = [
+            (k, v)
+            for k, v in exchange.headers
+            if k.lower() not in _SKIPPED_HEADERS and v != REDACTED
+        ]
+        start = time.monotonic()
+        try:
+            resp = await client.request(
+                exchange.method,
+                exchange.path,
+                params=httpx.QueryParams(exchange.query),
+                headers=headers,
+                content=exchange.body,
+            )
+        except httpx.HTTPError as e:
+            return Result(exchange, time.monotonic() - start, 0, b"", error=repr(e))
+        return Result(
+            exchange, time.monotonic() - start, resp.status_code, resp.content
+        )
+
+    async def _send_frames(
+        self, ws: ClientConnection, exchange: Exchange, start: float
+    ) -> None:
+        for frame in exchange.frames:
+            if not frame.incoming:
+                continue
+            if self.speed is not None:
+                offset = (frame.time - exchange.start) / self.speed
+                if (delay := start + offset - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+            await ws.send(frame.data.decode() if frame.text else frame.data)
+
+    async def _websocket(self, exchange: Exchange) -> Result:
+        """Send the client's frames at their recorded pace and collect the replies."""
+        target = urlparse(self.url)
+        uri = f"ws://{exchange.host or target.netloc}{exchange.path}"
+        if exchange.query:
+            uri += f"?{exchange.query}"
+        recorded = [frame.data for frame in exchange.frames if not frame.incoming]
+        received: list[bytes] = []
+
+        async def collect(ws: ClientConnection) -> None:
+            async for message in ws:
+                received.append(
+                    message.encode() if isinstance(message, str) else message
+                )
+                if len(received) == len(recorded):
+                    return
+
+        start = time.monotonic()
+        try:
+            # connect to the proxy while keeping the recorded vhost as the host
+            async with connect(uri, host=target.hostname, port=target.port or 80) as ws:
+                collector = asyncio.create_task(collect(ws))
+                await self._send_frames(ws, exchange, start)
+                # a session where the service sent nothing has nothing to wait for
+                if recorded:
+                    await asyncio.wait({collector}, timeout=self.timeout)
+                if collector.done():
+                    # raises if the connection was closed abnormally
+                    collector.result()
+                collector.cancel()
+        # such as a handshake the proxy rejected because the service is down
+        except (OSError, ValueError, WebSocketException) as e:
+            return Result(exchange, time.monotonic() - start, 0, b"", error=repr(e))
+
+        error = None
+        if received != recorded:
+            error = f"{len(recorded)} frames recorded, {len(received)} received"
+            if len(received) == len(recorded):
+                error = "frames differ"
+        return Result(exchange, time.monotonic() - start, 101, b"", error=error)
+
+
+def print_report(report: Report, *, diffs: int) -> None:
+    latencies = report.latencies
+    table = Table("requests", "errors", "p50", "p90", "p99", "max", "mean")
+    table.add_row(
+        str(len(report.results)),
+        str(sum(r.error is not None for r in report.results)),
+        *(f"{report.percentile(p) * 1000:.1f}ms" for p in (50, 90, 99)),
+        f"{max(latencies, default=0) * 1000:.1f}ms",
+        f"{statistics.fmean(latencies) * 1000 if latencies else 0:.1f}ms",
+    )
+    out.print(table)
+
+    mismatches = report.mismatches()
+    out.print(f"{len(mismatches)} responses differ from the recording")
+    for result, difference in mismatches[:diffs]:
+        exchange = result.exchange
+        out.print(f"\n[bold]{exchange.method} {exchange.host}{exchange.path}[/bold]")
+        out.print(difference, markup=False, highlight=False)
+
+
+@click.command()
+@click.argument("recording", type=Path, nargs=-1, required=True)
+@click.option("--url", default="http://127.0.0.1:8000", help="Where glue's proxy runs.")
+@click.option(
+    "--speed",
+    type=float,
+    default=1.0,
+    help="Replay this many times faster than recorded. 0 replays as fast as possible.",
+)
+@click.option(
+    "--concurrency",
+    type=int,
+    default=10,
+    help="The most exchanges in flight when replaying as fast as possible.",
+)
+@click.option("--diffs", type=int, default=10, help="How many differences to show.")
+def main(
+    recording: tuple[Path, ...], *, url: str, speed: float, concurrency: int, diffs: int
+) -> None:
+    """Replay traffic recorded by glue's proxy and compare the responses."""
+    exchanges = sorted(
+        (exchange for path in recording for exchange in load_exchanges(path)),
+        key=lambda exchange: exchange.start,
+    )
+    replay = Replay(url, speed=speed or None, concurrency=concurrency)
+    report = asyncio.run(replay.run(exchanges))
+    print_report(report, diffs=diffs)
+
+
+if __name__ == "__main__":
+    main()
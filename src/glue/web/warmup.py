@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+    from glue.warmup import HotPaths, HotPathTable
+
+__all__ = ["HotPathRecorder"]
+
+
+class HotPathRecorder:
+    """Counts the GET requests of a server that succeed, to warm it up later.
+
+    Only successful responses are counted, so a warm-up never replays
+    requests for paths that do not exist.
+    """
+
+    def __init__(self, app: ASGIApp, paths: HotPaths, table: HotPathTable) -> None:
+        self.app = app
+        self.paths = paths
+        self.table = table
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        # the path and query the proxy forwards
+        path = scope["path"]
+        if query := scope.get("query_string"):
+            path += "?" + query.decode("latin-1")
+
+        async def wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                self.table.add(self.paths, path)
+            await send(message)
+
+        await self.app(scope, receive, wrapper)
@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .config import PythonServiceConfig
+from .pty import PtyMaster
+from .watch import WatchRule
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from .config import ServiceConfig
+    from .output import OutputBuffer
+    from .utils import Dirs
+    from .watch import FileWatcher
+
+__all__ = ["Zygote"]
+
+SERVER_SCRIPT = Path(__file__).with_name("pty") / "_zygote.py"
+
+# how long an interpreter may take to import the modules it preloads
+START_TIMEOUT = 300
+
+# an install touches the lockfiles and site-packages many times over
+REBUILD_DEBOUNCE = 1.0
+
+
+def _mtime(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _request(
+    path: Path, message: dict[str, Any], fds: list[int] | None = None
+) -> socket.socket:
+    conn = socket.socket(socket.AF_UNIX)
+    try:
+        conn.connect(str(path))
+        socket.send_fds(conn, [json.dumps(message).encode() + b"\n"], fds or [])
+    except OSError:
+        conn.close()
+        raise
+    return conn
+
+
+def _reply(conn: socket.socket, timeout: float | None = None) -> dict[str, Any]:
+    conn.settimeout(timeout)
+    data = b""
+    while not data.endswith(b"\n"):
+        more = conn.recv(4096)
+        if not more:
+            msg = "The zygote closed the connection"
+            raise ConnectionResetError(msg)
+        data += more
+    reply: dict[str, Any] = json.loads(data)
+    return reply
+
+
+class ForkedProcess:
+    """A service forked by a zygote, which tells when it exits.
+
+    Only the zygote can wait for the process, so it answers the fork request
+    with the exit code once the process is gone. Should the zygote go away
+    first, the process is looked up by its pid instead.
+    """
+
+    def __init__(self, pid: int, conn: socket.socket, master_fd: int) -> None:
+        self._pid = pid
+        self.conn = conn
+        self.pty = PtyMaster(master_fd)
+        self.returncode: int | None = None
+        self._orphaned = False
+
+    @property
+    def pid(self) -> int:
+        return self._pid
+
+    def is_running(self) -> bool:
+        if self.returncode is not None:
+            return False
+        if self._orphaned:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                self.pty.close()
+                return False
+            return True
+        if select.select([self.conn], [], [], 0)[0]:
+            try:
+                self.returncode = int(_reply(self.conn, 1)["exit"])
+            except (OSError, ValueError, KeyError):
+                self._orphaned = True
+            else:
+                self.pty.close()
+            self.conn.close()
+            return self.is_running()
+        return True
+
+    def read(self, length: int) -> bytes:
+        return self.pty.read(length)
+
+    def write(self, data: bytes) -> None:
+        self.pty.write(data)
+
+    def _wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.is_running():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self) -> None:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(self.pid, signal.SIGINT)
+            if not self._wait(5):
+                os.kill(self.pid, signal.SIGKILL)
+                self._wait(5)
+        self.pty.close()
+
+
+class Zygote:
+    """An interpreter with the heavy imports of a Python service already done.
+
+    Restarts fork the service from the zygote instead of starting the
+    interpreter over. The zygote is started in the background the first time
+    it is asked for a fork, and started over in the background whenever the
+    service's lockfiles or site-packages change, as seen by the file watcher.
+    Until it is ready, the service is spawned as usual.
+    """
+
+    def __init__(
+        self, dirs: Dirs, config: PythonServiceConfig, output: OutputBuffer
+    ) -> None:
+        assert config.zygote is not None
+        self.dirs = dirs
+        self.config = config
+        self.zygote = config.zygote
+        self.output = output
+        # outside the slots of blue/green services, which are cleared on restarts
+        self.path = dirs.with_slot("zygote").runtime_dir / "zygote.sock"
+        self._process: subprocess.Popen[bytes] | None = None
+        self._watched: list[Path] = []
+        self._fingerprint: list[int | None] | None = None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        # told about site-packages once the zygote reports where they are
+        self.watcher: FileWatcher | None = None
+
+    @classmethod
+    def for_service(
+        cls, dirs: Dirs, config: ServiceConfig, output: OutputBuffer
+    ) -> Zygote | None:
+        if (
+            os.name == "nt"
+            or not isinstance(config, PythonServiceConfig)
+            or config.zygote is None
+        ):
+            return None
+        return cls(dirs, config, output)
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._is_ready()
+
+    def _is_ready(self) -> bool:
+        return (
+            self._process is not None
+            and self._process.poll() is None
+            and self._fingerprint is not None
+            and self._fingerprint == self._current(self._watched)
+        )
+
+    @property
+    def cwd(self) -> Path:
+        return Path(self.config.cwd).resolve()
+
+    @property
+    def lockfiles(self) -> list[Path]:
+        return [self.cwd / lockfile for lockfile in self.zygote.lockfiles]
+
+    def _current(self, paths: list[Path]) -> list[int | None]:
+        return [_mtime(path) for path in paths]
+
+    def watch_rule(self) -> WatchRule:
+        """Return the rule that starts the zygote over when its files change."""
+        with self._lock:
+            roots = self._watched or self.lockfiles
+        return WatchRule(
+            name=f"{self.config.name}:zygote",
+            roots=roots,
+            include=[],
+            ignore=[],
+            debounce=REBUILD_DEBOUNCE,
+            callback=self._changed,
+            # packages are added and removed at the top of site-packages
+            recursive=False,
+        )
+
+    def _changed(self) -> None:
+        with self._lock:
+            # one that was never started waits for the first restart
+            if self._process is not None and not self._is_ready():
+                self._rebuild()
+
+    def _changed_meanwhile(self) -> None:
+        with self._lock:
+            process = self._process
+            if (
+                process is not None
+                and process.poll() is None
+                and self._fingerprint != self._current(self._watched)
+            ):
+                self._rebuild()
+
+    def fork(self, args: list[str], env: Mapping[str, str]) -> ForkedProcess | None:
+        """Fork the service with the resolved `args` of its module.
+
+        Returns `None` when the zygote is not ready, and starts it if needed.
+        """
+        with self._lock:
+            if not self._is_ready():
+                self._rebuild()
+                return None
+
+        master_fd, slave_fd = os.openpty()
+        message = {
+            "type": "fork",
+            "module": self.config.module,
+            "args": args,
+            "cwd": str(self.cwd),
+            "env": dict(env),
+        }
+        try:
+            conn = _request(self.path, message, [slave_fd])
+            pid = int(_reply(conn, 10)["pid"])
+        except (OSError, ValueError, KeyError):
+            os.close(master_fd)
+            # the zygote is gone or stopped answering, so start it over
+            with self._lock:
+                self._fingerprint = None
+                self._rebuild()
+            return None
+        finally:
+            os.close(slave_fd)
+        return ForkedProcess(pid, conn, master_fd)
+
+    def _rebuild(self) -> None:
+        if self._closed or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(
+            target=self._build, name=f"glue-zygote-{self.config.name}", daemon=True
+        )
+        self._thread.start()
+
+    def _build(self) -> None:
+        name, write = self.config.name, self.output.write
+        self._stop_process()
+        lockfiles = self.lockfiles
+        fingerprint = self._current(lockfiles)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dirs.state_dir.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        log = self.dirs.state_dir / "zygote.log"
+        command = self.dirs.resolve_vars_list(
+            [self.config.python, str(SERVER_SCRIPT), str(self.path)]
+        )
+        with log.open("wb") as out:
+            process = subprocess.Popen(  # noqa: S603
+                [*command, *self.zygote.preload],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                # keeps ctrl+c in a terminal from reaching it
+                start_new_session=True,
+            )
+        with self._lock:
+            self._process = process
+
+        try:
+            paths = [Path(path) for path in self._info(process)]
+        except (OSError, ValueError, KeyError):
+            if not self._closed:
+                write(f"The zygote of {name} failed to start, see {log}\n")
+            self._stop_process()
+            return
+
+        with self._lock:
+            if process is not self._process:
+                return  # closed in the meantime
+            self._watched = [*lockfiles, *paths]
+            self._fingerprint = [*fingerprint, *self._current(paths)]
+        if self.watcher is not None:
+            self.watcher.update(self.watch_rule())
+            # changes made before the watcher picked up the new roots are missed
+            timer = threading.Timer(REBUILD_DEBOUNCE, self._changed_meanwhile)
+            timer.daemon = True
+            timer.start()
+        write(f"The zygote of {name} is ready, restarts are forked from it\n")
+
+    def _info(self, process: subprocess.Popen[bytes]) -> list[str]:
+        deadline = time.monotonic() + START_TIMEOUT
+        while not self.path.exists():
+            if (
+                self._closed
+                or process.poll() is not None
+                or time.monotonic() > deadline
+            ):
+                msg = "The zygote exited before it was ready"
+                raise ConnectionError(msg)
+            time.sleep(0.05)
+        with _request(self.path, {"type": "info"}) as conn:
+            paths: list[str] = _reply(conn, 10)["paths"]
+        return paths
+
+    def _stop_process(self) -> None:
+        with self._lock:
+            process, self._process = self._process, None
+            self._fingerprint = None
+        if process is None:
+            return
+        # the zygote exits once its stdin is closed; forks keep running
+        assert process.stdin is not None
+        process.stdin.close()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def close(self) -> None:
+        self._closed = True
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._stop_process()
+        self.path.unlink(missing_ok=True)
+        with contextlib.suppress(OSError):
+            self.path.parent.rmdir()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+# the lines reported by benchmarks, shown once the run is over
+_reports = pytest.StashKey[list[str]]()
+
+
+class TmpXDGDirs:
+    def __init__(self, root: Path) -> None:
+        self.user_state_path = root / "state"
+        self.user_runtime_path = root / "run"
+
+
+@pytest.fixture
+def xdg_dirs(tmp_path: Path) -> TmpXDGDirs:
+    return TmpXDGDirs(tmp_path)
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run the benchmarks, which report numbers instead of asserting on them.",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers", "benchmark: measures performance; skipped without --benchmark"
+    )
+    config.stash[_reports] = []
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def report(request: pytest.FixtureRequest) -> Callable[[str], None]:
+    """Report a number measured by a benchmark."""
+    lines = request.config.stash[_reports]
+    return lambda line: lines.append(f"{request.node.name}: {line}")
+
+
+def pytest_terminal_summary(
+    terminalreporter: pytest.TerminalReporter, config: pytest.Config
+) -> None:
+    lines = config.stash[_reports]
+    if lines:
+        terminalreporter.section("benchmarks")
+        for line in lines:
+            terminalreporter.write_line(line)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+import re
+import socket
+import sys
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from glue import activation
+from glue.activation import bind_listener, count_connections
+from glue.config import PythonServiceConfig
+from glue.pm import ServiceInstance
+from glue.utils import Dirs, IPlatformDirs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+# accepts connections on the socket passed by the activator, greeting each
+SERVICE = """
+import os, socket
+server = socket.socket(fileno=3)
+while True:
+    conn, _ = server.accept()
+    conn.sendall(f"hello from {os.getpid()}".encode())
+    conn.close()
+"""
+
+
+def test_bind_unix_listener(tmp_path: Path) -> None:
+    path = tmp_path / "run" / "app.sock"
+    path.parent.mkdir()
+    path.touch()  # stale socket from a previous run
+
+    with bind_listener(str(path)) as sock:
+        assert sock.family == socket.AF_UNIX
+        assert sock.getsockname() == str(path)
+
+
+def test_bind_tcp_listener() -> None:
+    with bind_listener("tcp://127.0.0.1:0") as sock:
+        assert sock.family == socket.AF_INET
+        assert sock.getsockname()[0] == "127.0.0.1"
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires procfs")
+def test_count_unix_connections(tmp_path: Path) -> None:
+    with bind_listener(str(tmp_path / "app.sock")) as sock:
+        assert count_connections(sock, os.getpid()) == 0
+
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(sock.getsockname())
+            conn, _ = sock.accept()
+            with conn:
+                assert count_connections(sock, os.getpid()) == 1
+
+
+def test_count_tcp_connections() -> None:
+    with bind_listener("tcp://127.0.0.1:0") as sock:
+        assert count_connections(sock, os.getpid()) == 0
+
+        with socket.create_connection(sock.getsockname()):
+            conn, _ = sock.accept()
+            with conn:
+                assert count_connections(sock, os.getpid()) == 1
+
+
+def wait_for(check: Callable[[], bool], timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def activated_service(
+    tmp_path: Path, xdg_dirs: IPlatformDirs, script: str
+) -> ServiceInstance:
+    (tmp_path / "svc.py").write_text(script)
+    config = PythonServiceConfig(
+        name="svc",
+        cwd=str(tmp_path),
+        python=sys.executable,
+        module="svc",
+        listen="{xdg_run}/svc.sock",
+        idle_timeout=0.2,
+    )
+    return ServiceInstance(Dirs("test", _dirs=xdg_dirs) / "svc", config)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires procfs")
+def test_spawn_on_connect_and_stop_on_idle(
+    tmp_path: Path, xdg_dirs: IPlatformDirs, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(activation, "POLL_INTERVAL", 0.05)
+    svc = activated_service(tmp_path, xdg_dirs, SERVICE)
+    address = str(svc.dirs.runtime_dir / "svc.sock")
+    svc.start()
+    try:
+        assert svc.status == "waiting"
+        assert svc.process is None
+
+        for _ in range(2):
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(address)
+                greeting = client.recv(1024).decode()
+            assert svc.process is not None
+            assert greeting == f"hello from {svc.process.pid}"
+
+            # with no connections left, the service is stopped until the next one
+            wait_for(lambda: svc.process is None)
+            assert svc.status == "waiting"
+        assert svc.output.tail().count("Stopped after being idle") == 2
+    finally:
+        svc.shutdown()
+        svc.close()
+
+
+def test_exits_back_off(
+    tmp_path: Path, xdg_dirs: IPlatformDirs, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(activation, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(activation, "CRASH_BACKOFF", 0.05)
+    svc = activated_service(tmp_path, xdg_dirs, "raise SystemExit(1)")
+    svc.start()
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(str(svc.dirs.runtime_dir / "svc.sock"))
+            # the pending connection spawns it again, later every time
+            pattern = re.compile(r"starting again on connections in ([\d.]+)s")
+            wait_for(lambda: len(pattern.findall(svc.output.tail())) >= 3)
+    finally:
+        svc.shutdown()
+        svc.close()
+    delays = [float(delay) for delay in pattern.findall(svc.output.tail())]
+    assert delays[:3] == [0.05, 0.1, 0.2]
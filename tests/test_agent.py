@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from glue.config import AgentConfig, Config, ScriptServiceConfig
+from glue.control import coordinator
+from glue.control.agent import Agent, agent_config, is_loopback
+from glue.control.mux import WINDOW_SIZE, Mux
+from glue.pm import ServiceManager
+from glue.utils import Dirs, IPlatformDirs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+    from typing import Any
+
+    from glue.control.mux import Channel
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires pty")
+
+TOKEN = "secret"  # noqa: S105
+
+ECHO = """
+import socket, sys
+server = socket.socket(socket.AF_UNIX)
+server.bind(sys.argv[1])
+server.listen()
+print("echo " + "ready", flush=True)
+while True:
+    conn, _ = server.accept()
+    with conn:
+        while data := conn.recv(65536):
+            conn.sendall(data)
+"""
+
+
+def echo_service(name: str, agent: str) -> ScriptServiceConfig:
+    return ScriptServiceConfig(
+        name=name,
+        exec=sys.executable,
+        args=["-c", ECHO, "{xdg_run}/echo.sock"],
+        agent=agent,
+        forward=["unix://{xdg_run}/echo.sock"],
+    )
+
+
+def wait_for(check: Callable[[], bool], timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def run_agent(
+    config: Config, dirs: Dirs, address: str, *, token: str | None = None
+) -> Iterator[None]:
+    mgr = ServiceManager(dirs, config)
+    agent = Agent(mgr, address, token=token)
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(agent.serve(stop),), daemon=True
+    )
+    thread.start()
+    path = address.removeprefix("unix://")
+    wait_for(lambda: socket.socket(socket.AF_UNIX).connect_ex(path) == 0)
+    yield
+    loop.call_soon_threadsafe(stop.set)
+    thread.join()
+    loop.close()
+    mgr.shutdown()
+
+
+@pytest.fixture
+def cluster(tmp_path: Path, xdg_dirs: IPlatformDirs) -> Iterator[ServiceManager]:
+    """Two agents on this machine, and the coordinator's manager."""
+    config = Config(
+        agents={
+            "a1": AgentConfig(address=f"unix://{tmp_path}/a1.sock"),
+            "a2": AgentConfig(address=f"unix://{tmp_path}/a2.sock", token=TOKEN),
+        },
+        services=[echo_service("one", "a1"), echo_service("two", "a2")],
+    )
+    agents = [
+        run_agent(
+            agent_config(config, name),
+            Dirs(f"test@{name}", _dirs=xdg_dirs),
+            agent.address,
+            token=agent.token,
+        )
+        for name, agent in config.agents.items()
+    ]
+    for agent in agents:
+        next(agent)
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    yield mgr
+    mgr.shutdown()
+    for agent in agents:
+        next(agent, None)
+
+
+def echo(path: Path, payload: bytes) -> bytes:
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(str(path))
+        sock.sendall(payload)
+        sock.shutdown(socket.SHUT_WR)
+        received = b""
+        while data := sock.recv(65536):
+            received += data
+        return received
+
+
+def test_agents(cluster: ServiceManager, xdg_dirs: IPlatformDirs) -> None:
+    cluster.start()
+    for name, agent in (("one", "a1"), ("two", "a2")):
+        svc = cluster.services[name]
+        wait_for(lambda svc=svc: "echo ready" in svc.output.tail())  # type: ignore[misc]
+        assert svc.status == "running"
+
+        # the service listens on the agent, and is relayed to the same address here
+        run = xdg_dirs.user_runtime_path
+        assert (run / f"test@{agent}" / name / "echo.sock").exists()
+        local = run / "test" / name / "echo.sock"
+        payload = bytes(range(256)) * 4096
+        assert echo(local, payload) == payload
+
+    cluster.services["one"].shutdown()
+    assert cluster.services["one"].status == "stopped"
+    assert not (xdg_dirs.user_runtime_path / "test" / "one" / "echo.sock").exists()
+
+
+def test_only_configured_addresses(cluster: ServiceManager, tmp_path: Path) -> None:
+    cluster.start()
+    svc = cluster.services["one"]
+    wait_for(lambda: "echo ready" in svc.output.tail())
+
+    # a coordinator with a config of its own cannot reach other sockets
+    target = tmp_path / "private.sock"
+    private = socket.socket(socket.AF_UNIX)
+    private.bind(str(target))
+    private.listen()
+    private.settimeout(0.5)
+    stop = cluster.agents["a1"].forward(
+        "one", f"unix://{tmp_path}/relay.sock", f"unix://{target}"
+    )
+    try:
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.settimeout(5)
+            sock.connect(str(tmp_path / "relay.sock"))
+            sock.sendall(b"hello")
+            assert sock.recv(1024) == b""
+        with pytest.raises(TimeoutError):
+            private.accept()
+    finally:
+        stop()
+        private.close()
+
+
+TICKER = """
+import itertools, time
+for n in itertools.count():
+    print("tick", n, flush=True)
+    time.sleep(0.05)
+"""
+
+
+def test_logs_followed_again_after_drop(
+    tmp_path: Path, xdg_dirs: IPlatformDirs, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(coordinator, "RECONNECT_INTERVAL", 0.05)
+    address = f"unix://{tmp_path}/a1.sock"
+    ticker = ScriptServiceConfig(
+        name="ticker", exec=sys.executable, args=["-c", TICKER], agent="a1"
+    )
+    config = Config(agents={"a1": AgentConfig(address=address)}, services=[ticker])
+    agent = run_agent(
+        agent_config(config, "a1"), Dirs("test@a1", _dirs=xdg_dirs), address
+    )
+    next(agent)
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    try:
+        svc = mgr.services["ticker"]
+        svc.start()
+        wait_for(lambda: "tick 1" in svc.output.tail())
+
+        # drop the connection to the agent, as a network hiccup would
+        link = mgr.agents["a1"]
+        mux = link._mux  # noqa: SLF001
+        assert mux is not None
+        link._run(mux.close())  # noqa: SLF001
+        ticks = svc.output.tail().count("tick")
+        wait_for(lambda: svc.output.tail().count("tick") > ticks + 2)
+    finally:
+        mgr.shutdown()
+        next(agent, None)
+
+
+def test_is_loopback() -> None:
+    assert is_loopback("tcp://127.0.0.1:7700")
+    assert is_loopback("tcp://localhost:7700")
+    assert is_loopback("tcp://[::1]:7700")
+    assert is_loopback("/run/glue/agent.sock")
+    assert not is_loopback("tcp://0.0.0.0:7700")
+    assert not is_loopback("tcp://10.0.0.5:7700")
+
+
+def test_wrong_token(tmp_path: Path, xdg_dirs: IPlatformDirs) -> None:
+    config = Config(
+        agents={
+            "a1": AgentConfig(
+                address=f"unix://{tmp_path}/a1.sock",
+                token=TOKEN.upper(),
+            )
+        },
+        services=[echo_service("one", "a1")],
+    )
+    agent = run_agent(
+        agent_config(config, "a1"),
+        Dirs("test@a1", _dirs=xdg_dirs),
+        f"unix://{tmp_path}/a1.sock",
+        token=TOKEN,
+    )
+    next(agent)
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    try:
+        svc = mgr.services["one"]
+        svc.start()
+        assert "Invalid token" in svc.output.tail()
+        assert svc.status == "stopped"
+    finally:
+        mgr.shutdown()
+        next(agent, None)
+
+
+def test_moving_services() -> None:
+    old = Config(services=[echo_service("one", "a1"), echo_service("two", "a1")])
+    new = Config(services=[echo_service("one", "a2"), echo_service("two", "a1")])
+    diff = old.diff(new)
+    assert (diff.added, diff.removed, diff.changed) == (["one"], ["one"], [])
+
+    old.agents = {"a1": AgentConfig(address="tcp://127.0.0.1:7700")}
+    moved = Config(
+        agents={"a1": AgentConfig(address="tcp://10.0.0.2:7700")},
+        services=old.services,
+    )
+    assert old.diff(moved).changed == ["one", "two"]
+
+
+async def read_all(channel: Channel) -> int:
+    size = 0
+    while data := await channel.read():
+        size += len(data)
+    return size
+
+
+def test_mux_flow_control() -> None:
+    async def test() -> None:
+        release = asyncio.Event()
+
+        async def echo(channel: Channel, params: dict[str, Any]) -> None:
+            if params["type"] == "slow":
+                await release.wait()
+            while data := await channel.read():
+                channel.write(data)
+                await channel.drain()
+            await channel.write_eof()
+
+        a, b = socket.socketpair()
+        server = Mux(
+            *await asyncio.open_connection(sock=a), initiator=False, on_open=echo
+        )
+        client = Mux(*await asyncio.open_connection(sock=b), initiator=True)
+        runners = [asyncio.create_task(mux.run()) for mux in (server, client)]
+
+        fast = await client.open(type="fast")
+        slow = await client.open(type="slow")
+        received = asyncio.create_task(read_all(slow))
+
+        # the slow channel fills its window, without holding the fast one back
+        size = WINDOW_SIZE + 1024
+        slow.write(b"x" * size)
+        drain = asyncio.create_task(slow.drain())
+        fast.write(b"hello\n")
+        await fast.drain()
+        assert await fast.readline() == b"hello\n"
+        await asyncio.sleep(0.05)
+        assert not drain.done()
+
+        release.set()
+        await asyncio.wait_for(drain, 1)
+        await slow.write_eof()
+        assert await asyncio.wait_for(received, 1) == size
+
+        for mux in (client, server):
+            await mux.close()
+        await asyncio.gather(*runners)
+
+    asyncio.run(test())
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from glue.config import Config, ScriptServiceConfig
+from glue.faults import FaultSwitches, switches_path
+from glue.pm import ServiceInstance, ServiceManager
+from glue.ui import GlueApp
+from glue.ui.screens import ProcessLogScreen, TimelineScreen
+from glue.utils import Dirs, IPlatformDirs
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires pty")
+
+
+def many_services(xdg_dirs: IPlatformDirs, count: int = 100) -> ServiceManager:
+    config = Config(
+        services=[
+            ScriptServiceConfig(name=f"svc{i}", exec="sh", args=["-c", f"echo svc{i}"])
+            for i in range(count)
+        ]
+    )
+    return ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+
+
+def test_first_paint_with_many_services(xdg_dirs: IPlatformDirs) -> None:
+    mgr = many_services(xdg_dirs)
+
+    async def test() -> None:
+        mgr.start()
+        app = GlueApp(mgr, 8000, FaultSwitches(switches_path(mgr.dirs)))
+        async with app.run_test() as pilot:
+            # no log screen is built before it is shown
+            assert not app.is_screen_installed("svc1")
+
+            # screens are created on demand and backfilled from the service output
+            await pilot.press("1")
+            assert isinstance(app.screen, ProcessLogScreen)
+            assert app.screen.name == "svc1"
+            for _ in range(50):
+                await pilot.pause(0.1)
+                if "svc1" in app.screen.widget_log.lines:
+                    break
+            assert "svc1" in app.screen.widget_log.lines
+
+            await pilot.press("t")
+            timeline = app.screen
+            assert isinstance(timeline, TimelineScreen)
+            for _ in range(50):
+                await pilot.pause(0.1)
+                if len(timeline.entries) >= 200:
+                    break
+            lines = {e.line for e in timeline.entries}
+            assert {f"svc{i}" for i in range(100)} <= lines
+
+            # filtering re-renders the merged history
+            timeline.toggle_service("svc1")
+            timeline.pattern = "svc2"
+            timeline.refilter()
+            await pilot.pause(0.1)
+            log_lines = timeline.widget_log.lines
+            assert any(line.endswith("│ svc2") for line in log_lines)
+            assert not any("svc1" in line for line in log_lines)
+
+    try:
+        asyncio.run(test())
+    finally:
+        mgr.shutdown()
+
+
+@pytest.mark.benchmark
+def test_first_paint_benchmark(
+    xdg_dirs: IPlatformDirs, report: Callable[[str], None]
+) -> None:
+    mgr = many_services(xdg_dirs, 500)
+
+    async def test() -> None:
+        start = time.perf_counter()
+        mgr.start()
+        app = GlueApp(mgr, 8000, FaultSwitches(switches_path(mgr.dirs)))
+        async with app.run_test():
+            report(f"{(time.perf_counter() - start) * 1000:.0f}ms with 500 services")
+
+    try:
+        asyncio.run(test())
+    finally:
+        mgr.shutdown()
+
+
+def test_output_of_short_lived_services(xdg_dirs: IPlatformDirs) -> None:
+    script = "for i in $(seq 50); do echo line $i; done; echo error $((1 + 2)); exit 3"
+    config = Config(
+        services=[ScriptServiceConfig(name="crash", exec="sh", args=["-c", script])]
+    )
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    svc = mgr.services["crash"]
+    assert isinstance(svc, ServiceInstance)
+    fds = len(list(Path("/dev/fd").iterdir()))
+    try:
+        for _ in range(20):
+            svc.restart()
+            deadline = time.monotonic() + 10
+            while "error 3" not in svc.output.tail():
+                assert time.monotonic() < deadline, svc.output.tail()
+                time.sleep(0.01)
+            assert "line 50" in svc.output.tail()
+        svc.shutdown()
+    finally:
+        mgr.shutdown()
+    # the pty of every exited process is closed
+    assert len(list(Path("/dev/fd").iterdir())) <= fds + 2
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import re
+import socket
+import sys
+import time
+from typing import TYPE_CHECKING
+
+import psutil  # type: ignore[import-untyped]
+import pytest
+
+from glue.bluegreen import other_slot, reset_slot, switch_slot
+from glue.config import Config, PythonServiceConfig
+from glue.pm import ServiceInstance
+from glue.typecast import typecast
+from glue.utils import Dirs, IPlatformDirs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+
+# greets every connection with its pid, and holds it open until the client closes
+# it; takes its time to listen while the file `slow` exists
+SERVICE = """
+import os, socket, sys, threading, time
+print(f"service {os.getpid()}", flush=True)
+while os.path.exists("slow"):
+    time.sleep(0.05)
+server = socket.socket(socket.AF_UNIX)
+server.bind(sys.argv[1])
+server.listen()
+
+def serve(conn):
+    conn.sendall(str(os.getpid()).encode())
+    conn.recv(1)
+    conn.close()
+
+while True:
+    conn, _ = server.accept()
+    threading.Thread(target=serve, args=(conn,), daemon=True).start()
+"""
+
+
+@pytest.fixture
+def dirs(xdg_dirs: IPlatformDirs) -> Dirs:
+    return Dirs("testapp", _dirs=xdg_dirs) / "api"
+
+
+def test_other_slot() -> None:
+    assert other_slot(None) == "blue"
+    assert other_slot("blue") == "green"
+    assert other_slot("green") == "blue"
+
+
+def test_switch_slot(dirs: Dirs) -> None:
+    reset_slot(dirs.with_slot("blue"))
+    reset_slot(dirs.with_slot("green"))
+
+    switch_slot(dirs, "blue")
+    assert dirs.runtime_dir.resolve() == dirs.with_slot("blue").runtime_dir
+
+    switch_slot(dirs, "green")
+    assert dirs.runtime_dir.resolve() == dirs.with_slot("green").runtime_dir
+
+
+def test_switch_slot_replaces_directory(dirs: Dirs) -> None:
+    dirs.runtime_dir.mkdir(parents=True)
+    (dirs.runtime_dir / "api.sock").touch()
+    reset_slot(dirs.with_slot("blue"))
+
+    switch_slot(dirs, "blue")
+    assert dirs.runtime_dir.is_symlink()
+    assert not (dirs.runtime_dir / "api.sock").exists()
+
+
+def test_reset_slot_clears_stale_files(dirs: Dirs) -> None:
+    slot = dirs.with_slot("green")
+    slot.runtime_dir.mkdir(parents=True)
+    (slot.runtime_dir / "api.sock").touch()
+
+    reset_slot(slot)
+    assert list(slot.runtime_dir.iterdir()) == []
+
+
+def test_empty_ready_probes_sockets() -> None:
+    service = {"name": "api", "exec": "api", "blue_green": True, "ready": ""}
+    config = typecast(Config, {"services": [service]})
+    assert config.services[0].ready is None
+
+
+def wait_for(check: Callable[[], bool], timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def service(tmp_path: Path, xdg_dirs: IPlatformDirs) -> Iterator[ServiceInstance]:
+    (tmp_path / "svc.py").write_text(SERVICE)
+    config = PythonServiceConfig(
+        name="svc",
+        cwd=str(tmp_path),
+        python=sys.executable,
+        module="svc",
+        args=["{xdg_run}/svc.sock"],
+        blue_green=True,
+    )
+    svc = ServiceInstance(Dirs("test", _dirs=xdg_dirs) / "svc", config)
+    yield svc
+    svc.shutdown()
+    svc.close()
+
+
+def connect(svc: ServiceInstance) -> tuple[socket.socket, int]:
+    """Connect to the current slot of the service, returning the pid that answered."""
+    client = socket.socket(socket.AF_UNIX)
+    client.connect(str(svc.dirs.runtime_dir / "svc.sock"))
+    return client, int(client.recv(1024))
+
+
+def started_pids(svc: ServiceInstance) -> list[int]:
+    return [int(pid) for pid in re.findall(r"service (\d+)", svc.output.tail())]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires procfs")
+def test_restart_switches_and_drains(service: ServiceInstance) -> None:
+    service.start()
+    wait_for(lambda: (service.dirs.runtime_dir / "svc.sock").exists())
+    old = service.process
+    assert old is not None
+    client, pid = connect(service)
+    assert pid == old.pid
+
+    with client:
+        service.restart()
+        wait_for(lambda: service.process is not old)
+        assert service.slot == "green"
+        # new connections reach the new slot, while the old one serves its own
+        new_client, new_pid = connect(service)
+        new_client.close()
+        assert service.process is not None
+        assert new_pid == service.process.pid
+        time.sleep(0.3)
+        assert old.is_running()
+    wait_for(lambda: not old.is_running())
+    assert "Switched to green, draining blue" in service.output.tail()
+
+
+def test_shutdown_during_restart_stops_new_instance(
+    service: ServiceInstance, tmp_path: Path
+) -> None:
+    service.start()
+    wait_for(lambda: (service.dirs.runtime_dir / "svc.sock").exists())
+
+    # the new instance does not become ready before glue shuts down
+    (tmp_path / "slow").touch()
+    service.restart()
+    wait_for(lambda: len(started_pids(service)) == 2)
+    service.shutdown()
+
+    assert service.process is None
+    assert "Shutting down, stopping the green instance" in service.output.tail()
+    for pid in started_pids(service):
+        assert not psutil.pid_exists(pid)
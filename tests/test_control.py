@@ -0,0 +1,174 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from glue.config import Config, LogParserConfig, ScriptServiceConfig
+from glue.control import ControlClient, ControlError
+from glue.control.protocol import INVALID_PARAMS, METHOD_NOT_FOUND, UNKNOWN_SERVICE
+from glue.control.server import ControlServer
+from glue.pm import ServiceInstance, ServiceManager
+from glue.utils import Dirs, IPlatformDirs
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires pty")
+
+
+@pytest.fixture
+def mgr(xdg_dirs: IPlatformDirs) -> ServiceManager:
+    config = Config(
+        services=[
+            ScriptServiceConfig(
+                name="echo", exec="sh", args=["-c", "echo hello; exec sleep 30"]
+            ),
+        ]
+    )
+    return ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+
+
+class InGlue:
+    """A service that runs in the glue process, like the in-process proxy."""
+
+    pid = os.getpid()
+
+    def is_running(self) -> bool:
+        return True
+
+    def read(self, length: int) -> bytes:  # noqa: ARG002
+        return b""
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+def test_metrics_of_glue_itself(
+    tmp_path: Path, mgr: ServiceManager, xdg_dirs: IPlatformDirs
+) -> None:
+    config = ScriptServiceConfig(
+        name="forks", exec="sh", args=["-c", "sleep 30 & exec sleep 30"]
+    )
+    mgr.services["forks"] = ServiceInstance(
+        Dirs("test", _dirs=xdg_dirs) / "forks", config
+    )
+    in_glue = ScriptServiceConfig(name="in-glue", exec="in-glue")
+    mgr.services["in-glue"] = ServiceInstance(
+        Dirs("test", _dirs=xdg_dirs) / "in-glue", in_glue, spawner=InGlue
+    )
+    server = ControlServer(mgr, tmp_path / "control.sock")
+
+    def processes(name: str) -> Any:
+        return asyncio.run(server.rpc_metrics())["services"][name].get("processes")
+
+    try:
+        mgr.start()
+        # the children of a service count towards it, but the services glue
+        # spawns are not part of a service that runs in glue itself
+        deadline = time.monotonic() + 10
+        while processes("forks") != 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        assert processes("in-glue") == 1
+    finally:
+        mgr.shutdown()
+
+
+def test_control_socket(tmp_path: Path, mgr: ServiceManager) -> None:
+    path = tmp_path / "control.sock"
+    server = ControlServer(mgr, path)
+
+    def client_calls() -> None:
+        with ControlClient(path) as client:
+            assert client.call("status") == [
+                {"name": "echo", "status": "stopped", "pid": None, "slot": None}
+            ]
+
+            client.call("start", name="echo")
+            stream = client.follow_logs("echo")
+            try:
+                data = ""
+                for params in stream:
+                    data += params.get("data", "")
+                    if "hello" in data:
+                        break
+            finally:
+                stream.close()
+
+            assert client.call("status")[0]["status"] == "running"
+            assert "hello" in client.call("logs", name="echo", tail=1)
+            assert "echo" in client.call("metrics")["services"]
+
+            with pytest.raises(ControlError) as exc_info:
+                client.call("restart", name="nope")
+            assert exc_info.value.code == UNKNOWN_SERVICE
+
+            with pytest.raises(ControlError) as exc_info:
+                client.call("explode")
+            assert exc_info.value.code == METHOD_NOT_FOUND
+
+            client.call("stop", name="echo")
+            assert client.call("status")[0]["status"] == "stopped"
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        serve = asyncio.create_task(server.serve(stop))
+        while not path.exists():  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+        try:
+            await asyncio.wait_for(asyncio.to_thread(client_calls), 20)
+        finally:
+            stop.set()
+            await serve
+
+    try:
+        asyncio.run(run())
+    finally:
+        mgr.shutdown()
+    assert not path.exists()
+
+
+def test_query(tmp_path: Path, xdg_dirs: IPlatformDirs) -> None:
+    lines = [
+        '{"level": "info", "request_id": "a", "latency_ms": 5}',
+        '{"level": "error", "request_id": "a", "latency_ms": 50}',
+        '{"level": "error", "request_id": "b"}',
+    ]
+    # braces in args would be taken for variables
+    log = tmp_path / "api.log"
+    log.write_text("".join(f"{line}\n" for line in lines))
+    config = Config(
+        services=[
+            ScriptServiceConfig(
+                name="api", exec="cat", args=[str(log)], parser=LogParserConfig()
+            ),
+            ScriptServiceConfig(name="plain", exec="true"),
+        ]
+    )
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    server = ControlServer(mgr, tmp_path / "control.sock")
+
+    def call(method: str, **params: object) -> Any:
+        return asyncio.run(server.dispatch({"method": method, "params": params}))
+
+    try:
+        mgr.services["api"].start()
+        deadline = time.monotonic() + 10
+        while len(call("query")) < len(lines):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        [line] = call("query", level="error", request_id="a", since=60)
+        assert (line["service"], line["latency"]) == ("api", 50)
+        assert call("latency", percentile=50)["value"] == 5
+        assert call("latency", services=["api"])["services"]["api"]["count"] == 2
+
+        with pytest.raises(ControlError) as exc_info:
+            call("latency", services=["plain"])
+        assert exc_info.value.code == INVALID_PARAMS
+    finally:
+        mgr.shutdown()
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import statistics
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+import httpx
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from glue.config import FaultConfig
+from glue.faults import FaultSwitches, sample_delay
+from glue.web.faults import FaultInjector
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from starlette.requests import Request
+
+
+async def hello(request: Request) -> Response:  # noqa: ARG001
+    return Response(b"x" * 1000)
+
+
+def injector(tmp_path: Path, *rules: FaultConfig) -> FaultInjector:
+    app = Starlette(routes=[Route("/{path:path}", hello)])
+    switches = FaultSwitches(tmp_path / "faults.json", interval=0)
+    return FaultInjector(app, "api.localhost", list(rules), switches)
+
+
+def get(app: FaultInjector, path: str = "/") -> tuple[httpx.Response, float]:
+    async def request() -> httpx.Response:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await c.get(path)
+
+    start = time.monotonic()
+    resp = asyncio.run(request())
+    return resp, time.monotonic() - start
+
+
+def test_switches_are_shared(tmp_path: Path) -> None:
+    rule = FaultConfig(name="slow", enabled=False)
+    tui = FaultSwitches(tmp_path / "faults.json", interval=0)
+    proxy = FaultSwitches(tmp_path / "faults.json", interval=0)
+    assert not proxy.is_enabled("api.localhost", rule)
+
+    assert tui.toggle("api.localhost", rule)
+    assert proxy.is_enabled("api.localhost", rule)
+    assert not proxy.is_enabled("ui.localhost", rule)
+
+    assert not tui.toggle("api.localhost", rule)
+    assert not proxy.is_enabled("api.localhost", rule)
+
+
+def test_delay_distributions() -> None:
+    rng = random.Random(0)  # noqa: S311
+    for distribution in ("uniform", "normal", "exponential"):
+        rule = FaultConfig(
+            name="slow", latency=1, jitter=0.5, distribution=distribution
+        )
+        delays = [sample_delay(rule, rng) for _ in range(5000)]
+        assert min(delays) >= 0
+        assert abs(statistics.fmean(delays) - 1.5) < 0.05, distribution
+
+
+def test_errors_and_latency(tmp_path: Path) -> None:
+    app = injector(
+        tmp_path,
+        FaultConfig(name="broken", path="/api", error_rate=100, status=500),
+        FaultConfig(name="slow", latency=0.1),
+    )
+    resp, elapsed = get(app, "/api/users")
+    assert resp.status_code == 500
+    assert elapsed >= 0.1
+
+    resp, _ = get(app, "/other")
+    assert resp.status_code == 200
+    assert len(resp.content) == 1000
+
+    # switched off from the TUI
+    app.switches.set("api.localhost", app.rules[1], enabled=False)
+    _, elapsed = get(app, "/other")
+    assert elapsed < 0.1
+
+
+def test_bandwidth(tmp_path: Path) -> None:
+    app = injector(tmp_path, FaultConfig(name="dialup", bandwidth=5000))
+    resp, elapsed = get(app)
+    assert resp.content == b"x" * 1000
+    assert elapsed >= 0.18
+
+
+def test_drop(tmp_path: Path) -> None:
+    app = injector(tmp_path, FaultConfig(name="flaky", drop_rate=100))
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "raw_path": b"/",
+        "query_string": b"",
+        "headers": [],
+    }
+    asyncio.run(app(scope, receive, send))
+    assert [message["type"] for message in sent] == ["http.response.start"]
+
+
+def test_drop_closes_the_connection(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    app = injector(tmp_path, FaultConfig(name="flaky", drop_rate=100))
+    path = tmp_path / "api.sock"
+    server = uvicorn.Server(
+        uvicorn.Config(app, uds=str(path), log_config=None, access_log=False)
+    )
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.01)
+        with (
+            caplog.at_level(logging.DEBUG),
+            httpx.Client(transport=httpx.HTTPTransport(uds=str(path))) as client,
+        ):
+            for _ in range(3):
+                with pytest.raises(httpx.RemoteProtocolError):
+                    client.get("http://test/")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+    dropped = [r for r in caplog.records if r.getMessage().startswith("Dropped")]
+    assert len(dropped) == 3
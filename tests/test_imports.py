@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from collections.abc import Callable
+
+import pytest
+
+WEB = {"starlette", "httpx", "websockets", "uvicorn"}
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Import a module in a fresh interpreter and return each import's cumulative µs."""
+    proc = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    ("module", "unwanted"),
+    [
+        ("glue.config", {"textual", *WEB}),
+        ("glue.main", {"textual", *WEB}),
+        ("glue.control.cli", {"textual", "watchfiles", *WEB}),
+        ("glue.web.main", {"textual"}),
+    ],
+)
+def test_entry_point_imports(module: str, unwanted: set[str]) -> None:
+    imported = {name.split(".")[0] for name in import_times(module)}
+    assert not unwanted & imported
+
+
+@pytest.mark.benchmark
+def test_startup_benchmark(report: Callable[[str], None]) -> None:
+    for module in ("glue.main", "glue.control.cli", "glue.web.main"):
+        report(f"importing {module} took {import_times(module)[module] / 1000:.0f}ms")
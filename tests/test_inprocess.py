@@ -0,0 +1,64 @@
+import os
+import socket
+import time
+from pathlib import Path
+
+import httpx
+
+from glue.config import Config, StaticServer
+from glue.pm import ServiceManager
+from glue.utils import Dirs, IPlatformDirs
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, host: str) -> httpx.Response:
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            return httpx.get(f"http://127.0.0.1:{port}/", headers={"host": host})
+        except httpx.ConnectError:  # noqa: PERF203
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.02)
+
+
+def config(root: Path, port: int) -> Config:
+    config = Config(servers={"www.localhost": StaticServer(root_path=str(root))})
+    config.insert_root_service(
+        Path("servers.toml"), host="127.0.0.1", port=port, reload=False, in_process=True
+    )
+    return config
+
+
+def test_in_process_proxy(tmp_path: Path, xdg_dirs: IPlatformDirs) -> None:
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "index.html").write_text(name)
+
+    port = free_port()
+    mgr = ServiceManager(Dirs("testapp", _dirs=xdg_dirs), config(tmp_path / "a", port))
+    root = mgr.services[":root:"]
+    try:
+        root.start()
+        assert root.process is not None
+        assert root.process.pid == os.getpid()
+        assert get(port, "www.localhost").text == "a"
+
+        # only the route changes; the server keeps running
+        process = root.process
+        diff = mgr.apply_config(config(tmp_path / "b", port))
+        assert diff.servers == ["www.localhost"]
+        assert not diff.changed
+        assert root.process is process
+        assert get(port, "www.localhost").text == "b"
+        assert get(port, "other.localhost").status_code == 502
+    finally:
+        mgr.shutdown()
+
+    assert not process.is_running()
+    assert "Uvicorn running" in root.output.tail()
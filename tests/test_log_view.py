@@ -0,0 +1,174 @@
+import asyncio
+import time
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+import pytest
+from rich.control import Control
+from textual.app import App, ComposeResult
+
+from glue.output import OutputBuffer
+from glue.ui.log import LogView
+
+
+class LogApp(App[None]):
+    def compose(self) -> ComposeResult:
+        yield LogView()
+
+
+def run(test: Callable[[], Coroutine[Any, Any, None]]) -> None:
+    asyncio.run(test())
+
+
+def test_partial_lines_and_clear() -> None:
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test() as pilot:
+            log = app.query_one(LogView)
+            log.write("hello ")
+            log.write("world\nsecond")
+            await pilot.pause(0.1)
+            assert log.lines == ["hello world"]
+            assert log.partial == "second"
+            assert log.virtual_size.height == 2
+
+            log.write(Control.clear())
+            log.write("\x1b[31mred\x1b[0m\n")
+            await pilot.pause(0.1)
+            assert log.lines == ["\x1b[31mred\x1b[0m"]
+            assert log.virtual_size.width == 3
+
+    run(test)
+
+
+def test_max_lines() -> None:
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test() as pilot:
+            log = app.query_one(LogView)
+            log.max_lines = 100
+            log.write("".join(f"line {i}\n" for i in range(150)))
+            await pilot.pause(0.1)
+            assert len(log.lines) <= 100
+            assert log.lines[-1] == "line 149"
+
+    run(test)
+
+
+def test_max_lines_keeps_scroll_position() -> None:
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test() as pilot:
+            log = app.query_one(LogView)
+            log.max_lines = 100
+            log.write("".join(f"line {i}\n" for i in range(100)))
+            await pilot.pause(0.1)
+            log.scroll_to(y=50, animate=False)
+            await pilot.pause(0.1)
+            top = log.lines[log.scroll_offset.y]
+
+            # trimming the start moves the lines up, and the view with them
+            log.write("".join(f"more {i}\n" for i in range(20)))
+            await pilot.pause(0.1)
+            assert log.lines[log.scroll_offset.y] == top
+
+    run(test)
+
+
+def flood_lines(start: int, count: int) -> str:
+    return "".join(f"\x1b[32mline\x1b[0m {n}\n" for n in range(start, start + count))
+
+
+async def flood(
+    app: App[None], write: Callable[[str], None], total: int
+) -> list[float]:
+    """Flood the log from a thread, returning when the UI timer ticked meanwhile."""
+    ticks: list[float] = []
+    app.set_interval(1 / 60, lambda: ticks.append(time.perf_counter()))
+    chunks = [flood_lines(i, 100) for i in range(0, total, 100)]
+
+    def writer() -> None:
+        for chunk in chunks:
+            write(chunk)
+            time.sleep(0)  # a pty reader releases the GIL while reading
+
+    await asyncio.to_thread(writer)
+    await asyncio.sleep(0.2)
+    return ticks
+
+
+def test_writes_within_a_frame_are_flushed_once() -> None:
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test() as pilot:
+            log = app.query_one(LogView)
+            flushes = 0
+            flush = log.flush
+
+            def counting_flush() -> None:
+                nonlocal flushes
+                flushes += 1
+                flush()
+
+            log.flush = counting_flush  # type: ignore[method-assign]
+            for i in range(0, 10_000, 100):
+                log.write(flood_lines(i, 100))
+            await pilot.pause(0.2)
+            assert flushes == 1
+            assert len(log.lines) == 10_000
+
+    run(test)
+
+
+def test_flood_keeps_ui_responsive() -> None:
+    total_lines = 200_000
+
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test():
+            log = app.query_one(LogView)
+            ticks = await flood(app, log.write, total_lines)
+            assert len(log.lines) == total_lines
+            assert log.scroll_offset.y == log.max_scroll_y
+            # the timer kept running while the log was flooded
+            assert ticks
+
+    run(test)
+
+
+def test_flood_through_cursor() -> None:
+    """Flood a service's output while the view follows it, as the log screens do."""
+    total_lines = 200_000
+
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test():
+            log = app.query_one(LogView)
+            output = OutputBuffer()
+            log.follow(output.cursor())
+            await flood(app, lambda text: output.write(text.encode()), total_lines)
+
+            # output the view fell behind on is marked as skipped, never garbled
+            assert log.lines[-1] == f"\x1b[32mline\x1b[0m {total_lines - 1}"
+            assert all(
+                line.startswith(("\x1b[32mline", "\x1b[2m[")) or not line
+                for line in log.lines
+            )
+            assert log.scroll_offset.y == log.max_scroll_y
+
+    run(test)
+
+
+@pytest.mark.benchmark
+def test_flood_benchmark(report: Callable[[str], None]) -> None:
+    """Measure the gaps between UI timer ticks while the log is flooded."""
+
+    async def test() -> None:
+        app = LogApp()
+        async with app.run_test():
+            log = app.query_one(LogView)
+            ticks = await flood(app, log.write, 200_000)
+            stall = max(b - a for a, b in zip(ticks, ticks[1:]))
+            report(f"{len(ticks)} ticks, UI stalled for at most {stall * 1000:.0f}ms")
+
+    run(test)
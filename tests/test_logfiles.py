@@ -0,0 +1,87 @@
+import gzip
+import time
+from pathlib import Path
+
+import pytest
+
+from glue.logfiles import LogWriter
+from glue.output import OutputBuffer
+
+
+def read_segments(directory: Path) -> list[bytes]:
+    return [
+        gzip.decompress(path.read_bytes())
+        for path in sorted(directory.iterdir(), key=lambda p: p.stat().st_mtime)
+    ]
+
+
+def test_writes_are_batched_and_compressed(tmp_path: Path) -> None:
+    buf = OutputBuffer()
+    writer = LogWriter(buf, tmp_path)
+    for n in range(100):
+        buf.write(b"line %d\n" % n)
+    writer.close()
+
+    assert [p.suffixes for p in tmp_path.iterdir()] == [[".log", ".gz"]]
+    assert read_segments(tmp_path) == [b"".join(b"line %d\n" % n for n in range(100))]
+
+
+def test_rotates_by_size(tmp_path: Path) -> None:
+    buf = OutputBuffer()
+    writer = LogWriter(buf, tmp_path, max_bytes=10, flush_interval=0.01)
+    for n in range(3):
+        buf.write(b"0123456789%d" % n)
+        time.sleep(0.1)
+    writer.close()
+
+    assert read_segments(tmp_path) == [b"0123456789%d" % n for n in range(3)]
+
+
+def test_rotates_by_age(tmp_path: Path) -> None:
+    buf = OutputBuffer()
+    writer = LogWriter(buf, tmp_path, max_age=0.05, flush_interval=0.01)
+    buf.write(b"one")
+    time.sleep(0.1)
+    buf.write(b"two")
+    writer.close()
+
+    assert read_segments(tmp_path) == [b"one", b"two"]
+
+
+def test_retention(tmp_path: Path) -> None:
+    buf = OutputBuffer()
+    writer = LogWriter(
+        buf, tmp_path, max_bytes=1, retention=1000, compression="none", flush_interval=0
+    )
+    for _ in range(10):
+        buf.write(b"x" * 300)
+        time.sleep(0.05)
+    writer.close()
+
+    assert sum(p.stat().st_size for p in tmp_path.iterdir()) <= 1000
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_counts_output_overwritten_before_it_was_saved(tmp_path: Path) -> None:
+    buf = OutputBuffer(limit=16)
+    writer = LogWriter(buf, tmp_path)
+    buf.write(b"a" * 40)
+    writer.close()
+
+    assert writer.dropped == 24
+    assert read_segments(tmp_path) == [b"\n[glue: dropped 24 bytes]\n" + b"a" * 16]
+
+
+def test_compresses_segments_of_a_previous_run(tmp_path: Path) -> None:
+    (tmp_path / "20240101-000000.log").write_bytes(b"crashed")
+    buf = OutputBuffer()
+    writer = LogWriter(buf, tmp_path)
+    buf.write(b"new")
+    writer.close()
+
+    assert sorted(read_segments(tmp_path)) == [b"crashed", b"new"]
+
+
+def test_unknown_compression(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="Unknown compression"):
+        LogWriter(OutputBuffer(), tmp_path, compression="bz2")
@@ -0,0 +1,92 @@
+import json
+import math
+import time
+
+import pytest
+
+from glue.config import LogParserConfig
+from glue.logindex import LEVELS, LogIndex, percentile, query_latency, query_lines
+from glue.output import OutputBuffer
+
+
+def json_line(**fields: object) -> bytes:
+    return json.dumps(fields).encode() + b"\r\n"
+
+
+def test_json_fields() -> None:
+    buf = OutputBuffer()
+    index = LogIndex(buf, LogParserConfig(), service="api")
+    buf.write(b"starting up\r\n")
+    buf.write(json_line(level="INFO", request_id="a", latency_ms=12.5, ts=1.7e9))
+    # a line split across writes, in color
+    buf.write(b'\x1b[31m{"severity": "error", ')
+    buf.write(b'"req_id": "b", "time": "2024-01-01T00:00:00Z"}\x1b[0m\r\n')
+    buf.write(json_line(level="warn", duration_ms="3ms"))
+    index.close()
+
+    lines = index.select()
+    assert [(line.level, line.request_id) for line in lines] == [
+        ("info", "a"),
+        ("error", "b"),
+        ("warning", None),
+    ]
+    assert lines[0].logged == 1.7e9
+    assert lines[1].logged == 1704067200
+    assert [line.latency for line in lines[::2]] == [12.5, 3]
+    assert math.isnan(lines[1].latency)
+    assert lines[1].line.startswith('{"severity"')
+    assert lines[0].time <= lines[1].time <= time.time()
+
+
+def test_logfmt() -> None:
+    buf = OutputBuffer()
+    index = LogIndex(buf, LogParserConfig(format="logfmt", latency=["took"]))
+    buf.write(b'lvl=debug msg="user \\"x\\" logged in" req_id=r1 took=7\n')
+    buf.write(b"not structured\n")
+    index.close()
+
+    [line] = index.select()
+    assert (line.level, line.request_id, line.latency) == ("debug", "r1", 7)
+
+
+def test_queries_across_services() -> None:
+    outputs = {name: OutputBuffer() for name in ("api", "worker")}
+    indexes = [
+        LogIndex(buf, LogParserConfig(), service=n) for n, buf in outputs.items()
+    ]
+    for n in range(100):
+        name = "api" if n % 2 else "worker"
+        level = "error" if n % 10 == 0 else "info"
+        outputs[name].write(
+            json_line(level=level, request_id=f"r{n % 3}", latency_ms=n)
+        )
+    for index in indexes:
+        index.close()
+
+    errors = query_lines(indexes, level=LEVELS.index("error"), request_id="r0")
+    assert [json.loads(line.line)["latency_ms"] for line in errors] == [0, 30, 60, 90]
+    assert {line.service for line in errors} == {"worker"}
+    assert query_lines(indexes, request_id="unknown") == []
+
+    assert query_latency(indexes, 99) == (100, 98)
+    assert query_latency(indexes, 50, since=time.time() + 60) == (0, None)
+
+
+def test_max_lines() -> None:
+    buf = OutputBuffer()
+    index = LogIndex(buf, LogParserConfig(max_lines=100))
+    for n in range(1000):
+        buf.write(json_line(request_id=f"r{n}", latency_ms=n))
+        index.flush()
+    index.close()
+
+    assert 100 <= len(index) <= 125
+    assert index.select()[-1].request_id == "r999"
+    assert not index.select(request_id="r0")
+
+
+@pytest.mark.parametrize(
+    ("q", "expected"), [(0, 1), (50, 2), (90, 4), (99, 4), (100, 4)]
+)
+def test_percentile(q: float, expected: float) -> None:
+    assert percentile([4, 1, 3, 2], q) == expected
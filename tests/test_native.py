@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from glue.config import Config
+from glue.typecast import TypeCastError, typecast
+from glue.utils import DirResolver
+from glue.web import ProxyApp
+from glue.web.clients import UnixClientFactory
+from glue.web.native import ConnectionPool
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable, Iterator
+    from pathlib import Path
+
+    from starlette.requests import Request
+
+
+async def status(request: Request) -> Response:
+    return JSONResponse(
+        {
+            "ok": True,
+            "query": request.url.query,
+            "forwarded": request.headers.get("x-forwarded-host"),
+        }
+    )
+
+
+async def echo(request: Request) -> Response:
+    return Response(await request.body(), headers={"content-encoding": "identity"})
+
+
+@pytest.fixture
+def upstream(tmp_path: Path) -> Iterator[str]:
+    path = tmp_path / "api.sock"
+    app = Starlette(
+        routes=[Route("/status", status), Route("/echo", echo, methods=["POST"])]
+    )
+    server = uvicorn.Server(
+        uvicorn.Config(app, uds=str(path), log_config=None, access_log=False)
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not server.started:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    yield str(path)
+    server.should_exit = True
+    thread.join()
+
+
+def proxy(socket_path: str, engine: str) -> Starlette:
+    clients = UnixClientFactory(socket_path, DirResolver({}))
+    return Starlette(routes=[Mount("", ProxyApp(clients, engine=engine))])
+
+
+async def fetch(app: Starlette, count: int, concurrency: int) -> float:
+    """Send `count` requests through the proxy, and return how long they took."""
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 1234))
+    limit = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api") as client:
+
+        async def get() -> None:
+            async with limit:
+                resp = await client.get("/status")
+                assert resp.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(get() for _ in range(count)))
+        return time.perf_counter() - start
+
+
+def test_native_engine(upstream: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    connects = 0
+    original = ConnectionPool._connect  # noqa: SLF001
+
+    async def connect(self: ConnectionPool) -> object:
+        nonlocal connects
+        connects += 1
+        return await original(self)
+
+    monkeypatch.setattr(ConnectionPool, "_connect", connect)
+    app = proxy(upstream, "h11")
+
+    async def test() -> None:
+        transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            resp = await c.get("/status?a=1&b=2")
+            assert resp.json() == {"ok": True, "query": "a=1&b=2", "forwarded": "api"}
+
+            async def chunks() -> AsyncIterator[bytes]:
+                for chunk in (b"hello ", b"world"):
+                    yield chunk
+
+            resp = await c.post("/echo", content=chunks())
+            assert resp.content == b"hello world"
+            # the body is passed along as it was encoded
+            assert resp.headers["content-encoding"] == "identity"
+
+            for _ in range(10):
+                assert (await c.get("/status")).status_code == 200
+            assert (await c.get("/missing")).status_code == 404
+
+    asyncio.run(test())
+    assert connects == 1
+
+
+def test_native_engine_unreachable(tmp_path: Path) -> None:
+    app = proxy(str(tmp_path / "missing.sock"), "h11")
+
+    async def test() -> int:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            return (await c.get("/status")).status_code
+
+    assert asyncio.run(test()) == 502
+
+
+def test_pool_follows_slot_switch(tmp_path: Path) -> None:
+    servers = []
+    for slot in ("blue", "green"):
+        (tmp_path / slot).mkdir()
+
+        async def name(request: Request, slot: str = slot) -> Response:  # noqa: ARG001
+            return Response(slot)
+
+        server = uvicorn.Server(
+            uvicorn.Config(
+                Starlette(routes=[Route("/", name)]),
+                uds=str(tmp_path / slot / "api.sock"),
+                log_config=None,
+                access_log=False,
+            )
+        )
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+    deadline = time.monotonic() + 5
+    while not all(server.started for server in servers):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    link = tmp_path / "api"
+    link.symlink_to("blue")
+    app = proxy(str(link / "api.sock"), "h11")
+
+    async def test() -> list[str]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            first = (await c.get("/")).text
+            # switched like a blue/green restart does
+            (tmp_path / "tmp").symlink_to("green")
+            (tmp_path / "tmp").replace(link)
+            return [first, (await c.get("/")).text]
+
+    try:
+        assert asyncio.run(test()) == ["blue", "green"]
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+
+def test_h11_needs_http() -> None:
+    server = {"target": "https://example.com", "engine": "h11"}
+    with pytest.raises(TypeCastError, match="only supports http://"):
+        typecast(Config, {"servers": {"api.localhost": server}})
+
+
+def test_unknown_engine() -> None:
+    with pytest.raises(ValueError, match="Unknown engine"):
+        ProxyApp(UnixClientFactory("api.sock", DirResolver({})), engine="curl")
+
+
+def test_engines_under_load(upstream: str) -> None:
+    for engine in ("httpx", "h11"):
+        asyncio.run(fetch(proxy(upstream, engine), count=100, concurrency=20))
+
+
+@pytest.mark.benchmark
+def test_engines_benchmark(upstream: str, report: Callable[[str], None]) -> None:
+    count = 500
+    for engine in ("httpx", "h11"):
+        elapsed = asyncio.run(fetch(proxy(upstream, engine), count, concurrency=20))
+        report(f"{engine}: {count / elapsed:.0f} req/s")
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+from rich.control import Control
+
+from glue.output import OutputBuffer
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def read_all(buf: OutputBuffer) -> bytes:
+    cursor = buf.cursor()
+    data = cursor.read()
+    return b"".join(data.views) if data else b""
+
+
+def test_tail() -> None:
+    buf = OutputBuffer()
+    buf.write("one\ntwo\n")
+    buf.write("three\n")
+
+    assert buf.tail() == "one\ntwo\nthree\n"
+    assert buf.tail(2) == "two\nthree\n"
+    assert buf.tail(0) == ""
+
+
+def test_limit_drops_oldest_output() -> None:
+    buf = OutputBuffer(limit=8)
+    for chunk in ("aaaa", "bbbb", "cccc"):
+        buf.write(chunk)
+
+    assert buf.tail() == "bbbbcccc"
+    assert buf.size == 8
+
+
+def test_grows_up_to_limit() -> None:
+    buf = OutputBuffer(limit=256 * 1024)
+    data = bytes(range(256)) * 1024
+    for i in range(0, len(data), 1000):
+        buf.write(data[i : i + 1000])
+
+    assert read_all(buf) == data
+
+
+def test_clear() -> None:
+    buf = OutputBuffer()
+    buf.write("old\n")
+    buf.write(Control.clear())
+
+    assert buf.tail() == ""
+    assert buf.size == 0
+
+
+def test_cursors_read_views_without_copying() -> None:
+    buf = OutputBuffer(limit=8)
+    buf.write(b"abcdef")
+    buf.write(b"ghij")
+
+    data = buf.cursor().read()
+    assert data is not None
+    # the output wrapped around the end of the ring
+    assert [bytes(v) for v in data.views] == [b"cdefgh", b"ij"]
+    assert all(isinstance(v, memoryview) for v in data.views)
+    assert all(v.obj is data.views[0].obj for v in data.views)
+
+
+def test_cursors_are_independent() -> None:
+    buf = OutputBuffer()
+    first = buf.cursor()
+    buf.write(b"one\n")
+    second = buf.cursor(tail=0)
+    buf.write(b"two\n")
+
+    assert [bytes(v) for v in first.read().views] == [b"one\ntwo\n"]  # type: ignore[union-attr]
+    assert [bytes(v) for v in second.read().views] == [b"two\n"]  # type: ignore[union-attr]
+    assert first.read() is None
+
+
+def test_slow_cursor_lags() -> None:
+    buf = OutputBuffer(limit=8)
+    cursor = buf.cursor()
+    buf.write(b"aaaa")
+    buf.write(b"bbbb")
+    buf.write(b"cccc")
+
+    data = cursor.read()
+    assert data is not None
+    assert data.lagged == 4
+    assert cursor.lagged == 4
+    assert b"".join(data.views) == b"bbbbcccc"
+
+    # the views were overwritten while they were being used
+    buf.write(b"dd")
+    assert not cursor.check(data)
+    assert cursor.lagged == 12
+
+
+def test_reads_stop_at_clears() -> None:
+    buf = OutputBuffer()
+    cursor = buf.cursor()
+    buf.write(b"one")
+    buf.write(Control.clear())
+    buf.write(b"two")
+
+    first, second = cursor.read(), cursor.read()
+    assert first is not None
+    assert second is not None
+    assert (b"".join(first.views), first.cleared) == (b"one", False)
+    assert (b"".join(second.views), second.cleared) == (b"two", True)
+    assert cursor.read() is None
+
+
+def test_chunks_are_timestamped() -> None:
+    buf = OutputBuffer()
+    cursor = buf.cursor()
+    buf.write("one\n", timestamp=1.0)
+    buf.write("tw", timestamp=2.0)
+    buf.write("o\n", timestamp=3.0)
+
+    data = cursor.read(max_bytes=7)
+    assert data is not None
+    assert [(ts, cursor.decode(views)) for ts, views in data.chunks()] == [
+        (1.0, "one\n"),
+        (2.0, "tw"),
+        (3.0, "o"),
+    ]
+
+
+def test_decode_keeps_split_characters() -> None:
+    buf = OutputBuffer()
+    cursor = buf.cursor()
+    encoded = "héllo".encode()
+    buf.write(encoded[:2])
+    first = cursor.decode(cursor.read().views)  # type: ignore[union-attr]
+    buf.write(encoded[2:])
+    second = cursor.decode(cursor.read().views)  # type: ignore[union-attr]
+
+    assert (first, second) == ("h", "éllo")
+
+
+def test_on_data_wakes_consumers() -> None:
+    buf = OutputBuffer()
+    woken = threading.Event()
+    cursor = buf.cursor(on_data=woken.set)
+    buf.write(b"x")
+    assert woken.is_set()
+
+    cursor.close()
+    woken.clear()
+    buf.write(b"y")
+    assert not woken.is_set()
+
+
+def fan_out(total: int) -> tuple[list[tuple[int, int]], float]:
+    """Write `total` bytes in PTY sized chunks to ten subscribers.
+
+    Returns the bytes received and lagged by every subscriber, and how long the
+    writes took.
+    """
+    buf = OutputBuffer()
+    chunk = b"x" * 1023 + b"\n"
+    done = threading.Event()
+    results: list[tuple[int, int]] = []
+
+    def consume() -> None:
+        wake = threading.Event()
+        cursor = buf.cursor(tail=0, on_data=wake.set)
+        received = 0
+        while True:
+            wake.wait(0.01)
+            wake.clear()
+            finished = done.is_set()
+            while (data := cursor.read()) is not None:
+                size = sum(len(view) for view in data.views)
+                if cursor.check(data):
+                    received += size
+            if finished:
+                break
+        results.append((received, cursor.lagged))
+
+    consumers = [threading.Thread(target=consume) for _ in range(10)]
+    for t in consumers:
+        t.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    for _ in range(total // len(chunk)):
+        buf.write(chunk)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in consumers:
+        t.join()
+    return results, elapsed
+
+
+def test_fan_out() -> None:
+    total = 32 * 1024 * 1024
+    results, _ = fan_out(total)
+    # every byte is either received intact or reported as lagged
+    assert [received + lagged for received, lagged in results] == [total] * 10
+
+
+@pytest.mark.benchmark
+def test_fan_out_benchmark(report: Callable[[str], None]) -> None:
+    total = 256 * 1024 * 1024
+    results, elapsed = fan_out(total)
+    lagged = sum(lagged for _, lagged in results)
+    report(
+        f"{total / elapsed / 1024 / 1024:.0f} MiB/s to 10 subscribers, "
+        f"{lagged / 1024 / 1024:.1f} MiB lagged"
+    )
@@ -0,0 +1,59 @@
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from glue.config import Config, ScriptServiceConfig
+from glue.pm import ServiceManager
+from glue.ports import PortTable, load_ports, ports_path
+from glue.utils import Dirs, IPlatformDirs
+
+
+def test_allocate(tmp_path: Path) -> None:
+    path = tmp_path / "ports.json"
+    table = PortTable(path)
+    ports = table.allocate(["api", "ui"])
+    assert len(set(ports.values())) == 2
+    assert load_ports(path) == ports
+
+    # services keep their ports, and removed services give theirs up
+    assert table.allocate(["api", "worker"])["api"] == ports["api"]
+    assert set(load_ports(path)) == {"api", "worker"}
+
+    # the next run hands out the same ports, unless they are in use
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", ports["api"]))
+        sock.listen()
+        again = PortTable(path).allocate(["api", "worker"])
+    assert again["api"] != ports["api"]
+    assert again["worker"] == load_ports(path)["worker"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires pty")
+def test_service_port(xdg_dirs: IPlatformDirs) -> None:
+    config = Config(
+        services=[
+            ScriptServiceConfig(
+                name="api",
+                exec="sh",
+                args=["-c", 'echo "port $PORT {port}"; exec sleep 30'],
+                allocate_port=True,
+            )
+        ]
+    )
+    dirs = Dirs("test", _dirs=xdg_dirs)
+    mgr = ServiceManager(dirs, config)
+    try:
+        port = load_ports(ports_path(dirs))["api"]
+        assert mgr.resolver.resolve_vars("{api.port}") == str(port)
+
+        svc = mgr.services["api"]
+        svc.start()
+        deadline = time.monotonic() + 10
+        while f"port {port} {port}" not in svc.output.tail():
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        mgr.shutdown()
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+from glue.profiling import LoopMonitor, Profiler, Sampler, Stall
+
+
+def spin_in_known_function(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class Handler:
+    def profile_label(self, f_locals: Mapping[str, Any]) -> str:
+        return f"vhost {f_locals['host']}"
+
+    async def handle(self, host: str) -> None:  # noqa: ARG002
+        time.sleep(0.3)  # noqa: ASYNC251
+
+
+def test_sampler_records_every_thread() -> None:
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_in_known_function, args=(stop,), name="busy")
+    sampler = Sampler(interval=0.001)
+    thread.start()
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    stop.set()
+    thread.join()
+
+    collapsed = sampler.collapsed()
+    assert any(
+        line.startswith("busy;") and "spin_in_known_function" in line
+        for line in collapsed.splitlines()
+    )
+    assert "glue-sampler" not in collapsed
+
+    data = sampler.speedscope("test")
+    frames = data["shared"]["frames"]
+    profiles = {profile["name"]: profile for profile in data["profiles"]}
+    assert "busy" in profiles
+    for profile in profiles.values():
+        assert len(profile["samples"]) == len(profile["weights"])
+        assert all(0 <= i < len(frames) for stack in profile["samples"] for i in stack)
+
+
+def test_loop_monitor_attributes_stalls() -> None:
+    stalls: list[Stall] = []
+
+    async def main() -> None:
+        monitor = LoopMonitor("proxy", 0.05, stalls.append)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.2)  # an idle loop is not stalled
+            assert not stalls
+            await Handler().handle("api.localhost")
+            await asyncio.sleep(0.1)
+        finally:
+            monitor.stop()
+
+    asyncio.run(main())
+
+    assert len(stalls) == 1
+    stall = stalls[0]
+    assert stall.label == "vhost api.localhost"
+    assert stall.duration >= 0.25
+    assert any("Handler.handle" in line for line in stall.stack)
+
+
+def test_profiler_writes_profiles(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path, name="glue", slow_callback=0.05)
+    profiler.start()
+
+    async def main() -> None:
+        profiler.watch_loop("tui")
+        await Handler().handle("ui.localhost")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    paths = profiler.stop()
+
+    assert sorted(path.name.split(".", 1)[1] for path in paths) == [
+        "collapsed",
+        "speedscope.json",
+        "stalls.txt",
+    ]
+    for path in paths:
+        assert path.parent == tmp_path
+        if path.suffix == ".json":
+            assert json.loads(path.read_text())["profiles"]
+        elif path.name.endswith(".stalls.txt"):
+            assert "The tui loop was blocked" in path.read_text()
+            assert "in vhost ui.localhost" in path.read_text()
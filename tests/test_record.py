@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Host, Route, WebSocketRoute
+from starlette.testclient import TestClient
+
+from glue.config import Config, LocalAddressServer
+from glue.utils import DirResolver
+from glue.web.factory import RouteTable
+from glue.web.record import REDACTED, Exchange, Frame, Recorder, load_exchanges
+from glue.web.replay import Replay
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from starlette.requests import Request
+    from starlette.websockets import WebSocket
+
+
+def create_app(version: str) -> Starlette:
+    async def echo(request: Request) -> Response:
+        return Response(await request.body())
+
+    async def get_version(request: Request) -> Response:  # noqa: ARG001
+        return Response(version)
+
+    async def ws_echo(websocket: WebSocket) -> None:
+        await websocket.accept()
+        async for message in websocket.iter_text():
+            await websocket.send_text(message.upper())
+
+    return Starlette(
+        routes=[
+            Route("/echo", echo, methods=["POST"]),
+            Route("/version", get_version),
+            WebSocketRoute("/ws", ws_echo),
+        ]
+    )
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(create_app("2"), host="127.0.0.1", port=port, log_config=None)
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not server.started:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+def record(path: Path) -> None:
+    recorder = Recorder(create_app("1"), path)
+    with TestClient(recorder) as client:
+        assert client.post("/echo?x=1", content=b"hello").content == b"hello"
+        client.get("/version")
+        with client.websocket_connect("/ws") as ws:
+            ws.send_text("hi")
+            assert ws.receive_text() == "HI"
+    recorder.close()
+
+
+def test_record(tmp_path: Path) -> None:
+    path = tmp_path / "www" / "recording.rec"
+    record(path)
+
+    echo, version, ws = load_exchanges(path)
+    assert (echo.method, echo.path, echo.query) == ("POST", "/echo", "x=1")
+    assert echo.body == echo.response_body == b"hello"
+    assert echo.status == 200
+    assert echo.latency is not None
+    assert version.response_body == b"1"
+    assert echo.start <= version.start <= ws.start
+
+    assert ws.type == "websocket"
+    assert [(f.incoming, f.data) for f in ws.frames] == [(True, b"hi"), (False, b"HI")]
+    assert ws.end is not None
+
+    # a write cut short by a crash only loses the last event
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    assert len(load_exchanges(path)) == 3
+    assert load_exchanges(path)[-1].end is None
+
+
+@pytest.mark.parametrize("keep_credentials", [False, True])
+def test_record_credentials(tmp_path: Path, *, keep_credentials: bool) -> None:
+    path = tmp_path / "recording.rec"
+    recorder = Recorder(create_app("1"), path, keep_credentials=keep_credentials)
+    with TestClient(recorder) as client:
+        headers = {"Authorization": "Bearer token", "Cookie": "session=abc"}
+        client.get("/version", headers={**headers, "X-Trace": "1"})
+    recorder.close()
+
+    (exchange,) = load_exchanges(path)
+    headers = dict(exchange.headers)
+    assert headers["x-trace"] == "1"
+    if keep_credentials:
+        assert headers["authorization"] == "Bearer token"
+        assert headers["cookie"] == "session=abc"
+    else:
+        assert headers["authorization"] == headers["cookie"] == REDACTED
+
+
+@pytest.mark.parametrize("speed", [1.0, None])
+def test_replay(tmp_path: Path, server: str, speed: float | None) -> None:
+    path = tmp_path / "recording.rec"
+    record(path)
+
+    replay = Replay(server, speed=speed, timeout=5)
+    report = asyncio.run(replay.run(load_exchanges(path)))
+
+    assert len(report.results) == 3
+    assert all(result.error is None for result in report.results)
+    assert len(report.latencies) == 3
+    assert report.percentile(50) <= report.percentile(99)
+
+    # the server runs a newer version than the one that was recorded
+    mismatches = report.mismatches()
+    assert len(mismatches) == 1
+    result, diff = mismatches[0]
+    assert result.exchange.path == "/version"
+    assert "-1" in diff
+    assert "+2" in diff
+
+
+def test_route_table_records(tmp_path: Path) -> None:
+    servers = {
+        "a.localhost": LocalAddressServer(target="http://127.0.0.1:1", record=True),
+        "b.localhost": LocalAddressServer(target="http://127.0.0.1:2"),
+    }
+    table = RouteTable(DirResolver({}), record_dir=tmp_path)
+    a, b, _ = table.build(Config(servers=servers))
+    assert isinstance(a, Host)
+    assert isinstance(a.app, Recorder)
+    assert a.app.path.parent == tmp_path / "a.localhost"
+    assert isinstance(b, Host)
+    assert not isinstance(b.app, Recorder)
+
+
+def test_replay_websocket_failures(server: str) -> None:
+    def session(path: str, frames: list[Frame]) -> Exchange:
+        return Exchange(
+            id=0,
+            type="websocket",
+            start=0,
+            method="GET",
+            path=path,
+            query="",
+            headers=[],
+            body=b"",
+            frames=frames,
+        )
+
+    exchanges = [
+        # the server has no such route and rejects the handshake
+        session("/missing", [Frame(0, incoming=True, text=True, data=b"hi")]),
+        # nothing was sent back, so there is nothing to wait for
+        session("/ws", []),
+    ]
+    replay = Replay(server, speed=None, timeout=30)
+    report = asyncio.run(asyncio.wait_for(replay.run(exchanges), 10))
+
+    missing, silent = sorted(report.results, key=lambda r: r.exchange.path)
+    assert missing.error is not None
+    assert "403" in missing.error
+    assert silent.error is None
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount, WebSocketRoute
+from websockets import ConnectionClosed
+from websockets.asyncio.client import unix_connect
+from websockets.frames import Close
+
+from glue.config import WebSocketConfig
+from glue.utils import DirResolver
+from glue.web import ProxyApp
+from glue.web.clients import UnixClientFactory
+from glue.web.relay import WebSocketHandler
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from starlette.websockets import WebSocket
+
+
+async def echo(ws: WebSocket) -> None:
+    await ws.accept()
+    while (message := await ws.receive())["type"] != "websocket.disconnect":
+        if (text := message.get("text")) is not None:
+            if text == "bye":
+                await ws.close(4000, "bye")
+                return
+            await ws.send_text(text)
+        else:
+            await ws.send_bytes(message["bytes"])
+
+
+async def extensions(ws: WebSocket) -> None:
+    await ws.accept()
+    await ws.send_text(ws.headers.get("sec-websocket-extensions", ""))
+    await ws.close()
+
+
+def serve(app: Starlette, path: Path) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, uds=str(path), log_config=None, access_log=False)
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not server.started:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return server
+
+
+def start_proxy(tmp_path: Path, config: WebSocketConfig) -> Iterator[str]:
+    upstream = tmp_path / "api.sock"
+    proxy = tmp_path / "proxy.sock"
+    routes = [WebSocketRoute("/echo", echo), WebSocketRoute("/ext", extensions)]
+    clients = UnixClientFactory(str(upstream), DirResolver({}))
+    servers = [
+        serve(Starlette(routes=routes), upstream),
+        serve(
+            Starlette(routes=[Mount("", ProxyApp(clients, websocket=config))]), proxy
+        ),
+    ]
+    yield str(proxy)
+    for server in servers:
+        server.should_exit = True
+
+
+@pytest.fixture
+def proxy(tmp_path: Path) -> Iterator[str]:
+    yield from start_proxy(tmp_path, WebSocketConfig())
+
+
+@pytest.fixture
+def compressing_proxy(tmp_path: Path) -> Iterator[str]:
+    yield from start_proxy(tmp_path, WebSocketConfig(compression=True))
+
+
+def test_relay(proxy: str, caplog: pytest.LogCaptureFixture) -> None:
+    async def test() -> ConnectionClosed:
+        async with unix_connect(proxy, "ws://api/echo") as ws:
+            await ws.send("hello")
+            assert await ws.recv() == "hello"
+            await ws.send(b"\x00\x01")
+            assert await ws.recv() == b"\x00\x01"
+            await ws.send("bye")
+            with pytest.raises(ConnectionClosed) as e:
+                await ws.recv()
+            return e.value
+
+    with caplog.at_level("INFO", logger="glue.web"):
+        closed = asyncio.run(test())
+        time.sleep(0.1)
+    # the service's close code reaches the browser
+    assert closed.rcvd is not None
+    assert (closed.rcvd.code, closed.rcvd.reason) == (4000, "bye")
+    assert "/echo closed after" in caplog.text
+    assert "in 3 msgs" in caplog.text
+    assert "out 2 msgs" in caplog.text
+
+
+@pytest.mark.parametrize(
+    ("fixture", "expected"), [("proxy", ""), ("compressing_proxy", "deflate")]
+)
+def test_compression(
+    request: pytest.FixtureRequest, fixture: str, expected: str
+) -> None:
+    path = request.getfixturevalue(fixture)
+
+    async def test() -> str:
+        async with unix_connect(path, "ws://api/ext") as ws:
+            message = await ws.recv()
+            assert isinstance(message, str)
+            return message
+
+    assert expected in asyncio.run(test())
+
+
+class SlowBrowser:
+    """Accepts messages only as fast as the test lets it."""
+
+    url = SimpleNamespace(path="/feed")
+
+    def __init__(self) -> None:
+        self.received: list[Any] = []
+        self.ready = asyncio.Event()
+        self.closed: tuple[int, str] | None = None
+
+    async def accept(self, subprotocol: str | None = None) -> None:
+        pass
+
+    async def receive(self) -> dict[str, Any]:
+        await asyncio.Event().wait()  # the browser never sends anything
+        raise AssertionError
+
+    async def send_text(self, data: str) -> None:
+        await self.ready.wait()
+        self.received.append(data)
+
+    async def close(self, code: int, reason: str = "") -> None:
+        self.closed = (code, reason)
+
+
+class FastService:
+    subprotocol = None
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.sent = 0
+
+    async def recv(self) -> str:
+        if self.sent == self.count:
+            raise ConnectionClosed(Close(1000, "done"), None)
+        self.sent += 1
+        await asyncio.sleep(0)
+        return str(self.sent)
+
+    async def close(self, code: int, reason: str = "") -> None:
+        pass
+
+
+def test_backpressure() -> None:
+    service = FastService(100)
+    browser = SlowBrowser()
+    handler = WebSocketHandler(service, max_queue=8)  # type: ignore[arg-type]
+
+    async def test() -> None:
+        task = asyncio.create_task(handler(browser))  # type: ignore[arg-type]
+        for _ in range(50):
+            await asyncio.sleep(0)
+        # the service is only read as far as the queue and the pending send allow
+        assert service.sent <= 8 + 2
+        browser.ready.set()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(test())
+    assert browser.received == [str(i) for i in range(1, 101)]
+    assert browser.closed == (1000, "done")
+    assert handler.metrics is not None
+    outbound = handler.metrics.outbound
+    assert outbound.messages == 100
+    assert outbound.max_queue == 8
+    assert outbound.stalls > 0
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+import glue
+from glue.config import (
+    Config,
+    ConfigDiff,
+    LocalAddressServer,
+    ScriptServiceConfig,
+    StaticServer,
+    load_config,
+)
+from glue.pm import ServiceManager
+from glue.utils import DirResolver, Dirs, IPlatformDirs
+from glue.watch import WatchRule
+from glue.web.factory import RouteTable
+
+CONFIG = """
+[[services]]
+name = "api"
+exec = "sh"
+args = ["-c", "echo api; exec sleep 30"]
+
+[[services]]
+name = "worker"
+exec = "sh"
+args = ["-c", "echo {version}; exec sleep 30"]
+"""
+
+
+def service(name: str, text: str = "") -> ScriptServiceConfig:
+    return ScriptServiceConfig(
+        name=name, exec="sh", args=["-c", f"echo {text or name}; exec sleep 30"]
+    )
+
+
+@pytest.fixture
+def dirs(xdg_dirs: IPlatformDirs) -> Dirs:
+    return Dirs("testapp", _dirs=xdg_dirs)
+
+
+def wait_for(predicate: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_diff() -> None:
+    old = Config(
+        servers={"a.localhost": StaticServer(root_path=".")},
+        services=[service("api"), service("worker"), service("db")],
+    )
+    new = Config(
+        servers={
+            "a.localhost": StaticServer(root_path="."),
+            "b.localhost": LocalAddressServer(target="http://localhost:1"),
+        },
+        default_server=StaticServer(root_path="."),
+        services=[service("api"), service("worker", "v2"), service("cache")],
+    )
+
+    assert old.diff(new) == ConfigDiff(
+        added=["cache"],
+        removed=["db"],
+        changed=["worker"],
+        servers=["b.localhost", ""],
+    )
+    assert not new.diff(new)
+
+
+def test_apply_config_restarts_only_changed_services(dirs: Dirs) -> None:
+    mgr = ServiceManager(
+        dirs, Config(services=[service("api"), service("worker"), service("db")])
+    )
+    try:
+        for svc in mgr.services.values():
+            svc.start()
+        pids = {name: svc.process.pid for name, svc in mgr.services.items()}  # type: ignore[union-attr]
+        worker = mgr.services["worker"]
+        db = mgr.services["db"]
+
+        diff = mgr.apply_config(
+            Config(services=[service("cache"), service("api"), service("worker", "v2")])
+        )
+
+        assert diff.changed == ["worker"]
+        assert list(mgr.services) == ["cache", "api", "worker"]
+        assert mgr.services["api"].process.pid == pids["api"]  # type: ignore[union-attr]
+        assert mgr.services["worker"] is worker
+        assert worker.process.pid != pids["worker"]  # type: ignore[union-attr]
+        assert db.status == "stopped"
+        assert mgr.services["cache"].status == "running"
+        wait_for(lambda: "v2" in worker.output.tail())
+    finally:
+        mgr.shutdown()
+
+
+def test_watch_config(dirs: Dirs, tmp_path: Path) -> None:
+    path = tmp_path / "servers.toml"
+    path.write_text(CONFIG.format(version="v1"))
+    mgr = ServiceManager(dirs, load_config(path))
+    changes: list[ConfigDiff] = []
+    changed = threading.Event()
+    mgr.on_change.append(lambda diff: (changes.append(diff), changed.set()))
+    mgr.watch_config(path, lambda: load_config(path))
+    try:
+        mgr.start_watcher()
+        time.sleep(0.2)  # give the watcher time to start
+
+        path.write_text("not toml = [")
+        api = mgr.services["api"]
+        wait_for(lambda: "Failed to reload the config" in api.output.tail())
+        assert not changes
+
+        path.write_text(CONFIG.format(version="v2"))
+
+        assert changed.wait(5)
+        assert [diff.changed for diff in changes] == [["worker"]]
+        assert mgr.services["worker"].config.args[-1] == "echo v2; exec sleep 30"
+    finally:
+        mgr.shutdown()
+
+
+def test_route_table_keeps_unchanged_routes(tmp_path: Path) -> None:
+    table = RouteTable(DirResolver({}))
+    static = StaticServer(root_path=str(tmp_path))
+    a, b, default = table.build(
+        Config(
+            servers={
+                "a.localhost": static,
+                "b.localhost": LocalAddressServer(target="http://localhost:1"),
+            }
+        )
+    )
+
+    a2, b2, default2 = table.build(
+        Config(
+            servers={
+                "a.localhost": StaticServer(root_path=str(tmp_path)),
+                "b.localhost": LocalAddressServer(target="http://localhost:2"),
+            }
+        )
+    )
+    assert a2 is a
+    assert b2 is not b
+    assert default2 is default
+
+    routes = table.build(Config(default_server=static))
+    assert len(routes) == 1
+    assert routes[0] is not default
+
+
+def test_reload_without_editable_install(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("glue.utils.get_editable_dirs", list)
+    config = Config(servers={"www.localhost": StaticServer(root_path="www")})
+    config.insert_root_service(
+        Path("servers.toml"), host="127.0.0.1", port=8000, reload=True
+    )
+    watch = config.services[0].watch
+    # the installed package is watched instead
+    assert watch is not None
+    assert watch.paths == [str(Path(glue.__file__).parent)]
+
+
+def test_reload_watches_only_glue_code(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("glue.utils.get_editable_dirs", lambda: [str(tmp_path)])
+    config = Config(
+        services=[
+            ScriptServiceConfig(name="api", cwd=str(tmp_path / "example"), exec="sh")
+        ]
+    )
+    config.insert_root_service(
+        Path("servers.toml"), host="127.0.0.1", port=8000, reload=True
+    )
+    watch = config.services[0].watch
+    assert watch is not None
+    rule = WatchRule.from_config(":root:", Path(), watch, lambda: None)
+
+    assert rule.matches(tmp_path / "src" / "glue" / "pm.py")
+    # services and anything but code are left alone
+    assert not rule.matches(tmp_path / "example" / "app.py")
+    assert not rule.matches(tmp_path / "example" / "pkg" / "models.py")
+    assert not rule.matches(tmp_path / "docs" / "index.md")
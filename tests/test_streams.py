@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from glue.config import StreamServer
+from glue.streams import CAN_SPLICE, StreamGroup
+from glue.utils import DirResolver
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Coroutine, Iterator
+    from pathlib import Path
+
+MODES = [
+    pytest.param(
+        "splice", marks=pytest.mark.skipif(not CAN_SPLICE, reason="no splice")
+    ),
+    "copy",
+]
+
+
+@pytest.fixture
+def echo_server(tmp_path: Path) -> Iterator[str]:
+    """Echo every connection back, until the client shuts down its side."""
+    path = tmp_path / "echo.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+    listener.listen()
+
+    def echo(conn: socket.socket) -> None:
+        buffer = bytearray(256 * 1024)
+        view = memoryview(buffer)
+        with conn:
+            while size := conn.recv_into(buffer):
+                conn.sendall(view[:size])
+
+    def serve() -> None:
+        with contextlib.suppress(OSError):
+            while True:
+                conn, _ = listener.accept()
+                threading.Thread(target=echo, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"unix://{path}"
+    listener.shutdown(socket.SHUT_RDWR)
+    listener.close()
+
+
+@pytest.fixture
+def loop() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def run(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, Any]) -> Any:
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=5)
+
+
+def start(
+    loop: asyncio.AbstractEventLoop, target: str, *, splice: bool
+) -> tuple[StreamGroup, tuple[str, int]]:
+    group = StreamGroup(DirResolver({}))
+    run(
+        loop,
+        group.apply({"echo": StreamServer(listen="tcp://127.0.0.1:0", target=target)}),
+    )
+    proxy = group.proxies["echo"]
+    proxy.splice = splice
+    address = proxy.address
+    assert isinstance(address, tuple)
+    return group, address
+
+
+def transfer(address: tuple[str, int], size: int) -> bytes:
+    """Send `size` bytes while reading the echo, then half-close and read the rest."""
+    payload = bytes(range(256)) * (size // 256)
+    with socket.create_connection(address) as sock:
+
+        def send() -> None:
+            sock.sendall(payload)
+            sock.shutdown(socket.SHUT_WR)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        received = bytearray()
+        while chunk := sock.recv(1024 * 1024):
+            received += chunk
+        sender.join()
+    assert received == payload
+    return payload
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_relay(loop: asyncio.AbstractEventLoop, echo_server: str, mode: str) -> None:
+    group, address = start(loop, echo_server, splice=mode == "splice")
+    try:
+        transfer(address, 1024 * 1024)
+        metrics = group.metrics()["echo"]
+        assert metrics["connections"] == 1
+        assert metrics["bytes_in"] == metrics["bytes_out"] == 1024 * 1024
+        assert metrics["failed"] == 0
+    finally:
+        run(loop, group.close())
+
+
+def test_unreachable_target(loop: asyncio.AbstractEventLoop, tmp_path: Path) -> None:
+    group, address = start(loop, f"unix://{tmp_path}/missing.sock", splice=False)
+    try:
+        with socket.create_connection(address) as sock:
+            assert sock.recv(1) == b""
+        for _ in range(50):
+            if group.metrics()["echo"]["failed"]:
+                break
+            time.sleep(0.01)
+        assert group.metrics()["echo"] == {
+            "connections": 1,
+            "active": 0,
+            "failed": 1,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+    finally:
+        run(loop, group.close())
+
+
+def test_apply_keeps_unchanged(
+    loop: asyncio.AbstractEventLoop, tmp_path: Path, echo_server: str
+) -> None:
+    group = StreamGroup(DirResolver({}), metrics_file=tmp_path / "streams.json")
+    a = StreamServer(listen=f"unix://{tmp_path}/a.sock", target=echo_server)
+    b = StreamServer(listen=f"unix://{tmp_path}/b.sock", target=echo_server)
+    try:
+        run(loop, group.apply({"a": a, "b": b}))
+        first = dict(group.proxies)
+
+        c = StreamServer(listen=f"unix://{tmp_path}/c.sock", target=echo_server)
+        run(loop, group.apply({"a": a, "b": c}))
+        assert group.proxies["a"] is first["a"]
+        assert group.proxies["b"] is not first["b"]
+        assert not (tmp_path / "b.sock").exists()
+        assert (tmp_path / "streams.json").exists()
+    finally:
+        run(loop, group.close())
+    assert not (tmp_path / "a.sock").exists()
+    assert not (tmp_path / "streams.json").exists()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_large_transfer(
+    loop: asyncio.AbstractEventLoop, echo_server: str, mode: str
+) -> None:
+    group, address = start(loop, echo_server, splice=mode == "splice")
+    try:
+        transfer(address, 64 * 1024 * 1024)
+    finally:
+        run(loop, group.close())
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("mode", MODES)
+def test_throughput_benchmark(
+    loop: asyncio.AbstractEventLoop,
+    echo_server: str,
+    mode: str,
+    report: Callable[[str], None],
+) -> None:
+    size = 256 * 1024 * 1024
+    group, address = start(loop, echo_server, splice=mode == "splice")
+    try:
+        started = time.perf_counter()
+        transfer(address, size)
+        elapsed = time.perf_counter() - started
+    finally:
+        run(loop, group.close())
+    # both directions are relayed, so twice the payload went through the proxy
+    report(f"{2 * size / elapsed / 1024 / 1024:.0f} MiB/s")
@@ -0,0 +1,73 @@
+import random
+import time
+from collections.abc import Callable
+
+import pytest
+
+from glue.output import Chunk
+from glue.timeline import Timeline, TimelineEntry
+
+
+def test_merges_services_in_time_order() -> None:
+    timeline = Timeline(["api", "proxy", "worker"], delay=0)
+    timeline.add("worker", Chunk(3.0, "job done\n"))
+    timeline.add("proxy", Chunk(1.0, "GET /\n"))
+    timeline.add("api", Chunk(2.0, "handling /\nenqueued\n"))
+    timeline.add("proxy", Chunk(4.0, "200 OK\n"))
+
+    assert timeline.pop(now=10) == [
+        TimelineEntry(1.0, "proxy", "GET /"),
+        TimelineEntry(2.0, "api", "handling /"),
+        TimelineEntry(2.0, "api", "enqueued"),
+        TimelineEntry(3.0, "worker", "job done"),
+        TimelineEntry(4.0, "proxy", "200 OK"),
+    ]
+    assert timeline.pop(now=10) == []
+
+
+def test_recent_lines_are_held_back() -> None:
+    timeline = Timeline(["a", "b"], delay=0.5)
+    timeline.add("a", Chunk(1.0, "first\n"))
+    timeline.add("a", Chunk(2.0, "third\n"))
+
+    assert timeline.pop(now=2.1) == [TimelineEntry(1.0, "a", "first")]
+
+    # delivered late, but captured before "third"
+    timeline.add("b", Chunk(1.9, "second\n"))
+    assert [e.line for e in timeline.pop(now=3)] == ["second", "third"]
+
+
+def test_partial_lines() -> None:
+    timeline = Timeline(["a"], delay=0, partial_timeout=1)
+    timeline.add("a", Chunk(1.0, "hel"))
+    timeline.add("a", Chunk(1.5, "lo\r\nwor"))
+
+    assert timeline.pop(now=1.6) == [TimelineEntry(1.0, "a", "hello")]
+    # a line that never ends is shown once it is old enough
+    assert timeline.pop(now=2.6) == [TimelineEntry(1.5, "a", "wor")]
+
+
+def busy_timeline(lines: int) -> Timeline:
+    """Ten services that wrote `lines` lines in chunks of ten, interleaved."""
+    services = [f"svc{i}" for i in range(10)]
+    timeline = Timeline(services, delay=0)
+
+    rng = random.Random(0)  # noqa: S311
+    for n, ts in enumerate(sorted(rng.random() for _ in range(lines // 10))):
+        timeline.add(rng.choice(services), Chunk(ts, f"{n}\n" * 10))
+    return timeline
+
+
+def test_merge_many_lines() -> None:
+    entries = busy_timeline(100_000).pop(now=2)
+
+    assert len(entries) == 100_000
+    assert [e.timestamp for e in entries] == sorted(e.timestamp for e in entries)
+
+
+@pytest.mark.benchmark
+def test_merge_benchmark(report: Callable[[str], None]) -> None:
+    timeline = busy_timeline(1_000_000)
+    start = time.perf_counter()
+    timeline.pop(now=2)
+    report(f"merged 1M lines in {(time.perf_counter() - start) * 1000:.0f}ms")
@@ -1,14 +1,26 @@
 import re
+import time
 from collections.abc import Callable
 from dataclasses import dataclass
 from typing import Any, Optional, Union
 
 import pytest
 
-from glue.typecast import TypeCastError, typecast
+from glue.config import (
+    Config,
+    LocalAddressServer,
+    PythonServiceConfig,
+    ScriptServiceConfig,
+    StaticServer,
+    UnixDomainSocketServer,
+    WatchConfig,
+)
+from glue.typecast import TypeCastError, compile_type, typecast
 
 AnyFunc = Callable[[], Any]
 
+WATCH = WatchConfig(paths=["src"], include=["*.py"], debounce=1)
+
 
 @dataclass
 class EmptyClass:
@@ -45,6 +57,8 @@ class DictField:
     ("typ", "val", "result"),
     [
         (str, "hello", "hello"),
+        (float, 5, 5.0),
+        (float, 2.5, 2.5),
         (EmptyClass, {}, EmptyClass()),
         (MultipleFields, {"a": "A", "b": "B"}, MultipleFields("A", "B")),
         (UnionFields, {"c": {}}, UnionFields(EmptyClass())),
@@ -69,6 +83,11 @@ def test_typecast_generic_error() -> None:
         typecast(list[int], ["3"])
 
 
+def test_typecast_bool_is_not_float() -> None:
+    with pytest.raises(TypeCastError, match="Value was bool, but expected float"):
+        typecast(float, True)  # noqa: FBT003
+
+
 def test_unsupported_error() -> None:
     typ = re.escape(str(AnyFunc))
     with pytest.raises(NotImplementedError, match=f"{typ} is not supported yet"):
@@ -101,3 +120,109 @@ Possible issues:
 """.strip(),
     ):
         typecast(UnionFields, {"c": {"x": "y"}})
+
+
+def test_converters_are_cached() -> None:
+    assert compile_type(dict[str, ListField]) is compile_type(dict[str, ListField])
+
+
+@dataclass
+class Unix:
+    uds: str
+    timeout: Optional[float] = None  # noqa: FA100
+
+
+@dataclass
+class Address:
+    target: str
+    timeout: Optional[float] = None  # noqa: FA100
+
+
+@dataclass
+class Servers:
+    servers: dict[str, Union[Unix, Address]]  # noqa: FA100
+
+
+def test_union_dispatches_on_unique_keys() -> None:
+    assert typecast(Servers, {"servers": {"a": {"target": "x", "timeout": 1}}}) == (
+        Servers({"a": Address(target="x", timeout=1.0)})
+    )
+    # the error comes from the dataclass the key belongs to
+    with pytest.raises(
+        TypeCastError,
+        match=r"'servers.a.uds': Value was int, but expected str",
+    ):
+        typecast(Servers, {"servers": {"a": {"uds": 1}}})
+
+
+def generate_config(count: int) -> dict[str, Any]:
+    servers: dict[str, Any] = {}
+    services: list[dict[str, Any]] = []
+    for i in range(count):
+        servers[f"uds{i}.localhost"] = {"uds": f"{{svc{i}.xdg_run}}/app.sock"}
+        servers[f"addr{i}.localhost"] = {"target": f"http://localhost:{3000 + i}"}
+        servers[f"static{i}.localhost"] = {"root_path": f"www/{i}"}
+        services.append(
+            {
+                "name": f"svc{i}",
+                "cwd": f"services/{i}",
+                "env": {"PORT": str(3000 + i), "DEBUG": None},
+                "python": ".venv/bin/python",
+                "module": "uvicorn",
+                "args": ["app:app", "--uds", "{xdg_run}/app.sock"],
+                "watch": {"paths": ["src"], "include": ["*.py"], "debounce": 1},
+            }
+        )
+        services.append(
+            {
+                "name": f"ui{i}",
+                "exec": "pnpm",
+                "args": ["run", "dev"],
+                "ready_timeout": 5,
+            }
+        )
+    return {"servers": servers, "services": services}
+
+
+def test_large_config(monkeypatch: pytest.MonkeyPatch) -> None:
+    data = generate_config(500)
+    typecast(Config, generate_config(1))  # compile the converters
+
+    raised = []
+    init = TypeCastError.__init__
+
+    def counting_init(self: TypeCastError, key: str, message: str) -> None:
+        raised.append(key)
+        init(self, key, message)
+
+    monkeypatch.setattr(TypeCastError, "__init__", counting_init)
+
+    config = typecast(Config, data)
+
+    servers = list(config.servers.values())
+    assert [type(server) for server in servers[:3]] == [
+        UnixDomainSocketServer,
+        LocalAddressServer,
+        StaticServer,
+    ]
+    assert len(servers) == 1500
+    assert len(config.services) == 1000
+    assert all(
+        isinstance(svc, PythonServiceConfig) and svc.watch == WATCH
+        for svc in config.services[::2]
+    )
+    assert all(isinstance(svc, ScriptServiceConfig) for svc in config.services[1::2])
+    # every union member is picked up front, so a successful parse never tries
+    # a converter that fails
+    assert raised == []
+
+
+@pytest.mark.benchmark
+def test_large_config_benchmark(report: Callable[[str], None]) -> None:
+    typecast(Config, generate_config(1))  # compile the converters
+    for count in (500, 5000):
+        data = generate_config(count)
+        start = time.perf_counter()
+        typecast(Config, data)
+        elapsed = time.perf_counter() - start
+        report(f"{3 * count} servers, {2 * count} services: {elapsed * 1000:.0f}ms")
@@ -1,8 +1,13 @@
+import time
+from collections.abc import Callable, Mapping
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
 
 import pytest
 
-from glue.utils import DirResolver, Dirs
+from glue.config import ScriptServiceConfig
+from glue.utils import DirResolver, Dirs, Template, compile_template
 
 
 class XDGDirs:
@@ -56,3 +61,110 @@ def test_namespaced_resolver(dirs: Dirs) -> None:
         "/run/test/glue/testapp/app2/app2.sock",
         "/test/.local/state/glue/testapp/app3/stdout.log",
     ]
+
+
+def test_slot_dirs(dirs: Dirs) -> None:
+    d2 = (dirs / "app2").with_slot("blue")
+    assert str(d2.runtime_dir) == "/run/test/glue/testapp/app2@blue"
+    assert str(d2.state_dir) == "/test/.local/state/glue/testapp/app2"
+    assert (
+        d2.resolve_vars("{xdg_run}/app.sock")
+        == "/run/test/glue/testapp/app2@blue/app.sock"
+    )
+
+
+def test_port_vars(dirs: Dirs) -> None:
+    api = (dirs / "api").with_port(8123)
+    config = ScriptServiceConfig(
+        name="api", exec="api", allocate_port=True, listen="tcp://127.0.0.1:{port}"
+    )
+    res = DirResolver({"api": api, "ui": dirs / "ui"}, [config])
+
+    assert api.resolve_vars("--port={port}") == "--port=8123"
+    assert res.resolve_vars("http://localhost:{api.port}") == "http://localhost:8123"
+    assert res.resolve_vars("{api.socket}") == "127.0.0.1:8123"
+    with pytest.raises(AttributeError):
+        res.resolve_vars("{ui.port}")
+
+
+def test_template_matches_str_format() -> None:
+    namespace = {
+        "a": SimpleNamespace(b=[1, 2], c={"d": "x"}),
+        "n": 3.14159,
+        "s": "str",
+        "w": 6,
+    }
+    for template in [
+        "plain",
+        "{{escaped}} {s}",
+        "{a.b[1]}-{a.c[d]}",
+        "{n:.2f} {s!r} {s:>5}",
+        "{s}{s}",
+        "{s:>{w}}",
+    ]:
+        assert compile_template(template).render(namespace) == template.format_map(
+            namespace
+        )
+    assert compile_template("{a.b[0]}/{s}").names == {"a", "s"}
+
+    with pytest.raises(KeyError):
+        compile_template("{missing}").render(namespace)
+
+
+def test_service_variables(dirs: Dirs, monkeypatch: pytest.MonkeyPatch) -> None:
+    services = [
+        ScriptServiceConfig(
+            name="api", exec="api", listen="{xdg_run}/api.sock", env={"TOKEN": "t"}
+        ),
+        ScriptServiceConfig(name="db", exec="db", listen="tcp://127.0.0.1:5432"),
+    ]
+    res = DirResolver({svc.name: dirs / svc.name for svc in services}, services)
+
+    assert res.resolve_vars("{api.socket}") == "/run/test/glue/testapp/api/api.sock"
+    assert res.resolve_vars("http://{db.socket}") == "http://127.0.0.1:5432"
+    assert res.resolve_vars("{db.port}") == "5432"
+    assert res.resolve_vars("{api.env[TOKEN]}") == "t"
+
+    # the environment is read every time
+    monkeypatch.setenv("GLUE_TEST_VAR", "one")
+    assert res.resolve_vars("{env[GLUE_TEST_VAR]}") == "one"
+    monkeypatch.setenv("GLUE_TEST_VAR", "two")
+    assert res.resolve_vars("{env[GLUE_TEST_VAR]}") == "two"
+
+
+def test_resolved_templates_are_cached(
+    dirs: Dirs, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    res = DirResolver({f"svc{i}": dirs / f"svc{i}" for i in range(500)})
+    template = "{svc499.xdg_run}/app.sock"
+    expected = res.resolve_vars(template)
+
+    rendered: list[str] = []
+    render = Template.render
+
+    def counting_render(self: Template, namespace: Mapping[str, Any]) -> str:
+        rendered.append(self.template)
+        return render(self, namespace)
+
+    monkeypatch.setattr(Template, "render", counting_render)
+    # resolving again is a lookup, whatever the number of services
+    for _ in range(100):
+        assert res.resolve_vars(template) == expected
+    assert rendered == []
+
+    # until the services change
+    res.update({"svc499": dirs / "other"})
+    assert res.resolve_vars(template) == "/run/test/glue/testapp/other/app.sock"
+    assert rendered == [template]
+
+
+@pytest.mark.benchmark
+def test_resolve_benchmark(dirs: Dirs, report: Callable[[str], None]) -> None:
+    for count in (2, 500):
+        res = DirResolver({f"svc{i}": dirs / f"svc{i}" for i in range(count)})
+        template = f"{{svc{count - 1}.xdg_run}}/app.sock"
+        start = time.perf_counter()
+        for _ in range(100_000):
+            res.resolve_vars(template)
+        elapsed = (time.perf_counter() - start) / 100_000
+        report(f"{elapsed * 1e9:.0f}ns per call with {count} services")
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from glue.config import (
+    Config,
+    LocalAddressServer,
+    PythonServiceConfig,
+    StaticServer,
+    UnixDomainSocketServer,
+    WarmupConfig,
+)
+from glue.pm import ServiceManager
+from glue.utils import DirResolver, Dirs, IPlatformDirs
+from glue.warmup import (
+    HotPaths,
+    HotPathTable,
+    hot_paths_path,
+    load_hot_paths,
+    servers_in_front_of,
+    warm_up,
+)
+from glue.web.warmup import HotPathRecorder
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from starlette.requests import Request
+
+
+def test_hot_paths_rank_and_bound() -> None:
+    paths = HotPaths(max_paths=4)
+    for _ in range(3):
+        for path in ["/a", "/a", "/a", "/b", "/b", "/c"]:
+            paths.add(path)
+    for i in range(20):
+        paths.add(f"/once/{i}")
+    assert paths.top(3) == ["/a", "/b", "/c"]
+    assert len(paths.counts) <= 8
+
+
+def test_hot_paths_age() -> None:
+    paths = HotPaths(max_paths=4)
+    for _ in range(50):
+        paths.add("/old")
+    for _ in range(100):
+        paths.add("/new")
+    assert paths.top(1) == ["/new"]
+
+
+async def page(request: Request) -> Response:
+    status = 404 if request.path_params["path"] == "missing" else 200
+    return Response(request.url.path, status_code=status)
+
+
+def test_recorder(tmp_path: Path) -> None:
+    table = HotPathTable(tmp_path / "hot-paths.json")
+    app = HotPathRecorder(
+        Starlette(routes=[Route("/{path}", page, methods=["GET", "POST"])]),
+        table.server("api.localhost", 10),
+        table,
+    )
+
+    async def requests() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            for _ in range(3):
+                await c.get("/home")
+            await c.get("/search?q=glue")
+            await c.get("/missing")
+            await c.post("/form")
+
+    asyncio.run(requests())
+    table.save()
+    hot = load_hot_paths(tmp_path / "hot-paths.json")
+    assert hot == {"api.localhost": ["/home", "/search?q=glue"]}
+
+    table.retain([])
+    table.save()
+    assert load_hot_paths(tmp_path / "hot-paths.json") == {}
+
+
+def test_servers_in_front_of() -> None:
+    warmup = WarmupConfig()
+    api = UnixDomainSocketServer(uds="{api.xdg_run}/sock", warmup=warmup)
+    config = Config(
+        default_server=LocalAddressServer(target="http://{api.socket}", warmup=warmup),
+        servers={
+            "api.localhost": api,
+            "cold.localhost": UnixDomainSocketServer(uds="{api.xdg_run}/sock"),
+            "ui.localhost": LocalAddressServer(target="http://{ui.socket}"),
+            "docs.localhost": StaticServer(root_path="docs"),
+        },
+    )
+    assert list(servers_in_front_of(config, "api")) == ["api.localhost", "default"]
+    assert servers_in_front_of(config, "ui") == {}
+
+
+def test_warm_up(tmp_path: Path) -> None:
+    seen: list[tuple[str, str | None]] = []
+
+    async def record(request: Request) -> Response:
+        seen.append((request.url.path, request.headers.get("x-forwarded-host")))
+        return Response("ok")
+
+    path = tmp_path / "api.sock"
+    server = uvicorn.Server(
+        uvicorn.Config(
+            Starlette(routes=[Route("/{path}", record)]),
+            uds=str(path),
+            log_config=None,
+            access_log=False,
+        )
+    )
+    config = UnixDomainSocketServer(
+        uds=str(path), warmup=WarmupConfig(concurrency=2, timeout=10)
+    )
+
+    # the service comes up while the warm-up waits for it
+    timer = threading.Timer(0.3, server.run)
+    timer.start()
+    paths = ["/a", "/b", "/c"]
+    result = asyncio.run(warm_up(config, "api.localhost", paths, DirResolver({})))
+    server.should_exit = True
+    timer.join()
+
+    assert (result.fetched, result.failed) == (3, 0)
+    assert result.elapsed >= 0.3
+    assert sorted(seen) == [(p, "api.localhost") for p in paths]
+
+
+def test_warm_up_times_out(tmp_path: Path) -> None:
+    config = UnixDomainSocketServer(
+        uds=str(tmp_path / "missing.sock"), warmup=WarmupConfig(timeout=0.2)
+    )
+    start = time.monotonic()
+    result = asyncio.run(warm_up(config, "default", ["/a"], DirResolver({})))
+    assert (result.fetched, result.failed) == (0, 1)
+    assert time.monotonic() - start < 5
+
+
+def test_warm_up_after_restart(tmp_path: Path, xdg_dirs: IPlatformDirs) -> None:
+    (tmp_path / "www").mkdir()
+    (tmp_path / "www" / "index.html").write_text("hello")
+    config = Config(
+        servers={
+            "www.localhost": LocalAddressServer(
+                target="http://127.0.0.1:{www.port}", warmup=WarmupConfig(paths=1)
+            )
+        },
+        services=[
+            PythonServiceConfig(
+                name="www",
+                cwd=str(tmp_path / "www"),
+                python=sys.executable,
+                module="http.server",
+                args=["--bind", "127.0.0.1", "{port}"],
+                allocate_port=True,
+            )
+        ],
+    )
+    dirs = Dirs("test", _dirs=xdg_dirs)
+    hot = hot_paths_path(dirs)
+    hot.parent.mkdir(parents=True, exist_ok=True)
+    hot.write_text(json.dumps({"www.localhost": ["/index.html", "/other"]}))
+
+    mgr = ServiceManager(dirs, config)
+    svc = mgr.services["www"]
+    try:
+        # the first start has nothing to warm up
+        svc.start()
+        svc.restart()
+        deadline = time.monotonic() + 20
+        while "Warmed up" not in svc.output.tail():
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        output = svc.output.tail()
+        assert "Warmed up www.localhost with 1 of 1 hot paths" in output
+        assert "GET /index.html" in output
+        assert "/other" not in output
+    finally:
+        mgr.shutdown()
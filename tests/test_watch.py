@@ -0,0 +1,125 @@
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from glue import watch
+from glue.config import WatchConfig
+from glue.watch import FileWatcher, WatchRule
+
+
+def noop() -> None:
+    pass
+
+
+@pytest.fixture
+def rule(tmp_path: Path) -> WatchRule:
+    config = WatchConfig(paths=["src"], include=["*.py"], ignore=["migrations"])
+    return WatchRule.from_config("api", tmp_path, config, noop)
+
+
+@pytest.mark.parametrize(
+    ("path", "matches"),
+    [
+        ("src/app.py", True),
+        ("src/pkg/models.py", True),
+        ("src/pkg/migrations/0001.py", False),
+        ("src/README.md", False),
+        ("tests/test_app.py", False),
+        ("src", True),
+    ],
+)
+def test_rule_matches(
+    tmp_path: Path, rule: WatchRule, path: str, *, matches: bool
+) -> None:
+    assert rule.matches(tmp_path / path) is matches
+
+
+def test_rule_without_globs(tmp_path: Path) -> None:
+    rule = WatchRule.from_config("api", tmp_path, WatchConfig(), noop)
+    assert rule.matches(tmp_path / "anything" / "at" / "all.txt")
+    assert not rule.matches(tmp_path.parent / "elsewhere.txt")
+
+
+def test_event_storm_restarts_once(tmp_path: Path) -> None:
+    restarted = threading.Event()
+    calls: list[str] = []
+
+    def restart(name: str) -> None:
+        calls.append(name)
+        restarted.set()
+
+    rules = [
+        WatchRule.from_config(
+            name,
+            tmp_path,
+            WatchConfig(paths=[name], debounce=0.05),
+            lambda n=name: restart(n),
+        )
+        for name in ("api", "ui")
+    ]
+    watcher = FileWatcher(rules)
+
+    for i in range(20):
+        watcher.dispatch([tmp_path / "api" / f"file{i}.py"])
+
+    assert restarted.wait(1)
+    watcher.stop()
+    assert calls == ["api"]
+
+
+def test_file_roots_watch_only_their_directory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    (tmp_path / "src").mkdir()
+    config = tmp_path / "servers.toml"
+    config.write_text("")
+    watched: list[tuple[set[Path], bool]] = []
+
+    def record(*paths: Path, recursive: bool, **kwargs: Any) -> list[Any]:
+        watched.append((set(paths), recursive))
+        kwargs["stop_event"].wait()
+        return []
+
+    monkeypatch.setattr(watch.watchfiles, "watch", record)
+    rules = [
+        WatchRule("config", [config], [], [], 0.2, noop),
+        WatchRule.from_config("api", tmp_path, WatchConfig(paths=["src"]), noop),
+    ]
+    watcher = FileWatcher(rules)
+    watcher.start()
+    watcher.stop()
+    assert sorted(watched, key=lambda w: w[1]) == [
+        ({tmp_path}, False),
+        ({tmp_path / "src"}, True),
+    ]
+
+
+def test_replaced_watcher_keeps_pending_restarts(tmp_path: Path) -> None:
+    restarted = threading.Event()
+    calls: list[str] = []
+
+    def restart(name: str) -> None:
+        calls.append(name)
+        restarted.set()
+
+    def rules() -> list[WatchRule]:
+        return [
+            WatchRule.from_config(
+                "api",
+                tmp_path,
+                WatchConfig(paths=["api"], debounce=0.1),
+                lambda: restart("api"),
+            )
+        ]
+
+    old = FileWatcher(rules())
+    old.dispatch([tmp_path / "api" / "app.py"])
+    new = FileWatcher(rules())
+    new.take_over(old)
+
+    assert restarted.wait(1)
+    new.stop()
+    assert calls == ["api"]
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import re
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from glue.config import Config, PythonServiceConfig, ZygoteConfig
+from glue.pm import ServiceInstance, ServiceManager
+from glue.utils import Dirs, IPlatformDirs
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from glue.pty import Process
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires fork")
+
+HEAVY = """
+import os
+IMPORTED_BY = os.getpid()
+"""
+
+BLUE_GREEN = """
+import os, socket, sys, time
+import heavy
+server = socket.socket(socket.AF_UNIX)
+server.bind(sys.argv[1])
+server.listen()
+print(f"service {os.getpid()} heavy {heavy.IMPORTED_BY}", flush=True)
+time.sleep(30)
+"""
+
+SERVICE = """
+import os, sys, time
+import heavy
+print(f"service {os.getpid()} heavy {heavy.IMPORTED_BY} tty {os.isatty(1)}")
+print("args", *sys.argv[1:], os.environ.get("GREETING"), flush=True)
+time.sleep(30)
+"""
+
+
+def wait_for(check: Callable[[], bool], timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def manager(
+    tmp_path: Path, xdg_dirs: IPlatformDirs, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[ServiceManager]:
+    (tmp_path / "heavy.py").write_text(HEAVY)
+    (tmp_path / "svc.py").write_text(SERVICE)
+    (tmp_path / "uv.lock").write_text("")
+    monkeypatch.setenv("GREETING", "hello")
+    config = Config(
+        services=[
+            PythonServiceConfig(
+                name="svc",
+                cwd=str(tmp_path),
+                python=sys.executable,
+                module="svc",
+                args=["{xdg_run}"],
+                zygote=ZygoteConfig(preload=["heavy"]),
+            )
+        ]
+    )
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    yield mgr
+    mgr.shutdown()
+
+
+@pytest.fixture
+def service(manager: ServiceManager) -> ServiceInstance:
+    svc = manager.services["svc"]
+    assert isinstance(svc, ServiceInstance)
+    return svc
+
+
+def run(svc: ServiceInstance) -> tuple[int, int, str]:
+    """Restart the service, and return its pid, the importer of heavy and args."""
+    # starting clears the output
+    svc.restart()
+    pattern = re.compile(r"service (\d+) heavy (\d+) tty True\r?\nargs (.*?)\r?\n")
+    wait_for(lambda: pattern.search(svc.output.tail()) is not None)
+    match = pattern.search(svc.output.tail())
+    assert match is not None
+    return int(match[1]), int(match[2]), match[3]
+
+
+def test_zygote(service: ServiceInstance, tmp_path: Path) -> None:
+    zygote = service.zygote
+    assert zygote is not None
+
+    # the first start is spawned as usual, while the zygote is started
+    pid, importer, args = run(service)
+    assert pid == importer
+    assert args == f"{service.dirs.runtime_dir} hello"
+    wait_for(lambda: zygote.ready)
+
+    # restarts are forked, with heavy already imported
+    first, importer, args = run(service)
+    assert first != importer
+    assert args == f"{service.dirs.runtime_dir} hello"
+    assert service.status == "running"
+    second, again, _ = run(service)
+    assert (second, again) != (first, importer)
+    assert again == importer
+
+    service.shutdown()
+    assert service.status == "stopped"
+
+    # a changed lockfile starts the zygote over
+    time.sleep(0.01)
+    (tmp_path / "uv.lock").write_text("changed")
+    assert not zygote.ready
+    pid, cold, _ = run(service)
+    assert pid == cold
+    wait_for(lambda: zygote.ready)
+    pid, rebuilt, _ = run(service)
+    assert rebuilt not in (pid, importer)
+
+
+def test_forks_close_their_pty(service: ServiceInstance) -> None:
+    zygote = service.zygote
+    assert zygote is not None
+    run(service)
+    wait_for(lambda: zygote.ready)
+    run(service)
+
+    fds = len(list(Path("/dev/fd").iterdir()))
+    for _ in range(20):
+        run(service)
+    assert len(list(Path("/dev/fd").iterdir())) <= fds + 2
+
+
+def test_zygote_rebuilds_in_background(
+    manager: ServiceManager, service: ServiceInstance, tmp_path: Path
+) -> None:
+    zygote = service.zygote
+    assert zygote is not None
+    manager.start_watcher()
+    run(service)
+    wait_for(lambda: zygote.ready)
+    _, importer, _ = run(service)
+
+    # started over once the lockfile changes, without waiting for a restart
+    (tmp_path / "uv.lock").write_text("changed")
+    wait_for(lambda: not zygote.ready)
+    wait_for(lambda: zygote.ready)
+    pid, rebuilt, _ = run(service)
+    assert rebuilt not in (pid, importer)
+
+
+def restarted(svc: ServiceInstance, old: Process) -> bool:
+    """Whether a blue-green restart switched slots and stopped the old process."""
+    return svc.process is not old and not svc._restart_lock.locked()  # noqa: SLF001
+
+
+def test_zygote_blue_green(tmp_path: Path, xdg_dirs: IPlatformDirs) -> None:
+    (tmp_path / "heavy.py").write_text(HEAVY)
+    (tmp_path / "svc.py").write_text(BLUE_GREEN)
+    config = Config(
+        services=[
+            PythonServiceConfig(
+                name="svc",
+                cwd=str(tmp_path),
+                python=sys.executable,
+                module="svc",
+                args=["{xdg_run}/svc.sock"],
+                blue_green=True,
+                zygote=ZygoteConfig(preload=["heavy"]),
+            )
+        ]
+    )
+    mgr = ServiceManager(Dirs("test", _dirs=xdg_dirs), config)
+    svc = mgr.services["svc"]
+    assert isinstance(svc, ServiceInstance)
+    zygote = svc.zygote
+    assert zygote is not None
+    try:
+        svc.start()
+        wait_for(lambda: zygote.ready)
+
+        # every slot is reset on the way, which leaves the zygote alone
+        for _ in range(3):
+            old = svc.process
+            assert old is not None
+            svc.restart()
+            wait_for(lambda old=old: restarted(svc, old))  # type: ignore[misc]
+            assert not old.is_running()
+            assert svc.process is not None
+            pid = svc.process.pid
+            pattern = re.compile(rf"service {pid} heavy (\d+)")
+            wait_for(lambda p=pattern: p.search(svc.output.tail()) is not None)  # type: ignore[misc]
+            match = pattern.search(svc.output.tail())
+            assert match is not None
+            assert int(match[1]) != pid
+    finally:
+        mgr.shutdown()